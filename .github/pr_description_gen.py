@@ -1,36 +1,44 @@
 import os
 import subprocess
-import requests
-import json
-from dotenv import load_dotenv
-
-# Load variables from .env
-load_dotenv()
+import sys
+
+# Make the shared aicommit helpers importable when this runs as a standalone script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aicommit"))
+from src.cache import cached_call
+from src.chunking import fit_diff_to_budget, map_reduce
+from src.config import get_api_key
+from src.diffs import Diff, load_diff
+from src.llm_client import LLMError
+from src.router import cache_label, complete
+from src.streaming import STREAMING_ENABLED
+from src.summaries import FILE_SUMMARY_TOKENS, summarize_file
 
 # --- CONFIG ---
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-AZURE_API_ENDPOINT = (
-    "https://shrutiaiinstance.openai.azure.com/openai/deployments/gpt-4o-mini/chat/completions?api-version=2025-01-01-preview"
-)
-
-HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": OPENAI_API_KEY
-}
+# The OpenAI API key is read from the environment or .env file on first use (see src.config)
+# Bump when the prompt changes so cached responses are not reused
+PR_DESCRIPTION_PROMPT_VERSION = "1"
+SUMMARY_UPDATE_PROMPT_VERSION = "1"
+MERGE_DESCRIPTION_PROMPT_VERSION = "1"
+PR_DESCRIPTION_PATH = ".github/PR_description.md"
 
 def get_latest_commit_diff():
-    """Get file-level changes from the latest commit."""
+    """Get the parsed file-level changes from the latest commit."""
     try:
-        diff = subprocess.check_output(
-            ["git", "show", "HEAD", "--name-status", "--no-color"]
-        ).decode("utf-8")
-        return diff.strip()
+        # `git show` also works on the shallow single-commit checkout used in CI
+        return load_diff(("HEAD",), command="show")
     except subprocess.CalledProcessError as e:
         print("Error fetching latest commit diff:", e)
-        return ""
-
-def generate_pr_description(diff_text):
-    """Generate structured PR description using Azure OpenAI."""
+        return Diff(("HEAD",), [])
+
+def generate_pr_description(diff, output_path=None, file_summaries=None):
+    """
+    Generate structured PR description from a parsed Diff using Azure OpenAI.
+    When output_path is given, the description is written there as tokens stream in.
+    file_summaries (path -> summary), when given, are listed under each changed file.
+    """
+    diff_text = diff.name_status()
+    if file_summaries:
+        diff_text += "\n\nPer-file summaries:\n" + format_file_summaries(file_summaries)
     prompt = f"""
 You are an expert AI assistant that writes professional and structured GitHub Pull Request descriptions.
 
@@ -65,32 +73,128 @@ Git Diff to Analyze:
 Now write the PR description following the structure above.
 """
 
-    payload = {
-        "messages": [
-            {"role": "system", "content": "You are a helpful assistant that writes GitHub PR descriptions."},
-            {"role": "user", "content": prompt}
-        ],
+    params = {
         "temperature": 0.7,
         "top_p": 1,
         "frequency_penalty": 0,
         "presence_penalty": 0,
         "max_tokens": 500
     }
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant that writes GitHub PR descriptions."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def request_description():
+        try:
+            return complete("pr_description", messages, stream=STREAMING_ENABLED, output_path=output_path, **params)
+        except LLMError as e:
+            print("Error from Azure OpenAI API:", e)
+            return ""
+
+    # Reuse the previous response when the same diff was already described
+    return cached_call(request_description, diff_text, PR_DESCRIPTION_PROMPT_VERSION, cache_label("pr_description"), params)
+
+def format_file_summaries(file_summaries):
+    """Render path -> summary pairs as a markdown list for a prompt."""
+    return "\n".join(f"- {path}: {summary}" for path, summary in sorted(file_summaries.items()))
+
+def summarize_file_change(file_diff, previous_summary=""):
+    """
+    Summarize what changed in one file in one or two sentences.
+    With previous_summary, file_diff only holds the newer changes and the summary is updated
+    instead of written from scratch, so the cost follows the size of the new changes.
+    """
+    if not previous_summary:
+        # Stored by blob SHAs and shared with the commit and impact report stages
+        return summarize_file(file_diff)
+
+    # Very large files are summarized chunk by chunk first
+    file_text = fit_diff_to_budget(file_diff.text, max_tokens=FILE_SUMMARY_TOKENS)
+    prompt = f"""
+Earlier summary of the changes to `{file_diff.path}` in this pull request:
+{previous_summary}
+
+The file has since been changed again as shown below. Reply with the updated summary of all
+changes to this file (one or two sentences, no markdown headers).
+
+New Git Diff:
+{file_text}
+"""
+    params = {"temperature": 0.2, "max_tokens": 150}
+    messages = [
+        {"role": "system", "content": "You summarize code diffs precisely and briefly."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def request_summary():
+        try:
+            return complete("file_summary", messages, **params)
+        except LLMError as e:
+            print("Error from Azure OpenAI API (file summary):", e)
+            return previous_summary
+
+    return cached_call(request_summary, prompt, SUMMARY_UPDATE_PROMPT_VERSION, cache_label("file_summary"), params)
+
+def summarize_file_changes(file_diffs, previous_summaries=None):
+    """
+    Summarize several files concurrently.
+    Args:
+        file_diffs (iterable): FileDiff objects to summarize.
+        previous_summaries (dict): Optional path -> earlier summary, updated with the new changes.
+    Returns:
+        dict: path -> summary.
+    """
+    previous_summaries = previous_summaries or {}
+    file_diffs = list(file_diffs)
+
+    def summarize(file_diff):
+        previous = previous_summaries.get(file_diff.path) or previous_summaries.get(file_diff.old_path, "")
+        return file_diff.path, summarize_file_change(file_diff, previous)
+
+    return map_reduce(file_diffs, summarize, dict)
+
+def merge_pr_description(description, changed_summaries, removed_paths=()):
+    """
+    Update an existing PR description with the files that changed since it was written.
+    Only the description and the summaries of the changed files are sent, so the prompt size
+    follows the size of the new changes rather than the size of the whole PR.
+    """
+    removed = "\n".join(f"- {path}" for path in sorted(removed_paths)) or "(none)"
+    prompt = f"""
+Below is the current description of a GitHub pull request, followed by summaries of files that
+changed since it was written and files that are no longer part of the pull request.
+
+Update the description so it reflects these changes. Keep its structure, headings and any
+wording that is still accurate; only add, edit or remove what the changes require. Reply with
+the full updated description in markdown and nothing else.
+
+Current description:
+{description}
+
+Changed files:
+{format_file_summaries(changed_summaries) or "(none)"}
+
+Files no longer in the pull request:
+{removed}
+"""
+    params = {"temperature": 0.3, "max_tokens": 800}
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant that writes GitHub PR descriptions."},
+        {"role": "user", "content": prompt}
+    ]
 
-    response = requests.post(
-        AZURE_API_ENDPOINT,
-        headers=HEADERS,
-        data=json.dumps(payload)
-    )
+    def request_description():
+        try:
+            return complete("pr_description", messages, **params)
+        except LLMError as e:
+            print("Error from Azure OpenAI API:", e)
+            return ""
 
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"].strip()
-    else:
-        print("Error from Azure OpenAI API:", response.status_code, response.text)
-        return ""
+    return cached_call(request_description, prompt, MERGE_DESCRIPTION_PROMPT_VERSION, cache_label("pr_description"), params)
 
 def generate_description():
-    if not OPENAI_API_KEY:
+    if not get_api_key():
         print("❌ AZURE_API_KEY not found in environment or .env file.")
         exit(1)
 
@@ -102,13 +206,13 @@ def generate_description():
         exit(0)
 
     print("🤖 Generating PR description using GPT-4o-mini...")
-    description = generate_pr_description(diff)
+    description = generate_pr_description(diff, PR_DESCRIPTION_PATH)
     # print("\n--- 📝 Generated PR Description ---\n")
     # print(description)
 
     # ✅ Save to .github/PR_description.md
     os.makedirs(".github", exist_ok=True)
-    with open(".github/PR_description.md", "w", encoding="utf-8") as f:
+    with open(PR_DESCRIPTION_PATH, "w", encoding="utf-8") as f:
         f.write(description)
 
     print("\n💾 PR description saved to .github/PR_description.md")
\ No newline at end of file
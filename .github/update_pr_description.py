@@ -1,27 +1,132 @@
 # update_pr_description.py
+import base64
+import json
 import os
+import re
+import sys
+import zlib
 import requests
-from pr_description_gen import get_latest_commit_diff
+
+# Make the shared aicommit helpers importable when this runs as a standalone script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aicommit"))
+from pr_description_gen import generate_pr_description, merge_pr_description, summarize_file_changes
+from src.diffs import parse_diff
+from src.ratelimit import BACKGROUND, set_default_priority
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 PR_NUMBER = os.getenv("PR_NUMBER")
 REPO = os.getenv("GITHUB_REPOSITORY")  # user/repo
+# Set AICOMMIT_FULL_PR_DESCRIPTION=1 to always regenerate the description from the whole PR diff
+FULL_REGENERATION = os.getenv("AICOMMIT_FULL_PR_DESCRIPTION", "").lower() in ("1", "true", "yes")
+
+# Hidden marker at the end of the PR body holding the last analyzed head SHA and per-file summaries
+STATE_MARKER = re.compile(r"\n*<!-- aicommit-state:([A-Za-z0-9+/=]+) -->\s*$")
+# PR bodies are limited to 65536 characters; above this the per-file summaries are not stored
+MAX_STATE_CHARS = 20000
+
+def github_headers(accept="application/vnd.github.v3+json"):
+    return {"Authorization": f"token {GITHUB_TOKEN}", "Accept": accept}
 
 def get_pr_diff(pr_number, repo):
     url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}"
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3.diff"
-    }
+    headers = github_headers("application/vnd.github.v3.diff")
     response = requests.get(url, headers=headers)
     return response.text if response.status_code == 200 else None
 
+def get_pull_request(pr_number, repo):
+    """Return the pull request JSON (body, head SHA, ...) or None."""
+    url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}"
+    response = requests.get(url, headers=github_headers())
+    return response.json() if response.status_code == 200 else None
+
+def get_pr_files(pr_number, repo):
+    """Return the set of paths currently changed by the pull request."""
+    paths = set()
+    page = 1
+    while True:
+        url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}/files"
+        response = requests.get(url, headers=github_headers(), params={"per_page": 100, "page": page})
+        if response.status_code != 200:
+            return None
+        files = response.json()
+        paths.update(file["filename"] for file in files)
+        if len(files) < 100:
+            return paths
+        page += 1
+
+def get_diff_since(repo, base_sha, head_sha):
+    """
+    Return the diff text between the last analyzed head and the current head, or None when
+    the old head is no longer an ancestor (e.g. after a force push) and a full pass is needed.
+    """
+    url = f"https://api.github.com/repos/{repo}/compare/{base_sha}...{head_sha}"
+    response = requests.get(url, headers=github_headers())
+    if response.status_code != 200 or response.json().get("status") != "ahead":
+        return None
+    response = requests.get(url, headers=github_headers("application/vnd.github.v3.diff"))
+    return response.text if response.status_code == 200 else None
+
+def read_state(body):
+    """Split a PR body into (visible description, state dict or None)."""
+    match = STATE_MARKER.search(body or "")
+    if not match:
+        return body or "", None
+    try:
+        state = json.loads(zlib.decompress(base64.b64decode(match.group(1))).decode("utf-8"))
+    except (ValueError, zlib.error):
+        state = None
+    return body[:match.start()], state
+
+def write_state(description, state):
+    """Append the hidden state marker to a description."""
+    encoded = base64.b64encode(zlib.compress(json.dumps(state, sort_keys=True).encode("utf-8"))).decode("ascii")
+    if len(encoded) > MAX_STATE_CHARS:
+        # Keep the head SHA so the next push is still incremental, just without earlier summaries
+        state = {"head": state["head"], "files": {}}
+        encoded = base64.b64encode(zlib.compress(json.dumps(state).encode("utf-8"))).decode("ascii")
+    return f"{description.rstrip()}\n\n<!-- aicommit-state:{encoded} -->"
+
+def describe_full(pr_number, repo):
+    """Summarize every file of the PR and write the description from scratch."""
+    diff_text = get_pr_diff(pr_number, repo)
+    if not diff_text:
+        return None, None
+    diff = parse_diff(diff_text)
+    print(f"🧾 Full analysis of {len(diff)} file(s)...")
+    summaries = summarize_file_changes(diff)
+    return generate_pr_description(diff, file_summaries=summaries), summaries
+
+def describe_incremental(pr_number, repo, description, state, head_sha):
+    """
+    Summarize only the files changed since the last analyzed head and merge them into the
+    existing description. Returns (None, None) when a full pass is needed instead.
+    """
+    delta_text = get_diff_since(repo, state["head"], head_sha)
+    pr_files = get_pr_files(pr_number, repo)
+    if delta_text is None or pr_files is None:
+        return None, None
+
+    summaries = dict(state.get("files", {}))
+    # Changes merged in from the base branch show up in the delta but are not part of the PR
+    changed = [file_diff for file_diff in parse_diff(delta_text) if file_diff.path in pr_files]
+    removed = [path for path in summaries if path not in pr_files]
+    print(f"🔁 Incremental update since {state['head'][:7]}: "
+          f"{len(changed)} changed and {len(removed)} removed of {len(pr_files)} file(s)")
+    if not changed and not removed:
+        return description, summaries
+
+    changed_summaries = summarize_file_changes(changed, summaries)
+    for path in removed:
+        del summaries[path]
+    for file_diff in changed:
+        if file_diff.old_path != file_diff.path:
+            summaries.pop(file_diff.old_path, None)
+    summaries.update(changed_summaries)
+    return merge_pr_description(description, changed_summaries, removed), summaries
+
 def update_pr_description(pr_number, repo, new_description):
     url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}"
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+    headers = github_headers()
     payload = {
         "body": new_description
     }
@@ -42,22 +147,39 @@ if __name__ == "__main__":
         print("GITHUB_REPOSITORY:", REPO)
         exit(1)
 
-    diff = get_pr_diff(PR_NUMBER, REPO)
-    if diff:
-        description = get_latest_commit_diff(diff)
+    # Many PRs are described at once; developers' interactive aicommit runs get the shared budget first
+    set_default_priority(BACKGROUND)
+    pull_request = get_pull_request(PR_NUMBER, REPO)
+    if not pull_request:
+        print("❌ Could not retrieve the pull request.")
+        exit(1)
+    head_sha = pull_request["head"]["sha"]
+    current_description, state = read_state(pull_request.get("body"))
+
+    if state and state.get("head") == head_sha and not FULL_REGENERATION:
+        # e.g. the `edited` event fired by a manual edit: nothing new to analyze
+        print(f"✅ PR description already covers {head_sha[:7]}.")
+        exit(0)
 
-        if not description.strip():
-            print("❌ Generated description is empty.")
+    description = summaries = None
+    if state and state.get("head") and current_description.strip() and not FULL_REGENERATION:
+        description, summaries = describe_incremental(PR_NUMBER, REPO, current_description, state, head_sha)
+    if description is None:
+        description, summaries = describe_full(PR_NUMBER, REPO)
+        if description is None:
+            print("❌ Could not retrieve PR diff.")
             exit(1)
 
-        success = update_pr_description(PR_NUMBER, REPO, description)
-        if success:
-            print("✅ PR description updated successfully.")
-        else:
-            print("❌ Failed to update PR description.")
-            print("🔍 Debug Info:")
-            print("PR_NUMBER:", PR_NUMBER)
-            print("REPO:", REPO)
-            print("DESCRIPTION:", description)
+    if not description.strip():
+        print("❌ Generated description is empty.")
+        exit(1)
+
+    success = update_pr_description(PR_NUMBER, REPO, write_state(description, {"head": head_sha, "files": summaries}))
+    if success:
+        print("✅ PR description updated successfully.")
     else:
-        print("❌ Could not retrieve PR diff.")
+        print("❌ Failed to update PR description.")
+        print("🔍 Debug Info:")
+        print("PR_NUMBER:", PR_NUMBER)
+        print("REPO:", REPO)
+        print("DESCRIPTION:", description)
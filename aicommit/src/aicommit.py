@@ -1,124 +1,360 @@
+import argparse
 import subprocess
-from .commit_impact_report import impact_report
-from .pr_description_gen import generate_description
-from .utils import generate_commit_messages, get_diff
-from dotenv import load_dotenv
-import os
+from . import ratelimit, telemetry
+from .config import get_api_key
 
-# Load environment variables from .env file
-load_dotenv()
-OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+# The report, diff and model modules are imported inside the functions that need them so
+# a run with nothing staged returns without loading them (see benchmarks/startup.py)
+
+
+def has_staged_changes():
+    """Return True if the index differs from HEAD (a single, cheap git call)."""
+    result = subprocess.run(["git", "diff", "--cached", "--quiet"], capture_output=True)
+    # Exit code 1 means differences; anything else (0, or an error outside a repo) means none
+    return result.returncode == 1
 
 
 def check_for_merge_conflicts():
     """
-    Check for merge conflicts by comparing staged changes with the remote branch.
+    Check the index for unresolved merge conflicts (a merge or rebase in progress).
+    Conflicts with the remote are predicted separately, in the background (see conflicts).
     Returns:
         bool: True if conflicts exist, False otherwise.
         list: List of files with conflicts if any.
     """
-    print("Checking for merge conflicts...")
+    from .conflicts import unmerged_files
 
-    try:
-        # Fetch the latest changes from the remote repository.
-        subprocess.run(["git", "fetch"], check=True)
-        
-        # Get a list of files with merge conflicts via git diff.
-        result = subprocess.run(
-            ["git", "diff", "--name-only", "--diff-filter=U"],
-            capture_output=True, text=True, check=True
-        )
-
-        # Process the output by splitting lines and remove empties
-        conflicting_files = [file.strip() for file in result.stdout.split("\n") if file.strip()]
-
-        if conflicting_files:
-            # If there are conflicts, display them to the user.
-            print("Merge conflicts detected in the following files:")
-            for file in conflicting_files:
-                print(f"- {file}")
-            
-            # Auto resolve conflicts by pulling the latest changes.
-            print("\nAttempting to resolve conflicts by pulling the latest changes...")
-            subprocess.run(["git", "pull", "origin", "master"], check=True)
-            print("Merge conflicts resolved. Proceeding with commit generation.")
-            
-            return True, conflicting_files  # Return conflict status along with files involved.
+    conflicting_files = unmerged_files()
+    if conflicting_files:
+        # If there are conflicts, display them to the user.
+        print("Merge conflicts detected in the following files:")
+        for file in conflicting_files:
+            print(f"- {file}")
+        return True, conflicting_files
+    return False, []
+
+
+def generate_reports(speculation=None):
+    """
+    Generate the PR description and the impact report after a commit.
+    The two LLM requests are independent, so they are sent at the same time; the backend
+    module list is computed locally. Results that were generated speculatively from the
+    same diff before the commit are used instead of new requests.
+    """
+    from .commit_impact_report import (
+        IMPACT_REPORT_PATH,
+        extract_backend_modules,
+        generate_full_impact_report,
+        get_commit_diff,
+        save_impact_report,
+    )
+    from .impact import analyze_impact
+    from .pipeline import run_concurrently
+    from .pr_description_gen import (
+        PR_DESCRIPTION_PATH,
+        generate_pr_description,
+        get_branch_diff_against_master,
+        save_pr_description,
+    )
+
+    if not get_api_key():
+        print("❌ OPENAI_API_KEY not found in environment or .env file.")
+        return
+
+    print("🔍 Fetching branch and commit diffs...")
+    branch_diff = get_branch_diff_against_master()
+    commit_diff = get_commit_diff()
+
+    tasks = {}
+    if branch_diff:
+        tasks["PR description"] = lambda: generate_pr_description(branch_diff, PR_DESCRIPTION_PATH)
+    else:
+        print("⚠️ No changes found against master, skipping PR description.")
+    if commit_diff:
+        tasks["Impact report"] = lambda: generate_full_impact_report(commit_diff, IMPACT_REPORT_PATH)
+    else:
+        print("⚠️ No changes detected, skipping impact report.")
+
+    if speculation:
+        diffs = {"PR description": branch_diff, "Impact report": commit_diff}
+        for name in tasks:
+            tasks[name] = speculation.adopt(name, diffs[name], tasks[name]) or tasks[name]
+
+    print("🤖 Generating PR description and impact report...")
+    # Commit message requests from other aicommit runs on this host go first (see ratelimit)
+    with ratelimit.priority(ratelimit.BACKGROUND):
+        results = run_concurrently(tasks)
+    if speculation:
+        speculation.finish()
+
+    # Writes the files and the local store; the Google Sheets append is queued for a background process
+    with telemetry.span("save_reports"):
+        if "PR description" in results:
+            save_pr_description(results["PR description"] or "")
+        if "Impact report" in results:
+            save_impact_report(results["Impact report"] or "", extract_backend_modules(commit_diff),
+                               analyze_impact(commit_diff))
+
+
+def run_batch_command(args):
+    """Run `aicommit batch` with the parsed command-line arguments."""
+    from .batch import read_targets, run_batch
+    from .pipeline import MAX_CONCURRENT_REQUESTS
+
+    # Nobody is waiting on a batch; interactive runs sharing the deployment go first
+    ratelimit.set_default_priority(ratelimit.BACKGROUND)
+
+    api_key = get_api_key()
+    if not api_key:
+        print("❌ OPENAI_API_KEY not found in environment or .env file.")
+        return
+    targets = read_targets(args.targets, args.targets_file)
+    if not targets:
+        print("No targets given. Pass repositories (REPO or REPO::RANGE) or --targets-file.")
+        return
+    run_batch(
+        api_key, targets, output_path=args.output, jobs=args.jobs or MAX_CONCURRENT_REQUESTS,
+        diff_workers=args.diff_workers, with_impact=args.impact,
+    )
+
+
+def run_stats_command(args):
+    """Run `aicommit stats` with the parsed command-line arguments."""
+    from . import report_store
+
+    connection = report_store.connect_report_store()
+    if connection is None:
+        print("❌ Not inside a git repository.")
+        return
+    if args.reindex:
+        report_store.reindex_modules(connection)
+    window = {"since": args.since, "until": args.until}
+
+    if args.by:
+        rows = report_store.commits_per_period(connection, args.by, module=args.module, **window)
+        title = f"Commits per {args.by}" + (f" touching {args.module}" if args.module else "")
+        lines = [f"{period}  {count}" for period, count in rows]
+    elif args.module:
+        rows = report_store.commits_for_module(connection, args.module, limit=args.top, **window)
+        title = f"Commits touching {args.module}"
+        lines = [f"{date}  {username}  {message.splitlines()[0] if message else ''}" for date, username, message in rows]
+    elif args.author:
+        rows = report_store.modules_for_author(connection, args.author, limit=args.top, **window)
+        title = f"Modules changed by {args.author}"
+        lines = [f"{count:>5}  {module}" for module, count in rows]
+    else:
+        rows = report_store.top_modules(connection, limit=args.top, **window)
+        title = f"Top {args.top} modules by commits"
+        lines = [f"{count:>5}  {module}  (last {last_date})" for module, count, last_date in rows]
+    connection.close()
+
+    print(f"📊 {title}:")
+    print("\n".join(lines) if lines else "No matching rows.")
+
+
+def run_daemon_command(args):
+    """Run `aicommit daemon start|stop|status|run`."""
+    from . import daemon
+
+    if args.action == "run":
+        daemon.run_daemon()
+    elif args.action == "start":
+        if daemon.start_daemon():
+            print("🚀 Daemon running.")
         else:
-            print("No conflicts detected.")
-            return False, []  # No conflicts found.
-    except subprocess.CalledProcessError as e:
-        # If any subprocess command fails, log the error.
-        print(f"Error during conflict check: {e}")
-        return False, []  # In case of error, assume no conflicts.
+            print("❌ Daemon did not start; see .git/aicommit/daemon.log")
+    elif args.action == "stop":
+        print("👋 Daemon stopped." if daemon.send_request("stop", timeout=2) else "No daemon running.")
+    else:
+        status = daemon.send_request("status", timeout=2)
+        if not status:
+            print("No daemon running.")
+            return
+        print(f"Daemon {status['pid']} up {status['uptime']}s; staged files: {status['files']}, "
+              f"~{status['tokens']} tokens, candidates ready: {'yes' if status['prefetched'] else 'no'}")
 
 
 def main():
     """
     Main function to generate and commit a git commit message.
     """
-    # Check for conflicts and attempt to resolve if necessary.
+    parser = argparse.ArgumentParser(prog="aicommit", description="AI-powered git commit message generator")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model instead of reusing cached responses")
+    parser.add_argument("--strategy", choices=["sample", "json", "draft"],
+                        help="How candidates are generated (default: AICOMMIT_CANDIDATE_STRATEGY or sample)")
+    parser.add_argument("--compaction", choices=["off", "balanced", "minimal"],
+                        help="How much the diff is compacted before prompting (default: AICOMMIT_COMPACTION or balanced)")
+    parser.add_argument("--profile", action="store_true", help="Print a per-stage latency breakdown at the end")
+    parser.add_argument("--trace", metavar="FILE", help="Write the stage timings as a Chrome trace (JSON)")
+    parser.add_argument("--metrics", metavar="FILE", help="Write token, retry, cache and timing counters (OpenMetrics)")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="Non-interactively generate messages for many commits")
+    batch_parser.add_argument("targets", nargs="*", help="REPO or REPO::RANGE (default range: HEAD)")
+    batch_parser.add_argument("--targets-file", help="File with one target per line")
+    batch_parser.add_argument("--output", default="aicommit-batch.jsonl", help="JSONL results file, also used to resume")
+    batch_parser.add_argument("--jobs", type=int, help="Commits with LLM requests in flight (default: AICOMMIT_MAX_CONCURRENCY)")
+    batch_parser.add_argument("--diff-workers", type=int, help="Diff extraction processes (default: CPU count)")
+    batch_parser.add_argument("--impact", action="store_true", help="Also extract impacted backend modules")
+    export_parser = subparsers.add_parser("export-report", help="Export the local impact report store to XLSX")
+    export_parser.add_argument("--output", default=".github/PR_Report.xlsx", help="XLSX file to write")
+    stats_parser = subparsers.add_parser("stats", help="Query the local impact report history")
+    stats_parser.add_argument("--module", help="List the commits that touched this module")
+    stats_parser.add_argument("--author", help="List the modules changed by this GitHub username")
+    stats_parser.add_argument("--by", choices=["day", "week", "month", "year"], help="Count commits per period")
+    stats_parser.add_argument("--since", help="Only rows on or after this date (YYYY-MM-DD)")
+    stats_parser.add_argument("--until", help="Only rows on or before this date (YYYY-MM-DD)")
+    stats_parser.add_argument("--top", type=int, default=10, help="Number of rows to show (default: 10)")
+    stats_parser.add_argument("--reindex", action="store_true", help="Rebuild the module vocabulary first")
+    daemon_parser = subparsers.add_parser("daemon", help="Keep a warm background process for this repository")
+    daemon_parser.add_argument("action", choices=["start", "stop", "status", "run"],
+                               help="run keeps the daemon in the foreground")
+    args = parser.parse_args()
+    if args.no_cache:
+        from .cache import disable_cache
+        disable_cache()
+
+    if args.compaction:
+        from .compaction import set_compaction_mode
+        set_compaction_mode(args.compaction)
+
+    # Only this process records; the daemon and the detached Sheets flusher are left alone
+    if args.profile or args.trace or args.metrics or telemetry.OTLP_ENDPOINT:
+        telemetry.enable()
+    try:
+        with telemetry.span("aicommit", command=args.command or "commit"):
+            run_command(args)
+    finally:
+        telemetry.finish(args.trace, args.metrics, args.profile)
+
+
+def run_command(args):
+    """Run the subcommand, or the interactive commit flow when none was given."""
+    if args.command == "batch":
+        run_batch_command(args)
+        return
+    if args.command == "stats":
+        run_stats_command(args)
+        return
+    if args.command == "daemon":
+        run_daemon_command(args)
+        return
+    if args.command == "export-report":
+        from .report_store import export_report_xlsx
+        count = export_report_xlsx(args.output)
+        print(f"💾 Exported {count} row(s) to `{args.output}`")
+        return
+    run_commit_command(args)
+
+
+def run_commit_command(args):
+    """Generate commit messages for the staged changes, commit the chosen one and write the reports."""
+    if not has_staged_changes():
+        # Nothing to describe: return before the network fetch and the heavier imports
+        print("No staged changes found. Make sure there are changes and run `git add .`")
+        return
+
+    from .conflicts import ConflictCheck
+    from .diffs import clear_loaded_diffs
+
+    # Unresolved conflicts in the index would make `git commit` fail; this check is local and cheap
     conflicts, conflicting_files = check_for_merge_conflicts()
-    
+
     if conflicts:
-        # If conflicts still exist after auto-resolving, exit the function.
         print("Please resolve the conflicts before proceeding with the commit.")
         return
-    
-    # Retrieve the git diff (all staged changes)
-    diff = get_diff(diff_per_file=False)
-    
-    if not diff:
-        # Ensure there is a diff. If not, instruct the user to stage changes.
-        print("No staged changes found. Make sure there are changes and run `git add .`")
-        return
+
+    # Fetching and predicting conflicts with the remote runs alongside diff parsing and generation
+    conflict_check = ConflictCheck()
 
     # Define the commit language (currently set to English)
     commit_language = "en"
 
-    # Generate commit message suggestions using the provided OpenAI API key.
-    choices = generate_commit_messages(OPENAI_KEY, diff, commit_language)
+    # A running daemon (`aicommit daemon start`) has the diff parsed and usually the candidates
+    # generated already; without one, if it fails, when --no-cache asks for fresh candidates, or
+    # when the settings (environment, .env, --compaction) differ from the daemon's, everything
+    # happens here
+    choices = None
+    if not args.no_cache:
+        from .daemon import daemon_candidates
+        with telemetry.span("daemon_candidates"):
+            choices = daemon_candidates(args.strategy, commit_language)
+
+    if choices is None:
+        from .diffs import load_diff
+        from .filters import filter_diff
+        from .utils import generate_commit_messages
+
+        # Retrieve and parse the git diff (all staged changes), dropping lockfiles,
+        # generated and binary content before it reaches the prompt
+        diff, _ = filter_diff(load_diff(("--cached",)))
+
+        if not diff:
+            # Ensure there is a diff. If not, instruct the user to stage changes.
+            print("No staged changes found. Make sure there are changes and run `git add .`")
+            return
+
+        # Generate commit message suggestions using the provided OpenAI API key.
+        choices = generate_commit_messages(get_api_key(), diff, commit_language, strategy=args.strategy)
 
     if len(choices) == 0:
         # If no commit messages were generated, notify the user.
         print("No commit message generated.")
         return
 
+    conflict_check.report()
+
     # Display the generated commit messages
     print("\nGenerated Commit Messages:")
     for idx, msg in enumerate(choices, 1):
         print(f"{idx}. {msg}")
 
-    # Get the user's choice for the commit message.
+    # Start the PR description and impact report from the staged diff while the user chooses;
+    # they are used if the commit goes ahead and discarded otherwise
+    from .speculation import start_speculation
+    speculation = start_speculation()
     try:
-        commit_choice = int(input("\nSelect a commit message (enter number): ")) - 1
-    except ValueError:
-        # Handle non-integer input from the user.
-        print("Invalid input. Please enter a valid number.")
-        return
+        # Get the user's choice for the commit message.
+        try:
+            with telemetry.span("user_prompt"):
+                commit_choice = int(input("\nSelect a commit message (enter number): ")) - 1
+        except ValueError:
+            # Handle non-integer input from the user.
+            print("Invalid input. Please enter a valid number.")
+            return
 
-    if commit_choice < 0 or commit_choice >= len(choices):
-        # Validate the selected choice for range.
-        print("Invalid choice")
-        return
+        if commit_choice < 0 or commit_choice >= len(choices):
+            # Validate the selected choice for range.
+            print("Invalid choice")
+            return
 
-    # Retrieve the selected commit message based on user input.
-    selected_message = choices[commit_choice]
-    print(f"\nSelected Commit Message:\n{selected_message}")
-
-    # Ask the user for confirmation to use the selected commit message.
-    confirmation = input("\nWould you like to use this commit message? (y/n): ").lower()
-    if confirmation == 'y':
-        # Commit changes using the selected commit message.
-        subprocess.run(["git", "commit", "-m", selected_message])
-        print("Changes committed!")
-        print('---------------------------------------------------------------------')
-        print("Generating PR description and impact report...")
-        # Generate the PR description.
-        generate_description()
-        # Generate the impact report.
-        impact_report()
+        # Retrieve the selected commit message based on user input.
+        selected_message = choices[commit_choice]
+        print(f"\nSelected Commit Message:\n{selected_message}")
 
-    else:
-        # If the user cancels, print a cancellation message.
-        print("Commit message was not used.")
+        # Ask the user for confirmation to use the selected commit message.
+        with telemetry.span("user_prompt"):
+            confirmation = input("\nWould you like to use this commit message? (y/n): ").lower()
+        if confirmation == 'y':
+            # Commit changes using the selected commit message.
+            with telemetry.span("git_commit"):
+                committed = subprocess.run(["git", "commit", "-m", selected_message]).returncode == 0
+            if not committed:
+                # e.g. rejected by a hook; the speculative reports are discarded
+                print("❌ git commit failed.")
+                return
+            # HEAD moved, so diffs against it must be read again
+            clear_loaded_diffs()
+            print("Changes committed!")
+            print('---------------------------------------------------------------------')
+            print("Generating PR description and impact report...")
+            # Generate the PR description and the impact report concurrently.
+            with telemetry.span("reports"):
+                generate_reports(speculation)
+
+        else:
+            # If the user cancels, print a cancellation message.
+            print("Commit message was not used.")
+    finally:
+        if speculation:
+            # Records anything not adopted (cancelled, or a different diff) as wasted
+            speculation.finish()
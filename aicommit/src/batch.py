@@ -0,0 +1,224 @@
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from .diffs import Diff, iter_file_diffs
+from .filters import filter_diff
+from .paths import enter_repo
+from .pipeline import MAX_CONCURRENT_REQUESTS
+from .utils import generate_commit_messages
+
+# --- CONFIG ---
+# Results are appended here; finished commits found in it are skipped on the next run
+DEFAULT_OUTPUT_PATH = "aicommit-batch.jsonl"
+# Commits selected when a target has no explicit range
+DEFAULT_RANGE = "HEAD"
+# Separates the repository from the revision range in a target, e.g. "../api::v1.2..HEAD"
+TARGET_SEPARATOR = "::"
+# Print a throughput line at most this often
+PROGRESS_INTERVAL_SECONDS = 10.0
+
+
+def parse_target(target):
+    """
+    Split a batch target into (repository top-level path, revision range).
+    Args:
+        target (str): "REPO" or "REPO::RANGE", e.g. "services/api::v1.0..HEAD".
+    Returns:
+        tuple: (absolute repository path, revision range)
+    Raises:
+        subprocess.CalledProcessError: If REPO is not inside a git repository.
+    """
+    repo, _, revision_range = target.partition(TARGET_SEPARATOR)
+    top_level = subprocess.check_output(
+        ["git", "-C", repo or ".", "rev-parse", "--show-toplevel"], stderr=subprocess.DEVNULL
+    ).decode("utf-8").strip()
+    return top_level, revision_range or DEFAULT_RANGE
+
+
+def read_targets(targets, targets_file=None):
+    """Combine targets from the command line and from a file (one per line, # for comments)."""
+    targets = list(targets)
+    if targets_file:
+        with open(targets_file, "r", encoding="utf-8") as f:
+            targets += [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return targets
+
+
+def list_commits(repo, revision_range):
+    """
+    List the non-merge commits in revision_range, oldest first.
+    Returns:
+        list: One dict per commit with sha, author, date and the original subject.
+    """
+    output = subprocess.check_output(
+        ["git", "-C", repo, "log", "--no-merges", "--reverse", "--format=%H%x00%an%x00%aI%x00%s", revision_range],
+        stderr=subprocess.DEVNULL,
+    ).decode("utf-8", errors="replace")
+    commits = []
+    for line in output.splitlines():
+        sha, author, date, subject = line.split("\0", 3)
+        commits.append({"sha": sha, "author": author, "date": date, "subject": subject})
+    return commits
+
+
+def load_finished(output_path):
+    """Return the (repo, sha) pairs that already have a successful result in output_path."""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run interrupted mid-write can leave a partial last line
+                continue
+            if not record.get("error"):
+                finished.add((record["repo"], record["commit"]))
+    return finished
+
+
+def extract_commit_diff(repo, sha):
+    """
+    Parse and filter the diff of one commit. Runs in a worker process, so the git call and
+    the parsing of many commits happen in parallel.
+    Returns:
+        Diff: The filtered diff of the commit.
+    """
+    # Pool workers are reused across repositories: enter_repo also drops the .git directory
+    # cached for the previous one, so the filter reads this repository's .gitattributes and
+    # .aicommitignore
+    enter_repo(repo)
+    diff = Diff((sha,), list(iter_file_diffs((sha,), command="show")))
+    filtered, _ = filter_diff(diff)
+    return filtered
+
+
+def describe_commit(api_key, diff, language, with_impact):
+    """Generate a commit message (and optionally the impacted backend modules) for one diff."""
+    result = {"message": "", "files": len(diff), "added": diff.added, "removed": diff.removed}
+    if not diff:
+        return result
+    choices = generate_commit_messages(api_key, diff, language, num_messages=1, live=False)
+    result["message"] = choices[0] if choices else ""
+    if with_impact:
+        from .commit_impact_report import extract_backend_modules
+        result["modules"] = extract_backend_modules(diff)
+    return result
+
+
+class Throughput:
+    """Counts finished commits and reports commits per minute."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def record(self, failed=False):
+        self.done += 1
+        self.failed += failed
+        now = time.perf_counter()
+        if now - self.last_report >= PROGRESS_INTERVAL_SECONDS:
+            self.last_report = now
+            self.report()
+
+    @property
+    def per_minute(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done * 60 / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        print(f"📈 {self.done}/{self.total} commits, {self.per_minute:.1f} commits/min, {self.failed} failed")
+
+
+def run_batch(api_key, targets, output_path=DEFAULT_OUTPUT_PATH, jobs=MAX_CONCURRENT_REQUESTS,
+              diff_workers=None, language="en", with_impact=False):
+    """
+    Generate commit messages for every commit of several repositories or revision ranges.
+    Diffs are extracted in a process pool while a bounded thread pool sends the LLM requests;
+    each result is appended to output_path as one JSON line as soon as it is ready, and
+    commits already finished there are skipped, so an interrupted run resumes where it stopped.
+    Args:
+        api_key (str): Azure OpenAI API key.
+        targets (list): "REPO" or "REPO::RANGE" strings (see parse_target).
+        output_path (str): JSONL results file, also used as the checkpoint.
+        jobs (int): Maximum number of commits with LLM requests in flight.
+        diff_workers (int): Number of diff extraction processes (default: CPU count).
+        language (str): Language of the generated messages.
+        with_impact (bool): Also extract the impacted backend modules of each commit.
+    Returns:
+        Throughput: Counters for the run.
+    """
+    finished = load_finished(output_path)
+    work = []
+    for target in targets:
+        try:
+            repo, revision_range = parse_target(target)
+            commits = list_commits(repo, revision_range)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ Skipping {target}: {e}")
+            continue
+        pending = [commit for commit in commits if (repo, commit["sha"]) not in finished]
+        print(f"📦 {repo} {revision_range}: {len(commits)} commits, {len(commits) - len(pending)} already done")
+        work += [(repo, commit) for commit in pending]
+
+    throughput = Throughput(len(work))
+    if not work:
+        print("✅ Nothing to do.")
+        return throughput
+
+    jobs = max(1, jobs)
+    diff_workers = max(1, diff_workers or os.cpu_count() or 1)
+    # Keep extraction a little ahead of the LLM pool without holding every diff in memory
+    max_in_flight = jobs * 2 + diff_workers
+    queue = iter(work)
+    extracting, generating = {}, {}
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ProcessPoolExecutor(max_workers=diff_workers) as processes, \
+            ThreadPoolExecutor(max_workers=jobs) as threads:
+
+        def write(repo, commit, **fields):
+            record = {"repo": repo, "commit": commit["sha"], "author": commit["author"],
+                      "date": commit["date"], "subject": commit["subject"], **fields}
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # Flush every line so the checkpoint survives an interrupted run
+            output.flush()
+            throughput.record(failed=bool(fields.get("error")))
+
+        while True:
+            while len(extracting) + len(generating) < max_in_flight:
+                item = next(queue, None)
+                if item is None:
+                    break
+                repo, commit = item
+                extracting[processes.submit(extract_commit_diff, repo, commit["sha"])] = (repo, commit)
+            if not extracting and not generating:
+                break
+
+            done, _ = wait(list(extracting) + list(generating), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in extracting:
+                    repo, commit = extracting.pop(future)
+                    try:
+                        diff = future.result()
+                    except Exception as e:
+                        write(repo, commit, error=f"diff extraction failed: {e}")
+                        continue
+                    task = threads.submit(describe_commit, api_key, diff, language, with_impact)
+                    generating[task] = (repo, commit)
+                else:
+                    repo, commit = generating.pop(future)
+                    try:
+                        write(repo, commit, **future.result())
+                    except Exception as e:
+                        write(repo, commit, error=str(e))
+
+    throughput.report()
+    print(f"💾 Results appended to `{output_path}`")
+    return throughput
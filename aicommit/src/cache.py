@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from . import telemetry
+from .paths import get_state_dir
+
+# --- CONFIG ---
+# Set AICOMMIT_NO_CACHE=1 (or pass --no-cache) to always call the model
+CACHE_ENABLED = os.getenv("AICOMMIT_NO_CACHE", "").lower() not in ("1", "true", "yes")
+# Entries older than this are treated as misses and removed
+CACHE_TTL_SECONDS = float(os.getenv("AICOMMIT_CACHE_TTL_DAYS", "7")) * 24 * 60 * 60
+# Oldest entries are evicted once the cache grows past this size
+CACHE_MAX_BYTES = int(float(os.getenv("AICOMMIT_CACHE_MAX_MB", "50")) * 1024 * 1024)
+
+
+def disable_cache():
+    """Bypass the response cache for the rest of this process."""
+    global CACHE_ENABLED
+    CACHE_ENABLED = False
+
+
+def normalize_diff(diff_text):
+    """Normalize line endings and trailing whitespace so equivalent diffs hash the same."""
+    lines = diff_text.replace("\r\n", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def make_cache_key(diff_text, prompt_version, deployment, params):
+    """
+    Build a content-addressed key for an LLM response.
+    Args:
+        diff_text (str): The diff (or other input text) inserted into the prompt.
+        prompt_version (str): Version of the prompt template; bump it when the prompt changes.
+        deployment (str): Model / deployment name the request is sent to.
+        params (dict): Sampling parameters such as temperature and max_tokens.
+    Returns:
+        str: Hex SHA-256 digest identifying the response.
+    """
+    material = json.dumps({
+        "diff": hashlib.sha256(normalize_diff(diff_text).encode("utf-8")).hexdigest(),
+        "prompt_version": prompt_version,
+        "deployment": deployment,
+        "params": params,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    cache_dir = get_state_dir("cache", key[:2])
+    return os.path.join(cache_dir, key + ".json") if cache_dir else None
+
+
+def get_cached_response(key):
+    """Return the cached response for key, or None on a miss."""
+    if not CACHE_ENABLED:
+        return None
+    path = _entry_path(key)
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+            os.remove(path)
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["response"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def store_response(key, response):
+    """Persist a response under key and evict old entries if the cache is too large."""
+    if not CACHE_ENABLED:
+        return
+    path = _entry_path(key)
+    if not path:
+        return
+    try:
+        # Write to a temp file first so a crash never leaves a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not write response cache: {e}")
+        return
+    evict_cache_entries()
+
+
+def evict_cache_entries():
+    """Remove expired entries, then the oldest ones until the cache fits CACHE_MAX_BYTES."""
+    cache_root = get_state_dir("cache")
+    if not cache_root:
+        return
+    now = time.time()
+    entries = []
+    for dirpath, _, filenames in os.walk(cache_root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > CACHE_TTL_SECONDS:
+                _remove_quietly(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        _remove_quietly(path)
+        total -= size
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Per thread, one list per cached_call in progress of (preferred, answering) backend labels
+_ANSWERS = threading.local()
+
+
+def record_answer(preferred, answered):
+    """
+    Note which backend answered a model request made on this thread (see router), so the
+    cached_call in progress keys the response by the backend that produced it.
+    """
+    for answers in getattr(_ANSWERS, "stack", ()):
+        answers.append((preferred, answered))
+
+
+def _answer_label(deployment, answers):
+    """Model label to store a response under, or None when it cannot be attributed to one."""
+    fallbacks = [answered for preferred, answered in answers if answered != preferred]
+    if not fallbacks:
+        return deployment
+    # A single request that a failover or hedge answered belongs to that backend; a mix of
+    # backends (e.g. a draft and its refinement) matches no key a later run would look up
+    return fallbacks[0] if len(answers) == 1 else None
+
+
+def cached_call(call, diff_text, prompt_version, deployment, params):
+    """
+    Return a cached response for this diff/prompt/model/params, calling the model on a miss.
+    Empty responses are treated as failures and are never cached. A response from another
+    backend than the preferred one (failover, hedging) is stored under that backend's label.
+    """
+    key = make_cache_key(diff_text, prompt_version, deployment, params)
+    response = get_cached_response(key)
+    if response is not None:
+        telemetry.count("cache_hits")
+        print("⚡ Using cached model response.")
+        return response
+    telemetry.count("cache_misses")
+    if not hasattr(_ANSWERS, "stack"):
+        _ANSWERS.stack = []
+    answers = []
+    _ANSWERS.stack.append(answers)
+    try:
+        response = call()
+    finally:
+        _ANSWERS.stack.pop()
+    if response:
+        label = _answer_label(deployment, answers)
+        if label is None:
+            telemetry.count("cache_skips", reason="fallback")
+        else:
+            store_response(key if label == deployment else
+                           make_cache_key(diff_text, prompt_version, label, params), response)
+    return response
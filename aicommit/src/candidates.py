@@ -0,0 +1,148 @@
+import json
+import os
+import re
+from .router import chat_completion, complete
+from .streaming import STREAMING_ENABLED, CandidateRenderer
+
+# --- CONFIG ---
+# How commit message candidates are produced: "sample" (n completions of one prompt),
+# "json" (one completion returning a JSON array) or "draft" (cheap draft, optionally refined)
+CANDIDATE_STRATEGY = os.getenv("AICOMMIT_CANDIDATE_STRATEGY", "sample").lower()
+# Set AICOMMIT_REFINE=0 to keep only the draft of the "draft" strategy
+REFINE_DRAFT = os.getenv("AICOMMIT_REFINE", "1").lower() not in ("0", "false", "no")
+# Candidates at least this similar (Jaccard index of character shingles) count as duplicates
+DEDUPE_THRESHOLD = float(os.getenv("AICOMMIT_DEDUPE_THRESHOLD", "0.7"))
+SHINGLE_SIZE = 3
+
+SYSTEM_PROMPT = "You are a helpful assistant that generates git commit messages."
+
+
+def _commit_prompt(diff_text, language):
+    return f"What follows '-------' is a git diff for a potential commit. Reply with an appropriate git commit message (a Git commit message should be concise but also try to describe the important changes in the commit) and don't include any other text but the message in your response. ------- {diff_text}, language={language}"
+
+
+def _messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def sample_candidates(api_key, diff_text, language, count, live=True):
+    """n-sampling: one prompt, `count` independent completions (the output is billed per completion)."""
+    # Show every candidate in the terminal as its tokens arrive
+    renderer = CandidateRenderer(count)
+    try:
+        return chat_completion(
+            "commit_message",
+            _messages(_commit_prompt(diff_text, language)),
+            n=count,
+            # Batch mode runs many requests at once, so nothing is rendered live there
+            stream=STREAMING_ENABLED and live,
+            on_delta=renderer.update,
+            on_reset=renderer.reset,
+            api_key=api_key,
+            max_tokens=200,
+            temperature=0.7,
+        )
+    finally:
+        renderer.close()
+
+
+def parse_candidate_list(text):
+    """
+    Parse a model reply that should be a JSON array of strings. Falls back to one candidate per
+    line (without list markers) when the reply is not valid JSON.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        # Drop a ```json ... ``` fence
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+            if isinstance(items, list):
+                return [str(item) for item in items if str(item).strip()]
+        except ValueError:
+            pass
+    lines = (re.sub(r"^\s*(?:[-*]|\d+[.)])\s+", "", line).strip().strip('"') for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+def json_list_candidates(api_key, diff_text, language, count, live=True):
+    """One completion returning a JSON array of `count` different messages (the diff is sent once)."""
+    prompt = (
+        f"What follows '-------' is a git diff for a potential commit. Write {count} different git commit "
+        f"messages for it, each concise but describing the important changes, and each taking a different "
+        f"angle (e.g. what changed, why, which component). Reply with a JSON array of {count} strings and "
+        f"nothing else. ------- {diff_text}, language={language}"
+    )
+    reply = complete("commit_message", _messages(prompt), api_key=api_key, max_tokens=60 * count, temperature=0.7)
+    return parse_candidate_list(reply)[:count]
+
+
+def draft_candidates(api_key, diff_text, language, count, live=True):
+    """
+    Cheap first: a single low-temperature draft (from the "commit_draft" route, e.g. a small model), then
+    an optional refinement call that only sees the draft, not the diff, to produce alternatives.
+    """
+    draft = complete("commit_draft", _messages(_commit_prompt(diff_text, language)), api_key=api_key,
+                     max_tokens=120, temperature=0.3)
+    if not draft or not REFINE_DRAFT or count <= 1:
+        return [draft] if draft else []
+    prompt = (
+        f"Here is a draft git commit message:\n{draft}\n\nWrite {count - 1} alternative versions of it with "
+        f"different wording or emphasis, without inventing changes it does not mention. Reply with a JSON "
+        f"array of strings and nothing else. language={language}"
+    )
+    alternatives = parse_candidate_list(complete("commit_message", _messages(prompt), api_key=api_key,
+                                                 max_tokens=60 * count, temperature=0.8))
+    return [draft] + alternatives[:count - 1]
+
+
+CANDIDATE_STRATEGIES = {
+    "sample": sample_candidates,
+    "json": json_list_candidates,
+    "draft": draft_candidates,
+}
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Character shingles of the lower-cased, whitespace-normalized text."""
+    text = " ".join(text.lower().split())
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def similarity(first, second):
+    """Jaccard index of the two texts' shingle sets (1.0 means identical)."""
+    a, b = shingles(first), shingles(second)
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def dedupe_candidates(candidates, threshold=DEDUPE_THRESHOLD):
+    """Drop candidates that are near-duplicates of an earlier one, keeping the original order."""
+    kept = []
+    for candidate in candidates:
+        if all(similarity(candidate, other) < threshold for other in kept):
+            kept.append(candidate)
+    return kept
+
+
+def clean_candidate(text):
+    """Collapse a candidate onto one line (the prompt asks for a single-line message)."""
+    return " ".join(text.split())
+
+
+def generate_candidates(api_key, diff_text, language, count, live=True, strategy=None):
+    """
+    Produce up to `count` distinct single-line commit message candidates with the chosen strategy.
+    Raises:
+        ValueError: For an unknown strategy name.
+        LLMError: If the model request failed.
+    """
+    strategy = strategy or CANDIDATE_STRATEGY
+    if strategy not in CANDIDATE_STRATEGIES:
+        raise ValueError(f"unknown candidate strategy {strategy!r} (choose from {', '.join(CANDIDATE_STRATEGIES)})")
+    candidates = [clean_candidate(text) for text in CANDIDATE_STRATEGIES[strategy](api_key, diff_text, language, count, live)]
+    return dedupe_candidates([candidate for candidate in candidates if candidate])
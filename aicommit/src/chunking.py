@@ -0,0 +1,255 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain
+from . import ratelimit, telemetry
+from .cache import cached_call
+from .llm_client import LLMError
+from .pipeline import MAX_CONCURRENT_REQUESTS
+from .router import cache_label, complete
+
+# --- CONFIG ---
+# Rough average for English text and code; good enough to keep prompts under the limit
+CHARS_PER_TOKEN = 4
+# Diffs estimated above this many tokens are summarized chunk by chunk first
+MAX_PROMPT_TOKENS = int(os.getenv("AICOMMIT_MAX_PROMPT_TOKENS", "12000"))
+# Token budget for a single chunk sent to the map (summarize) step
+CHUNK_TOKEN_BUDGET = int(os.getenv("AICOMMIT_CHUNK_TOKENS", "6000"))
+# Expected size of one per-file summary line, used when deciding how many files to summarize
+SUMMARY_TOKENS_ESTIMATE = 60
+
+# Bump when the chunk summary prompt changes so cached responses are not reused
+CHUNK_SUMMARY_PROMPT_VERSION = "1"
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for budgeting (no tokenizer dependency)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _iter_sections(lines):
+    """
+    Group diff lines into (file_header, hunk) sections.
+    The file header is the `diff --git` block up to the first `@@`; each hunk starts at `@@`.
+    """
+    header, hunk = [], []
+    for line in lines:
+        if line.startswith("diff --git "):
+            if hunk:
+                yield header, hunk
+            elif header:
+                # File without hunks (binary, mode change, pure rename)
+                yield header, []
+            header, hunk = [line], []
+        elif line.startswith("@@"):
+            if hunk:
+                yield header, hunk
+            hunk = [line]
+        elif hunk:
+            hunk.append(line)
+        else:
+            header.append(line)
+    if hunk or header:
+        yield header, hunk
+
+
+def iter_diff_chunks(lines, budget=CHUNK_TOKEN_BUDGET):
+    """
+    Split a unified diff into chunks on file and hunk boundaries, each within the token budget.
+    Hunks from the same file share a chunk when they fit; a file header is repeated in every
+    chunk that continues that file. A single hunk larger than the budget is split by lines.
+    Args:
+        lines (iterable): Diff lines (with line endings), e.g. streamed from git.
+        budget (int): Maximum estimated tokens per chunk.
+    Yields:
+        str: Diff text for one chunk.
+    """
+    max_chars = budget * CHARS_PER_TOKEN
+    chunk, chunk_chars, chunk_header = [], 0, None
+
+    for header, hunk in _iter_sections(lines):
+        header_text = "".join(header)
+        hunk_text = "".join(hunk)
+        needs_header = header_text != chunk_header
+        size = len(hunk_text) + (len(header_text) if needs_header else 0)
+
+        if chunk and chunk_chars + size > max_chars:
+            yield "".join(chunk)
+            chunk, chunk_chars, chunk_header = [], 0, None
+            needs_header = True
+            size = len(header_text) + len(hunk_text)
+
+        if size <= max_chars:
+            if needs_header:
+                chunk.append(header_text)
+                chunk_header = header_text
+            chunk.append(hunk_text)
+            chunk_chars += size
+            continue
+
+        # The section alone is too large: emit it in line-based pieces, repeating the
+        # file header (when it is small) so every piece still names its file
+        prefix = header_text if len(header_text) < max_chars // 4 else ""
+        piece, piece_chars = [prefix], len(prefix)
+        for line in (hunk if prefix else header + hunk):
+            for start in range(0, max(len(line), 1), max_chars):
+                part = line[start:start + max_chars]
+                if piece_chars + len(part) > max_chars and piece_chars > len(prefix):
+                    yield "".join(piece)
+                    piece, piece_chars = [prefix], len(prefix)
+                piece.append(part)
+                piece_chars += len(part)
+        if piece_chars > len(prefix):
+            yield "".join(piece)
+
+    if chunk:
+        yield "".join(chunk)
+
+
+def map_reduce(chunks, map_fn, reduce_fn, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Run map_fn over chunks in parallel and pass the ordered results to reduce_fn.
+    At most max_workers chunks are held in memory at a time, so memory stays bounded
+    however many chunks the iterator produces.
+    """
+    results = {}
+    chunks = iter(chunks)
+    # Chunks are summarized with the caller's rate-limit priority
+    map_fn = ratelimit.inherit_priority(map_fn)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = {}
+        for index, chunk in enumerate(chunks):
+            pending[executor.submit(map_fn, chunk)] = index
+            if len(pending) >= max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        for future in pending:
+            results[pending[future]] = future.result()
+    return reduce_fn([results[index] for index in sorted(results)])
+
+
+def summarize_diff_chunk(chunk):
+    """Summarize one diff chunk with Azure OpenAI (the map step)."""
+    prompt = f"""
+Summarize the following part of a git diff for a reviewer. For every file, list what changed
+(added/removed/modified functions, classes, configuration) in short bullet points. Mention
+file paths exactly. Do not speculate about code that is not shown.
+
+Git Diff:
+{chunk}
+"""
+    params = {"temperature": 0.2, "max_tokens": 400}
+    messages = [
+        {"role": "system", "content": "You summarize code diffs precisely and briefly."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def request_summary():
+        try:
+            return complete("chunk_summary", messages, **params)
+        except LLMError as e:
+            print("❌ Azure OpenAI API Error (chunk summary):", e)
+            return ""
+
+    return cached_call(request_summary, chunk, CHUNK_SUMMARY_PROMPT_VERSION, cache_label("chunk_summary"), params)
+
+
+def fit_diff_to_budget(diff, summarize_chunk=summarize_diff_chunk, max_tokens=MAX_PROMPT_TOKENS, _depth=0):
+    """
+    Return prompt-ready diff text that fits within max_tokens.
+    Small diffs are returned unchanged. Larger ones are split into chunks, summarized in
+    parallel (map) and the summaries are joined (reduce); if the joined summaries are still
+    too large, they are summarized again.
+    Args:
+        diff (str | iterable): Diff text, or an iterable of diff lines (e.g. streamed from git).
+        summarize_chunk (callable): Map function turning one chunk into a short summary.
+        max_tokens (int): Token budget for the final prompt input.
+    Returns:
+        str: The original diff or a combined summary of it.
+    """
+    lines = iter(diff.splitlines(True) if isinstance(diff, str) else diff)
+
+    # Buffer only until we know whether the diff fits; beyond that, stream it into chunks
+    buffered, buffered_chars = [], 0
+    for line in lines:
+        buffered.append(line)
+        buffered_chars += len(line)
+        if buffered_chars > max_tokens * CHARS_PER_TOKEN:
+            break
+    else:
+        return "".join(buffered).strip()
+
+    print("✂️ Diff is too large for one prompt, summarizing it in chunks...")
+    chunk_budget = min(CHUNK_TOKEN_BUDGET, max_tokens)
+    summary = map_reduce(
+        iter_diff_chunks(chain(buffered, lines), chunk_budget),
+        summarize_chunk,
+        lambda summaries: "\n\n".join(s for s in summaries if s),
+    )
+    if estimate_tokens(summary) > max_tokens:
+        if _depth >= 2:
+            # Summaries are not converging; keep the head rather than overflowing the prompt
+            return summary[:max_tokens * CHARS_PER_TOKEN]
+        return fit_diff_to_budget(summary, summarize_chunk, max_tokens, _depth + 1)
+    return summary
+
+
+# Guards Diff.derived so concurrent stages compute a diff's prompt text only once
+_FIT_LOCK = threading.Lock()
+
+
+def fit_diff(diff, max_tokens=MAX_PROMPT_TOKENS):
+    """
+    fit_diff_to_budget for a parsed Diff, computed once per run and shared by every stage.
+    Stages that ask at the same time wait for the first one instead of summarizing again.
+    """
+    from .compaction import COMPACTION_MODE
+    key = ("fit", max_tokens, COMPACTION_MODE)
+    with _FIT_LOCK:
+        entry = diff.derived.setdefault(key, [threading.Lock(), None])
+    with entry[0]:
+        if entry[1] is None:
+            with telemetry.span("fit_diff", max_tokens=max_tokens):
+                entry[1] = _fit_parsed_diff(diff, max_tokens)
+        return entry[1]
+
+
+def _fit_parsed_diff(diff, max_tokens):
+    """
+    Replace the largest files of an oversized Diff by their per-file summaries until it fits.
+    Per-file summaries are stored by blob SHAs, so a file change summarized for the commit
+    message is reused by the PR description and impact report stages.
+    The diff is compacted first (see compaction), so only what is left after that counts.
+    """
+    # Imported here because these modules build on this one
+    from .compaction import compact_diff
+    from .summaries import summarize_files
+
+    files, _ = compact_diff(diff)
+    sizes = {file_diff.path: estimate_tokens(text) for file_diff, text in files}
+    total = sum(sizes.values())
+    if total <= max_tokens:
+        return "".join(text for _, text in files)
+
+    to_summarize = []
+    for file_diff, _ in sorted(files, key=lambda entry: len(entry[1]), reverse=True):
+        if total <= max_tokens:
+            break
+        to_summarize.append(file_diff)
+        total -= sizes[file_diff.path] - SUMMARY_TOKENS_ESTIMATE
+    summaries = summarize_files(to_summarize)
+
+    parts = []
+    for file_diff, text in files:
+        # A file whose summary failed keeps its diff; the chunking fallback below trims it if needed
+        if summaries.get(file_diff.path):
+            parts.append(f"{file_diff.name_status} (+{file_diff.added} -{file_diff.removed}, summarized): "
+                         f"{summaries[file_diff.path]}\n")
+        else:
+            parts.append(text)
+    text = "".join(parts)
+    if estimate_tokens(text) > max_tokens:
+        # Even the summaries are too large (e.g. thousands of files): fall back to chunking
+        return fit_diff_to_budget(text, max_tokens=max_tokens)
+    return text
@@ -1,39 +1,42 @@
 import os
 import subprocess
-import requests
-import json
 from datetime import datetime
-from dotenv import load_dotenv
-from openpyxl import Workbook, load_workbook
 from io import BytesIO
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
- 
-# Load environment variables from .env file
-load_dotenv()
+from . import compaction
+from .cache import cached_call
+from .chunking import fit_diff
+from .config import get_api_key, get_setting
+from .diffs import Diff, load_diff
+from .filters import filter_diff
+from .impact import analyze_impact, changed_backend_modules
+from .report_sink import enqueue_row, start_background_flush
+from .report_store import append_report_row
+from .llm_client import LLMError
+from .router import cache_label, complete
+from .streaming import STREAMING_ENABLED
  
 # Azure OpenAI Setup
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-AZURE_API_ENDPOINT = "https://shrutiaiinstance.openai.azure.com/openai/deployments/gpt-4o-mini/chat/completions?api-version=2025-01-01-preview"
-HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": OPENAI_API_KEY
-}
- 
-# Microsoft Graph Auth Setup (future use)
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+# (endpoint, deployment, retries and connection pooling live in llm_client; the API key is
+# read from .env on first use by config)
+# requests is imported inside the functions that use it (it is slow to import); the Google
+# Sheets client lives in report_sink and the local report store in report_store
+# File the full impact report is written to
+IMPACT_REPORT_PATH = ".github/IMPACT_REPORT.md"
+# Bump when a prompt changes so cached responses are not reused
+IMPACT_REPORT_PROMPT_VERSION = "2"
+ 
+# Microsoft Graph Auth Setup (future use; TENANT_ID, CLIENT_ID and CLIENT_SECRET come from .env)
 EXCEL_FILE_PATH_ONEDRIVE = "/drive/root:/PR_Report.xlsx"
  
  
 # Function to get an access token from Microsoft Graph
 def get_access_token():
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+    import requests
+    token_url = f"https://login.microsoftonline.com/{get_setting('TENANT_ID')}/oauth2/v2.0/token"
     payload = {
-        'client_id': CLIENT_ID,
+        'client_id': get_setting("CLIENT_ID"),
         'scope': 'https://graph.microsoft.com/.default',
-        'client_secret': CLIENT_SECRET,
+        'client_secret': get_setting("CLIENT_SECRET"),
         'grant_type': 'client_credentials'
     }
     response = requests.post(token_url, data=payload)
@@ -43,6 +46,7 @@ def get_access_token():
  
 # Function to download the Excel file from OneDrive (for future use)
 def download_excel_file(access_token):
+    import requests
     url = f"https://graph.microsoft.com/v1.0{EXCEL_FILE_PATH_ONEDRIVE}:/content"
     headers = {"Authorization": f"Bearer {access_token}"}
     response = requests.get(url, headers=headers)
@@ -52,6 +56,7 @@ def download_excel_file(access_token):
  
 # Function to upload the Excel file back to OneDrive (for future use)
 def upload_excel_file(access_token, file_content):
+    import requests
     url = f"https://graph.microsoft.com/v1.0{EXCEL_FILE_PATH_ONEDRIVE}:/content"
     headers = {
         "Authorization": f"Bearer {access_token}",
@@ -65,40 +70,30 @@ def upload_excel_file(access_token, file_content):
         print(response.text)
  
  
-# Append data to a local Excel file stored in the .github folder
-def append_to_excel_local(date, username, commit_message, module_summary):
-    local_excel_path = ".github/PR_Report.xlsx"
-    # Check if the file exists and load it, else create a new workbook
-    if os.path.exists(local_excel_path):
-        workbook = load_workbook(local_excel_path)
-    else:
-        workbook = Workbook()
-        sheet = workbook.active
-        # Add header if new workbook created
-        sheet.append(["Date", "GitHub Username", "Commit Message", "Impacted Backend Modules"])
- 
-    sheet = workbook.active
-    # Append the new row with commit details
-    sheet.append([date, username, commit_message, module_summary])
-    workbook.save(local_excel_path)
+# Append data to the local report store (export it to `.github/PR_Report.xlsx` with
+# `aicommit export-report`)
+def append_to_excel_local(date, username, commit_message, module_summary, analysis=None):
+    # One SQLite insert instead of loading and re-saving the whole workbook for every commit
+    append_report_row(date, username, commit_message, module_summary, analysis)
  
  
-# Retrieve git diff between master and current HEAD
+# Retrieve the parsed git diff between master and current HEAD
 def get_commit_diff():
     try:
-        diff = subprocess.check_output(
-            ["git", "diff", "master..HEAD", "--no-color"],
-            stderr=subprocess.DEVNULL
-        )
-        # Return git diff as a string
-        return diff.decode("utf-8").strip()
+        # Parsed and filtered once per run; both impact report requests share the same Diff
+        diff, _ = filter_diff(load_diff(("master..HEAD",)))
+        return diff
     except subprocess.CalledProcessError as e:
         print("❌ Error getting git diff:", e)
-        return ""
+        return Diff(("master..HEAD",), [])
  
  
 # Generate a full impact report using Azure OpenAI API
-def generate_full_impact_report(diff_text):
+def generate_full_impact_report(diff, output_path=None):
+    # Oversized diffs are replaced by their chunk summaries
+    diff_text = fit_diff(diff)
+    # Changed symbols and dependent modules come from local static analysis, not the model
+    impact_text = analyze_impact(diff).prompt_text()
     prompt = f"""
     You're an expert code reviewer and software architect.
  
@@ -109,72 +104,37 @@ def generate_full_impact_report(diff_text):
     - Frontend Changes
     - Reasoning
  
-    Git Diff:
-    {diff_text}
-    """
-    payload = {
-        "messages": [
-            {"role": "system", "content": "You are a senior developer reviewing code changes."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.5,
-        "max_tokens": 1000
-    }
-    response = requests.post(AZURE_API_ENDPOINT, headers=HEADERS, data=json.dumps(payload))
-    if response.status_code == 200:
-        # Return the response text from the AI
-        return response.json()["choices"][0]["message"]["content"].strip()
-    else:
-        print("❌ Azure OpenAI API Error:", response.status_code, response.text)
-        return ""
+    Use the static analysis below for the changed modules and their dependents.
  
- 
-# Generate a summary by extracting only backend module names via Azure OpenAI API
-def extract_backend_modules(diff_text):
-    prompt = f"""
-    You're a backend expert. From the git diff below, extract ONLY backend module names (e.g., file names, classes, packages, functions) that were affected. Return a clean comma-separated list.
+    Static Analysis:
+    {impact_text}
  
     Git Diff:
     {diff_text}
     """
-    payload = {
-        "messages": [
-            {"role": "system", "content": "You extract backend modules from code diffs."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.3,
-        "max_tokens": 300
-    }
-    response = requests.post(AZURE_API_ENDPOINT, headers=HEADERS, data=json.dumps(payload))
-    if response.status_code == 200:
-        # Return the clean, comma-separated list of backend modules
-        return response.json()["choices"][0]["message"]["content"].strip()
-    else:
-        print("❌ Azure OpenAI API Error (backend modules):", response.status_code, response.text)
-        return ""
- 
- 
-# Append a row of commit data to Google Sheets
-def append_to_google_sheet(date, username, commit_message, module_summary):
-    # Define the scope for Google Sheets API
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive"
+    params = {"temperature": 0.5, "max_tokens": 1000}
+    messages = [
+        {"role": "system", "content": "You are a senior developer reviewing code changes."},
+        {"role": "user", "content": prompt}
     ]
- 
-    # Path to your JSON key file (downloaded from Google Cloud Console)
-    CREDENTIALS_PATH = os.path.join(os.path.dirname(__file__), "google_credentials.json")
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, scope)
- 
-    # Authorize the client with the credentials
-    client = gspread.authorize(creds)
- 
-    # Open the sheet by its key
-    sheet = client.open_by_key("1D4pbXFL6Uh6Zu1W7ZPfHFuHzy96Fx5Ok7_pKFfEVwGY").sheet1
-    # Append the row with commit data
-    sheet.append_row([date, username, commit_message, module_summary])
- 
-    print("✅ Summary added to Google Sheet.")
+
+    def request_report():
+        try:
+            # Return the response text from the AI, filling the report file in as tokens arrive
+            return complete("impact_report", messages, stream=STREAMING_ENABLED, output_path=output_path, **params)
+        except LLMError as e:
+            print("❌ Azure OpenAI API Error:", e)
+            return ""
+
+    # The compaction mode changes the prompt, so it is part of the cache key
+    return cached_call(request_report, impact_text + "\n" + diff.text, IMPACT_REPORT_PROMPT_VERSION,
+                       cache_label("impact_report"), {**params, "compaction": compaction.COMPACTION_MODE})
+ 
+ 
+# List the changed backend modules, computed locally from the diff (no model call)
+def extract_backend_modules(diff):
+    # Return the clean, comma-separated list of backend modules
+    return ", ".join(changed_backend_modules(diff))
  
  
 # Retrieve the latest commit message from git
@@ -195,7 +155,7 @@ def get_git_username():
  
 # Main function to generate the impact report, save it and update summary
 def impact_report():
-    if not OPENAI_API_KEY:
+    if not get_api_key():
         print("❌ OPENAI_API_KEY not set in .env")
         return
  
@@ -206,15 +166,16 @@ def impact_report():
         return
  
     print("🧠 Generating full Impact Area Analysis Report...")
-    full_report = generate_full_impact_report(diff)
- 
-    print("📦 Extracting only backend module names for summary...")
-    backend_modules = extract_backend_modules(diff)
- 
+    save_impact_report(generate_full_impact_report(diff, IMPACT_REPORT_PATH), extract_backend_modules(diff),
+                       analyze_impact(diff))
+
+
+# Save the full report and append the backend module summary (and the static analysis) to the storage
+def save_impact_report(full_report, backend_modules, analysis=None):
     # Save full report to markdown file inside .github folder
     if full_report:
         os.makedirs(".github", exist_ok=True)
-        with open(".github/IMPACT_REPORT.md", "w", encoding="utf-8") as f:
+        with open(IMPACT_REPORT_PATH, "w", encoding="utf-8") as f:
             f.write(full_report)
         print("💾 Full impact report saved to `.github/IMPACT_REPORT.md`")
  
@@ -224,7 +185,10 @@ def impact_report():
     commit_message = get_commit_message()
     
     # Append summary to the storage
-    # Uncomment below to use local Excel; currently using Google Sheets
-    # append_to_excel_local(date, username, commit_message, backend_modules)
-    append_to_google_sheet(date, username, commit_message, backend_modules)
-    print("✅ Summary added to `.github/PR_Report.xlsx`")
\ No newline at end of file
+    # The local report store is the system of record; Google Sheets gets a copy
+    append_to_excel_local(date, username, commit_message, backend_modules,
+                          analysis.to_dict() if analysis is not None else None)
+    # Rows are queued locally and sent in batches by a background flusher (see report_sink),
+    # so the commit never waits for the Sheets API
+    if enqueue_row([date, username, commit_message, backend_modules]) and start_background_flush():
+        print("📬 Summary queued for the report sheet.")
\ No newline at end of file
@@ -0,0 +1,219 @@
+import os
+from . import telemetry
+from .chunking import estimate_tokens
+
+# --- CONFIG ---
+# How much of the unified diff reaches the prompt:
+#   "off"      - the diff exactly as git printed it
+#   "balanced" - 1 context line, short file headers, pure renames as one line, whitespace-only
+#                and comment-only hunks folded into notes, repeated hunks sent once
+#   "minimal"  - like balanced with no context lines, and deleted files as one line
+COMPACTION_MODE = os.getenv("AICOMMIT_COMPACTION", "balanced").lower()
+COMPACTION_MODES = ("off", "balanced", "minimal")
+CONTEXT_LINES = {"balanced": 1, "minimal": 0}
+# Hunks shorter than this are cheaper to repeat than to reference
+MIN_DUPLICATE_CHARS = 80
+
+# Line comment and block comment markers by language (see diffs.LANGUAGES); other languages
+# never have hunks folded as comment-only. "* " rather than "*" so `*ptr = 1;` is still code.
+_C_COMMENTS = ("//", "/*", "* ", "*/")
+COMMENT_PREFIXES = {
+    "Python": ("#",), "Shell": ("#",), "Ruby": ("#",), "YAML": ("#",), "TOML": ("#",),
+    "Makefile": ("#",), "Dockerfile": ("#",), "SQL": ("--",),
+    "JavaScript": _C_COMMENTS, "TypeScript": _C_COMMENTS, "Java": _C_COMMENTS, "Kotlin": _C_COMMENTS,
+    "Go": _C_COMMENTS, "Rust": _C_COMMENTS, "C": _C_COMMENTS, "C++": _C_COMMENTS, "C#": _C_COMMENTS,
+    "PHP": _C_COMMENTS + ("#",), "Swift": _C_COMMENTS, "Scala": _C_COMMENTS, "CSS": ("/*", "* ", "*/"),
+    "SCSS": _C_COMMENTS, "HTML": ("<!--", "-->"), "XML": ("<!--", "-->"), "Vue": _C_COMMENTS + ("<!--", "-->"),
+}
+# Languages where leading indentation is syntax: re-indenting a line changes what it does
+INDENTATION_SENSITIVE = {"Python", "YAML", "Makefile", "CoffeeScript"}
+
+
+def set_compaction_mode(mode):
+    """Use mode for the rest of this process (e.g. from --compaction)."""
+    global COMPACTION_MODE
+    if mode not in COMPACTION_MODES:
+        raise ValueError(f"unknown compaction mode {mode!r} (choose from {', '.join(COMPACTION_MODES)})")
+    COMPACTION_MODE = mode
+
+
+class CompactionReport:
+    """How much the compaction stage shrank a diff, and what it folded."""
+
+    __slots__ = ("mode", "raw_tokens", "compact_tokens", "renames", "whitespace", "comments",
+                 "duplicates", "deleted")
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.raw_tokens = self.compact_tokens = 0
+        self.renames = self.whitespace = self.comments = self.duplicates = self.deleted = 0
+
+    @property
+    def ratio(self):
+        """Raw size divided by compacted size (2.0 means the prompt is half as large)."""
+        return self.raw_tokens / self.compact_tokens if self.compact_tokens else 1.0
+
+    def __str__(self):
+        folded = [f"{count} {name}" for name, count in (
+            ("renames", self.renames), ("whitespace-only hunks", self.whitespace),
+            ("comment-only hunks", self.comments), ("repeated hunks", self.duplicates),
+            ("deleted files", self.deleted)) if count]
+        return (f"Compacted the diff from ~{self.raw_tokens} to ~{self.compact_tokens} tokens "
+                f"({self.ratio:.1f}x, {self.mode})" + (f"; folded {', '.join(folded)}" if folded else ""))
+
+
+def _hunk_lines(hunk):
+    lines = hunk.text.split("\n")[1:]
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def _indentation(line):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _whitespace_only_change(removed, added, language):
+    """
+    True if the non-blank removed and added lines pair up one to one and each pair differs only
+    in leading or trailing whitespace. Whitespace inside a line can be part of a string literal
+    or separate tokens, so it is never treated as cosmetic. Leading indentation must also match
+    in indentation-sensitive languages.
+    """
+    removed = [line for line in removed if line.strip()]
+    added = [line for line in added if line.strip()]
+    if not removed or len(removed) != len(added):
+        return False
+    for old, new in zip(removed, added):
+        if old.strip() != new.strip():
+            return False
+        if language in INDENTATION_SENSITIVE and _indentation(old) != _indentation(new):
+            return False
+    return True
+
+
+def fold_kind(hunk, language):
+    """Return "whitespace-only" or "comment-only" if the hunk can be folded into a note, else None."""
+    lines = _hunk_lines(hunk)
+    removed = [line[1:] for line in lines if line.startswith("-")]
+    added = [line[1:] for line in lines if line.startswith("+")]
+    if not removed and not added:
+        return None
+    if _whitespace_only_change(removed, added, language):
+        return "whitespace-only"
+    prefixes = COMMENT_PREFIXES.get(language)
+    changed = [line.strip() for line in removed + added if line.strip()]
+    if prefixes and changed and all(line.startswith(prefixes) or line == "*" for line in changed):
+        return "comment-only"
+    if not changed:
+        # Only blank lines added or removed
+        return "whitespace-only"
+    return None
+
+
+def trim_context(hunk, context):
+    """
+    Split a hunk into sub-hunks keeping at most `context` unchanged lines around each change.
+    Returns:
+        list: (old_start, old_count, new_start, new_count, lines) per sub-hunk.
+    """
+    lines = _hunk_lines(hunk)
+    keep = [False] * len(lines)
+    for index, line in enumerate(lines):
+        if line[:1] in ("+", "-"):
+            for near in range(max(0, index - context), min(len(lines), index + context + 1)):
+                keep[near] = True
+    groups, current = [], None
+    old_line, new_line = hunk.old_start, hunk.new_start
+    for index, line in enumerate(lines):
+        kind = line[:1]
+        # "\ No newline at end of file" stays with the line it describes
+        if keep[index] or kind == "\\" and index and keep[index - 1]:
+            if current is None:
+                current = [old_line, 0, new_line, 0, []]
+                groups.append(current)
+            current[4].append(line)
+            current[1] += kind in (" ", "-")
+            current[3] += kind in (" ", "+")
+        else:
+            current = None
+        old_line += kind in (" ", "-")
+        new_line += kind in (" ", "+")
+    return [tuple(group) for group in groups]
+
+
+def _title(file_diff, note=""):
+    """One header line instead of git's diff --git / index / --- / +++ block."""
+    if file_diff.status == "A":
+        note = note or "new file"
+    elif file_diff.status == "D":
+        note = note or "deleted"
+    elif file_diff.status in ("R", "C"):
+        verb = "renamed" if file_diff.status == "R" else "copied"
+        note = f"{verb}, {note}" if note else verb
+    suffix = f" ({note})" if note else ""
+    return f"diff --git a/{file_diff.old_path} b/{file_diff.path}{suffix}\n"
+
+
+def compact_file(file_diff, mode, seen, report):
+    """Compacted prompt text for one file; seen maps hunk bodies already sent to their file."""
+    if not file_diff.hunks:
+        if file_diff.status in ("R", "C") and not (file_diff.binary or file_diff.generated):
+            report.renames += 1
+            return _title(file_diff, "no content change")
+        # Binary, mode-only and filtered files are already one or two lines
+        return file_diff.header
+    if mode == "minimal" and file_diff.status == "D":
+        report.deleted += 1
+        return _title(file_diff, f"-{file_diff.removed} lines")
+
+    parts = [_title(file_diff)]
+    for hunk in file_diff.hunks:
+        section = f" {hunk.section}" if hunk.section else ""
+        kind = fold_kind(hunk, file_diff.language)
+        if kind:
+            if kind == "whitespace-only":
+                report.whitespace += 1
+            else:
+                report.comments += 1
+            parts.append(f"@@ -{hunk.old_start} +{hunk.new_start} @@{section} "
+                         f"[{kind} change, +{hunk.added} -{hunk.removed} lines]\n")
+            continue
+        for old_start, old_count, new_start, new_count, lines in trim_context(hunk, CONTEXT_LINES[mode]):
+            body = "\n".join(lines) + "\n"
+            header = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{section}"
+            if len(body) >= MIN_DUPLICATE_CHARS and body in seen:
+                report.duplicates += 1
+                parts.append(f"{header} [same change as in {seen[body]}]\n")
+                continue
+            seen.setdefault(body, file_diff.path)
+            parts.append(header + "\n" + body)
+    return "".join(parts)
+
+
+def compact_diff(diff, mode=None):
+    """
+    Compact a Diff for prompting. Computed once per Diff and mode, and reported once.
+    Returns:
+        tuple: ([(FileDiff, prompt text)] in diff order, CompactionReport)
+    """
+    mode = mode or COMPACTION_MODE
+    key = ("compacted", mode)
+    if key in diff.derived:
+        return diff.derived[key]
+
+    report = CompactionReport(mode)
+    with telemetry.span("compact_diff", mode=mode):
+        if mode == "off":
+            files = [(file_diff, file_diff.text) for file_diff in diff]
+        else:
+            seen = {}
+            files = [(file_diff, compact_file(file_diff, mode, seen, report)) for file_diff in diff]
+    report.raw_tokens = sum(estimate_tokens(file_diff.text) for file_diff in diff)
+    report.compact_tokens = sum(estimate_tokens(text) for _, text in files)
+    telemetry.count("compaction_tokens_saved", report.raw_tokens - report.compact_tokens)
+    if mode != "off" and report.compact_tokens < report.raw_tokens:
+        print(f"🗜️ {report}")
+
+    diff.derived[key] = (files, report)
+    return diff.derived[key]
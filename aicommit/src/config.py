@@ -0,0 +1,30 @@
+import os
+
+_LOADED = False
+
+
+def load_config():
+    """
+    Load variables from the .env file into the environment, once per process.
+    python-dotenv is imported here rather than at module import time so commands that
+    never need configuration (e.g. nothing staged) do not pay for it.
+    """
+    global _LOADED
+    if not _LOADED:
+        _LOADED = True
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            return
+        load_dotenv()
+
+
+def get_setting(name, default=None):
+    """Return a configuration value from the environment or .env file."""
+    load_config()
+    return os.getenv(name, default)
+
+
+def get_api_key():
+    """Return the Azure OpenAI API key from the environment or .env file."""
+    return get_setting("OPENAI_API_KEY")
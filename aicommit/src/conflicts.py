@@ -0,0 +1,140 @@
+import contextlib
+import os
+import subprocess
+import threading
+import time
+from . import telemetry
+from .paths import get_git_dir, get_state_dir
+
+# --- CONFIG ---
+# Branch the staged changes will eventually be merged into
+CONFLICT_BASE = os.getenv("AICOMMIT_CONFLICT_BASE", "origin/master")
+# The remote is fetched at most once per this many seconds (a manual `git fetch` counts too)
+FETCH_TTL_SECONDS = float(os.getenv("AICOMMIT_FETCH_TTL", "300"))
+# A fetch slower than this is abandoned; the check then uses the refs already present
+FETCH_TIMEOUT_SECONDS = float(os.getenv("AICOMMIT_FETCH_TIMEOUT", "30"))
+# How long the commit prompt waits for an unfinished check before going ahead without it
+CONFLICT_WAIT_SECONDS = float(os.getenv("AICOMMIT_CONFLICT_WAIT", "2"))
+# Touched before every fetch attempt, so failing fetches (e.g. VPN down) are rate-limited too
+FETCH_MARKER_NAME = "last_fetch"
+FETCH_LOCK_NAME = "fetch.lock"
+STALE_LOCK_SECONDS = 600
+
+
+def unmerged_files():
+    """Files with unresolved merge conflicts in the index (a merge or rebase in progress)."""
+    result = subprocess.run(["git", "diff", "--name-only", "--diff-filter=U"], capture_output=True, text=True)
+    return [name.strip() for name in result.stdout.split("\n") if name.strip()]
+
+
+def _age(path):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return float("inf")
+
+
+def _acquire_fetch_lock(lock_path):
+    """Create the fetch lock file; returns False if another process is fetching."""
+    if _age(lock_path) > STALE_LOCK_SECONDS:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def fetch_if_stale(base=CONFLICT_BASE, ttl=FETCH_TTL_SECONDS):
+    """
+    Fetch the base branch unless the remote was fetched within ttl seconds or another
+    aicommit process is already fetching. Never touches the worktree or local branches.
+    Returns:
+        bool: True if a fetch ran and succeeded.
+    """
+    git_dir, state_dir = get_git_dir(), get_state_dir()
+    if not git_dir or "/" not in base:
+        return False
+    marker = os.path.join(state_dir, FETCH_MARKER_NAME)
+    if min(_age(os.path.join(git_dir, "FETCH_HEAD")), _age(marker)) < ttl:
+        return False
+    lock_path = os.path.join(state_dir, FETCH_LOCK_NAME)
+    if not _acquire_fetch_lock(lock_path):
+        return False
+    remote, branch = base.split("/", 1)
+    try:
+        with open(marker, "w"):
+            pass
+        # Only the base branch; `git fetch origin master` also updates origin/master
+        result = subprocess.run(["git", "fetch", "--quiet", "--no-tags", remote, branch],
+                                capture_output=True, timeout=FETCH_TIMEOUT_SECONDS)
+        return result.returncode == 0
+    except (subprocess.TimeoutExpired, OSError):
+        return False
+    finally:
+        # Another process may already have removed the lock as stale
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lock_path)
+
+
+def predict_conflicts(base=CONFLICT_BASE):
+    """
+    Predict which files would conflict if HEAD plus the staged changes were merged into base.
+    The merge is computed in the object database with `git merge-tree --write-tree` (git 2.38+);
+    the worktree, index and refs are not touched.
+    Returns:
+        list: Conflicting paths (empty when the merge is clean), or None if it could not be predicted.
+    """
+    def git(*args):
+        return subprocess.check_output(["git", *args], stderr=subprocess.DEVNULL).decode("utf-8").strip()
+
+    try:
+        # The staged changes as a throwaway commit on top of HEAD (unreferenced, so gc removes it)
+        staged = git("commit-tree", git("write-tree"), "-p", "HEAD", "-m", "aicommit conflict check")
+        git("rev-parse", "--verify", "--quiet", base + "^{commit}")
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    result = subprocess.run(["git", "merge-tree", "--write-tree", "--name-only", "--no-messages", staged, base],
+                            capture_output=True, text=True)
+    if result.returncode not in (0, 1):
+        # Older git without --write-tree, or unrelated histories
+        return None
+    # The first line is the merged tree; conflicted paths follow
+    paths = [line for line in result.stdout.split("\n")[1:] if line]
+    return list(dict.fromkeys(paths))
+
+
+class ConflictCheck:
+    """Fetch (rate-limited) and predict conflicts with base in a background thread."""
+
+    def __init__(self, base=CONFLICT_BASE):
+        self.base = base
+        self.conflicts = None
+        self.fetched = False
+        self._done = threading.Event()
+        # Daemon thread: an exiting run never waits for a slow fetch
+        threading.Thread(target=self._run, name="conflict check", daemon=True).start()
+
+    def _run(self):
+        try:
+            with telemetry.span("git_fetch", base=self.base):
+                self.fetched = fetch_if_stale(self.base)
+            with telemetry.span("predict_conflicts", base=self.base):
+                self.conflicts = predict_conflicts(self.base)
+        finally:
+            self._done.set()
+
+    def report(self, timeout=CONFLICT_WAIT_SECONDS):
+        """Print the predicted conflicts, waiting at most timeout seconds for the check."""
+        if not self._done.wait(timeout):
+            print(f"⏳ Conflict check against {self.base} is still fetching; skipped.")
+            return
+        if self.conflicts is None:
+            print(f"⚠️ Could not predict conflicts against {self.base}.")
+        elif self.conflicts:
+            print(f"⚠️ These files will conflict with {self.base} (update your branch before merging):")
+            for path in self.conflicts:
+                print(f"- {path}")
@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from .paths import get_git_dir, get_state_dir
+
+# --- CONFIG ---
+# The index is polled this often; a change is processed once it has been stable for SETTLE_SECONDS
+POLL_INTERVAL_SECONDS = 0.5
+SETTLE_SECONDS = float(os.getenv("AICOMMIT_DAEMON_SETTLE", "1.5"))
+# Set AICOMMIT_DAEMON_PREFETCH=0 to only parse the diff, not generate candidates, after staging
+PREFETCH_ENABLED = os.getenv("AICOMMIT_DAEMON_PREFETCH", "1").lower() not in ("0", "false", "no")
+# The daemon exits after this long without requests or index changes
+IDLE_EXIT_SECONDS = float(os.getenv("AICOMMIT_DAEMON_IDLE_MINUTES", "60")) * 60
+# How long a client waits for the daemon (generating candidates can take a while)
+CONNECT_TIMEOUT_SECONDS = 0.2
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("AICOMMIT_DAEMON_TIMEOUT", "120"))
+# Unix socket paths are limited to about 100 bytes; longer ones go to the temp directory
+MAX_SOCKET_PATH = 100
+
+DAEMON_SOCKET_NAME = "daemon.sock"
+DAEMON_LOG_NAME = "daemon.log"
+# Candidate requests for the same staged state share one generation
+DEFAULT_CANDIDATE_COUNT = 5
+# Environment variables (from the shell or .env) that change what the candidates are; a client
+# whose values differ from the daemon's generates locally instead of getting the daemon's answer
+SETTINGS_PREFIXES = ("AICOMMIT_", "AZURE_OPENAI_", "OPENAI_")
+# Daemon-only knobs that do not affect the candidates
+SETTINGS_IGNORED_PREFIXES = ("AICOMMIT_DAEMON_",)
+
+
+def _owned_privately(path):
+    """True if path exists, belongs to this user and is not a symlink."""
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return False
+    return stat.st_uid == os.getuid() and not os.path.islink(path)
+
+
+def _private_runtime_dir():
+    """
+    A directory only this user can enter, for sockets whose path under .git is too long:
+    $XDG_RUNTIME_DIR, or a per-user 0700 directory in the temp directory. None if the
+    latter exists but is not ours and private (e.g. created by another user of a shared /tmp).
+    """
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+    path = os.path.join(tempfile.gettempdir(), f"aicommit-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    if not _owned_privately(path) or os.lstat(path).st_mode & 0o077:
+        return None
+    return path
+
+
+def socket_path():
+    """Path of this repository's daemon socket, or None outside a git repository."""
+    state_dir = get_state_dir()
+    if not state_dir:
+        return None
+    path = os.path.join(state_dir, DAEMON_SOCKET_NAME)
+    if len(path) > MAX_SOCKET_PATH:
+        runtime_dir = _private_runtime_dir()
+        if not runtime_dir:
+            return None
+        digest = hashlib.sha1(state_dir.encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(runtime_dir, f"aicommit-{digest}.sock")
+    return path
+
+
+def settings_fingerprint():
+    """
+    Hash of the settings the candidates depend on: the relevant environment (after loading .env)
+    and the effective compaction and cache modes, which command-line flags can change.
+    Values are hashed so secrets never go over the socket.
+    """
+    from . import cache, compaction
+    from .config import load_config
+
+    load_config()
+    settings = {name: value for name, value in os.environ.items()
+                if name.startswith(SETTINGS_PREFIXES) and not name.startswith(SETTINGS_IGNORED_PREFIXES)}
+    settings["compaction_mode"] = compaction.COMPACTION_MODE
+    settings["cache_enabled"] = cache.CACHE_ENABLED
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# --- client side ---
+
+def send_request(command, timeout=REQUEST_TIMEOUT_SECONDS, **fields):
+    """
+    Send one request to the daemon and return its reply, or None when no daemon is running
+    or it did not answer in time.
+    """
+    path = socket_path()
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CONNECT_TIMEOUT_SECONDS)
+            client.connect(path)
+            client.settimeout(timeout)
+            client.sendall(json.dumps({"command": command, **fields}).encode("utf-8") + b"\n")
+            reply = client.makefile("rb").readline()
+        return json.loads(reply) if reply else None
+    except (OSError, ValueError):
+        return None
+
+
+def daemon_candidates(strategy=None, language="en", count=DEFAULT_CANDIDATE_COUNT):
+    """
+    Commit message candidates for the staged changes from the daemon, or None when the
+    daemon is not running, has nothing to describe, runs with other settings or failed
+    (the caller then works locally).
+    """
+    reply = send_request("candidates", strategy=strategy, language=language, count=count,
+                         settings=settings_fingerprint())
+    if reply and reply.get("mismatch"):
+        print("⚠️ The daemon runs with other settings; generating locally "
+              "(restart it with `aicommit daemon stop && aicommit daemon start`)")
+    if not reply or "candidates" not in reply:
+        return None
+    return reply["candidates"]
+
+
+def start_daemon(wait_seconds=5.0):
+    """
+    Start the daemon for this repository in a detached process (output in .git/aicommit/daemon.log).
+    Returns:
+        bool: True once the daemon answers.
+    """
+    if send_request("status", timeout=1):
+        return True
+    state_dir = get_state_dir()
+    if not state_dir:
+        return False
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.getenv("PYTHONPATH")])))
+    with open(os.path.join(state_dir, DAEMON_LOG_NAME), "a", encoding="utf-8") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "src.daemon"],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env,
+            # Detach so the daemon outlives the shell that started it
+            start_new_session=True,
+        )
+    deadline = time.time() + wait_seconds
+    while time.time() < deadline:
+        if send_request("status", timeout=1):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+# --- daemon side ---
+
+def _index_signature():
+    """Cheap fingerprint of the index file; it changes whenever git rewrites the index."""
+    try:
+        stat = os.stat(os.path.join(get_git_dir(), "index"))
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    except OSError:
+        return None
+
+
+def _head():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "-q", "--verify", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except subprocess.CalledProcessError:
+        return ""
+
+
+class StagedSnapshot:
+    """The parsed staged diff for one (index, HEAD) state, and the candidates generated for it."""
+
+    def __init__(self, signature, diff, tokens):
+        self.signature = signature
+        self.diff = diff
+        self.tokens = tokens
+        # (strategy, language, count) -> Future with the candidates
+        self.candidates = {}
+
+
+class CommitDaemon:
+    """
+    Keeps the staged diff parsed and candidates ready for this repository. The index is
+    polled; once it has settled after a change, the diff is parsed again and (optionally)
+    candidates are generated in the background, over the warm pooled HTTP client.
+    """
+
+    def __init__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .pipeline import MAX_CONCURRENT_REQUESTS
+
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+        self.last_activity = time.time()
+        self.started = time.time()
+        self.server = None
+        # Fixed at startup: the daemon keeps the environment and .env it was started with
+        self.settings = settings_fingerprint()
+
+    def current_snapshot(self):
+        """Return the snapshot for the current index and HEAD, parsing the diff again if either changed."""
+        from .chunking import estimate_tokens
+        from .diffs import clear_loaded_diffs, load_diff
+        from .filters import filter_diff
+
+        signature = (_index_signature(), _head())
+        with self.lock:
+            if self.snapshot is None or self.snapshot.signature != signature:
+                clear_loaded_diffs()
+                diff, _ = filter_diff(load_diff(("--cached",)))
+                self.snapshot = StagedSnapshot(signature, diff, estimate_tokens(diff.text))
+            return self.snapshot
+
+    def candidates_future(self, snapshot, strategy=None, language="en", count=DEFAULT_CANDIDATE_COUNT):
+        from .candidates import CANDIDATE_STRATEGY
+        from .config import get_api_key
+        from .utils import generate_commit_messages
+
+        key = (strategy or CANDIDATE_STRATEGY, language, count)
+        with self.lock:
+            if key not in snapshot.candidates:
+                snapshot.candidates[key] = self.executor.submit(
+                    generate_commit_messages, get_api_key(), snapshot.diff, language, count, False, key[0])
+            return snapshot.candidates[key]
+
+    def handle(self, request):
+        self.last_activity = time.time()
+        command = request.get("command")
+        if command == "status":
+            snapshot = self.snapshot
+            return {
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started, 1),
+                "files": len(snapshot.diff) if snapshot else None,
+                "tokens": snapshot.tokens if snapshot else None,
+                "prefetched": bool(snapshot and any(f.done() for f in snapshot.candidates.values())),
+            }
+        if command == "candidates":
+            if request.get("settings") != self.settings:
+                return {"mismatch": True}
+            snapshot = self.current_snapshot()
+            if not snapshot.diff:
+                return {"empty": True}
+            future = self.candidates_future(snapshot, request.get("strategy"), request.get("language", "en"),
+                                            request.get("count", DEFAULT_CANDIDATE_COUNT))
+            try:
+                return {"candidates": future.result()}
+            except Exception as e:
+                return {"error": str(e)}
+        if command == "stop":
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"stopping": True}
+        return {"error": f"unknown command {command!r}"}
+
+    def watch(self):
+        """Poll the index; after a change has settled, parse the diff and prefetch candidates."""
+        seen, changed_at = _index_signature(), None
+        while True:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            signature = _index_signature()
+            if signature != seen:
+                seen, changed_at = signature, time.time()
+                self.last_activity = changed_at
+            if changed_at and time.time() - changed_at >= SETTLE_SECONDS:
+                changed_at = None
+                try:
+                    snapshot = self.current_snapshot()
+                    if PREFETCH_ENABLED and snapshot.diff:
+                        self.candidates_future(snapshot)
+                except Exception as e:
+                    print(f"⚠️ Could not refresh the staged diff: {e}")
+            if time.time() - self.last_activity > IDLE_EXIT_SECONDS:
+                print("💤 Idle, exiting.")
+                self.server.shutdown()
+                return
+
+
+def run_daemon():
+    """Serve requests on the repository's Unix socket until stopped or idle."""
+    import socketserver
+
+    path = socket_path()
+    if not path:
+        print("❌ Not inside a git repository.")
+        return
+    if send_request("status", timeout=1):
+        print("Daemon already running.")
+        return
+    if os.path.lexists(path):
+        if not _owned_privately(path):
+            print(f"❌ {path} exists and belongs to another user; not starting.")
+            return
+        # Left behind by a daemon that did not shut down cleanly
+        os.remove(path)
+    # Work from the top level so git paths match the CLI's
+    os.chdir(subprocess.check_output(["git", "rev-parse", "--show-toplevel"]).decode("utf-8").strip())
+
+    daemon = CommitDaemon()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            try:
+                reply = daemon.handle(json.loads(line))
+            except ValueError:
+                reply = {"error": "invalid request"}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    # Created owner-only from the start: a chmod after bind would leave a window in which
+    # another local user could connect and read diff summaries
+    umask = os.umask(0o077)
+    try:
+        daemon.server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+    threading.Thread(target=daemon.watch, name="index watcher", daemon=True).start()
+    print(f"🚀 aicommit daemon {os.getpid()} listening on {path}", flush=True)
+    try:
+        # Parse (and prefetch) what is already staged
+        snapshot = daemon.current_snapshot()
+        if PREFETCH_ENABLED and snapshot.diff:
+            daemon.candidates_future(snapshot)
+        daemon.server.serve_forever()
+    finally:
+        daemon.server.server_close()
+        daemon.executor.shutdown(wait=False)
+        if os.path.exists(path):
+            os.remove(path)
+        print("👋 Daemon stopped.", flush=True)
+
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,363 @@
+import os
+import re
+import subprocess
+from fnmatch import fnmatch
+from . import telemetry
+
+# Size of each read from git's stdout while parsing the raw (-z) section
+_READ_SIZE = 64 * 1024
+
+# "@@ -12,7 +12,9 @@ def enclosing_function():"
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+
+# File extension (or exact file name) to language, used to describe changes in prompts
+LANGUAGES = {
+    ".py": "Python", ".js": "JavaScript", ".jsx": "JavaScript", ".mjs": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript", ".java": "Java", ".kt": "Kotlin",
+    ".go": "Go", ".rb": "Ruby", ".rs": "Rust", ".c": "C", ".h": "C", ".cpp": "C++",
+    ".hpp": "C++", ".cc": "C++", ".cs": "C#", ".php": "PHP", ".swift": "Swift",
+    ".scala": "Scala", ".sh": "Shell", ".sql": "SQL", ".html": "HTML", ".css": "CSS",
+    ".scss": "SCSS", ".vue": "Vue", ".md": "Markdown", ".json": "JSON", ".yml": "YAML",
+    ".yaml": "YAML", ".toml": "TOML", ".xml": "XML", ".ipynb": "Jupyter Notebook",
+    ".coffee": "CoffeeScript", ".mk": "Makefile", "Dockerfile": "Dockerfile", "Makefile": "Makefile",
+}
+
+# Paths that are produced by tools rather than written by hand
+GENERATED_PATTERNS = (
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "composer.lock", "Gemfile.lock", "go.sum", "*.min.js", "*.min.css",
+    "*.map", "*.pb.go", "*_pb2.py", "*.snap", "*/__snapshots__/*",
+)
+# Markers that tools put near the top of files they generate
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "Code generated by")
+
+
+class Hunk:
+    """A single `@@` hunk with its line ranges and added/removed line counts."""
+
+    __slots__ = ("old_start", "old_count", "new_start", "new_count", "section",
+                 "text", "added", "removed")
+
+    def __init__(self, text, added, removed):
+        match = _HUNK_HEADER.match(text.split("\n", 1)[0])
+        if match:
+            old_start, old_count, new_start, new_count, section = match.groups()
+            self.old_start = int(old_start)
+            self.old_count = int(old_count) if old_count is not None else 1
+            self.new_start = int(new_start)
+            self.new_count = int(new_count) if new_count is not None else 1
+            self.section = section.strip()
+        else:
+            # Combined diffs ("@@@") and other unusual headers keep only their text
+            self.old_start = self.old_count = self.new_start = self.new_count = 0
+            self.section = ""
+        self.text = text
+        self.added = added
+        self.removed = removed
+
+    def __repr__(self):
+        return (f"Hunk(-{self.old_start},{self.old_count} +{self.new_start},{self.new_count}, "
+                f"+{self.added} -{self.removed})")
+
+
+class FileDiff:
+    """Diff of a single file: paths, status, blob SHAs, header text and parsed hunks."""
+
+    __slots__ = ("path", "old_path", "status", "similarity", "old_blob", "new_blob",
+                 "header", "hunks", "size", "added", "removed", "binary", "generated")
+
+    def __init__(self, path, old_path, status, similarity=None, old_blob=None, new_blob=None):
+        self.path = path
+        self.old_path = old_path
+        self.status = status
+        self.similarity = similarity
+        self.old_blob = old_blob
+        self.new_blob = new_blob
+        self.header = ""
+        self.hunks = []
+        self.size = 0
+        self.added = 0
+        self.removed = 0
+        self.binary = False
+        self.generated = False
+
+    @property
+    def text(self):
+        """The unified diff text for this file, as git printed it."""
+        return self.header + "".join(hunk.text for hunk in self.hunks)
+
+    @property
+    def language(self):
+        name = os.path.basename(self.path)
+        return LANGUAGES.get(name) or LANGUAGES.get(os.path.splitext(name)[1].lower(), "")
+
+    @property
+    def name_status(self):
+        """This file's line in `git diff --name-status` format."""
+        if self.status in ("R", "C"):
+            return f"{self.status}{self.similarity or ''}\t{self.old_path}\t{self.path}"
+        return f"{self.status}\t{self.path}"
+
+    def __repr__(self):
+        return f"FileDiff({self.status} {self.path!r}, hunks={len(self.hunks)}, size={self.size})"
+
+
+class Diff:
+    """A parsed diff: the per-file records plus totals, parsed once and shared by every stage."""
+
+    __slots__ = ("revisions", "files", "derived")
+
+    def __init__(self, revisions, files):
+        self.revisions = revisions
+        self.files = files
+        # Values computed from this diff once per run (e.g. prompt-sized summaries)
+        self.derived = {}
+
+    def __bool__(self):
+        return bool(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def text(self):
+        return "".join(file_diff.text for file_diff in self.files)
+
+    @property
+    def size(self):
+        return sum(file_diff.size for file_diff in self.files)
+
+    @property
+    def added(self):
+        return sum(file_diff.added for file_diff in self.files)
+
+    @property
+    def removed(self):
+        return sum(file_diff.removed for file_diff in self.files)
+
+    def iter_lines(self):
+        """Yield the diff text line by line without joining it into one string."""
+        for file_diff in self.files:
+            yield from file_diff.header.splitlines(True)
+            for hunk in file_diff.hunks:
+                yield from hunk.text.splitlines(True)
+
+    def name_status(self):
+        """The diff in `git diff --name-status` format."""
+        return "\n".join(file_diff.name_status for file_diff in self.files)
+
+
+def _is_generated_path(path):
+    return any(fnmatch(path, pattern) or fnmatch(os.path.basename(path), pattern)
+               for pattern in GENERATED_PATTERNS)
+
+
+def _parse_raw_record(meta, paths):
+    # meta looks like ":100644 100644 <old sha> <new sha> R100"
+    old_mode, new_mode, old_blob, new_blob, status = meta[1:].split(" ")
+    similarity = int(status[1:]) if len(status) > 1 else None
+    return FileDiff(paths[-1], paths[0], status[0], similarity, old_blob, new_blob)
+
+
+def _unquote_path(path):
+    """Undo git's C-style quoting of unusual path names ("a/tab\\there")."""
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        try:
+            return path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape") \
+                .encode("latin-1").decode("utf-8")
+        except (UnicodeError, ValueError):
+            return path[1:-1]
+    return path
+
+
+def _file_from_header(header_lines):
+    """Derive paths and status from a patch header when no `--raw` record is available."""
+    first = header_lines[0].rstrip("\n")[len("diff --git "):]
+    old_path = path = None
+    status, similarity, old_blob, new_blob = "M", None, None, None
+    for line in header_lines[1:]:
+        line = line.rstrip("\n")
+        if line.startswith("new file mode"):
+            status = "A"
+        elif line.startswith("deleted file mode"):
+            status = "D"
+        elif line.startswith(("rename from ", "copy from ")):
+            status = "R" if line.startswith("rename") else "C"
+            old_path = _unquote_path(line.split(" ", 2)[2])
+        elif line.startswith(("rename to ", "copy to ")):
+            path = _unquote_path(line.split(" ", 2)[2])
+        elif line.startswith(("similarity index ", "dissimilarity index ")):
+            similarity = int(line.rsplit(" ", 1)[1].rstrip("%"))
+        elif line.startswith("index "):
+            old_blob, _, new_blob = line.split(" ")[1].partition("..")
+        elif line.startswith("--- ") and not line.endswith("/dev/null"):
+            old_path = old_path or _unquote_path(line[4:].rstrip("\t"))[2:]
+        elif line.startswith("+++ ") and not line.endswith("/dev/null"):
+            path = path or _unquote_path(line[4:].rstrip("\t"))[2:]
+    if path is None and old_path is None:
+        # No ---/+++ lines (binary or mode-only change): "a/<path> b/<path>" with equal halves
+        if first.startswith('"'):
+            path = _unquote_path(first[:first.index('" ') + 1])[2:]
+        else:
+            path = first[2:(len(first) - 1) // 2]
+    return FileDiff(path or old_path, old_path or path, status, similarity, old_blob, new_blob)
+
+
+def _finish_file(file_diff, header_lines, size):
+    """Fill in the header-derived fields and totals once all of a file's lines are read."""
+    file_diff.header = "".join(header_lines)
+    file_diff.size = size
+    file_diff.added = sum(hunk.added for hunk in file_diff.hunks)
+    file_diff.removed = sum(hunk.removed for hunk in file_diff.hunks)
+    file_diff.binary = "\nBinary files " in file_diff.header or "GIT binary patch" in file_diff.header
+    file_diff.generated = _is_generated_path(file_diff.path) or bool(file_diff.hunks) and any(
+        marker in file_diff.hunks[0].text[:2048] for marker in GENERATED_MARKERS
+    )
+    return file_diff
+
+
+def _iter_patch_files(lines, records=None):
+    """
+    Parse patch lines into FileDiff records.
+    Args:
+        lines (iterable): Patch lines as bytes or str.
+        records (iterator): Records from a `--raw -z` section, in patch order. When None,
+            paths and status are derived from each file's patch header instead.
+    """
+    current, in_file = None, False
+    header_lines, hunk_lines = [], []
+    size = added = removed = 0
+
+    for raw_line in lines:
+        line = raw_line.decode("utf-8", errors="replace") if isinstance(raw_line, bytes) else raw_line
+        if line.startswith("diff --git "):
+            if in_file:
+                if hunk_lines:
+                    current.hunks.append(Hunk("".join(hunk_lines), added, removed))
+                yield _finish_file(current or _file_from_header(header_lines), header_lines, size)
+            current = next(records, None) if records is not None else None
+            if records is not None and current is None:
+                return
+            in_file = True
+            header_lines, hunk_lines = [line], []
+            size = added = removed = 0
+        elif not in_file:
+            continue
+        elif line.startswith("@@"):
+            if current is None:
+                current = _file_from_header(header_lines)
+            if hunk_lines:
+                current.hunks.append(Hunk("".join(hunk_lines), added, removed))
+            hunk_lines = [line]
+            added = removed = 0
+        elif hunk_lines:
+            hunk_lines.append(line)
+            if line.startswith("+"):
+                added += 1
+            elif line.startswith("-"):
+                removed += 1
+        else:
+            header_lines.append(line)
+        size += len(raw_line)
+
+    if in_file:
+        if hunk_lines:
+            current.hunks.append(Hunk("".join(hunk_lines), added, removed))
+        yield _finish_file(current or _file_from_header(header_lines), header_lines, size)
+
+
+def _iter_patch_lines(pending, stream):
+    """Yield patch lines, starting with bytes already read past the raw section."""
+    lines = pending.split(b"\n")
+    partial = lines.pop()
+    for line in lines:
+        yield line + b"\n"
+    for line in stream:
+        if partial:
+            line, partial = partial + line, b""
+        yield line
+    if partial:
+        yield partial
+
+
+def _read_raw_section(stream):
+    """Read NUL-separated raw records until the empty record that precedes the patch."""
+    records, tokens, pending, pos = [], [], b"", 0
+    while True:
+        end = pending.find(b"\0", pos)
+        if end < 0:
+            data = stream.read1(_READ_SIZE)
+            if not data:
+                return records, pending[pos:]
+            pending, pos = pending[pos:] + data, 0
+            continue
+        token, pos = pending[pos:end], end + 1
+        if not token:
+            return records, pending[pos:]
+        if not tokens:
+            # Every record starts with its ":<modes> <shas> <status>" metadata
+            tokens = [token.decode("ascii")]
+            continue
+        tokens.append(os.fsdecode(token))
+        # A record is complete once it has one path (two for renames and copies)
+        status = tokens[0].rsplit(" ", 1)[-1]
+        if len(tokens) == (3 if status[0] in "RC" else 2):
+            records.append(_parse_raw_record(tokens[0], tokens[1:]))
+            tokens = []
+
+
+def iter_file_diffs(revisions=("--cached",), paths=(), command="diff"):
+    """
+    Yield one FileDiff per changed file from a single `git diff --raw -z --patch` invocation.
+    The output is parsed incrementally: only the current file's text is held in memory,
+    no shell is involved and paths with spaces or special characters are handled exactly.
+    Args:
+        revisions (tuple): Arguments selecting what to diff, e.g. ("--cached",) or ("master..HEAD",).
+        paths (tuple): Optional pathspecs limiting the diff.
+        command (str): "diff", or "show" for a single commit (works on root and shallow commits).
+    Yields:
+        FileDiff: Per-file record with path, status, hunks and byte size.
+    Raises:
+        subprocess.CalledProcessError: If git exits with a non-zero status.
+    """
+    args = ["git", command, *revisions, "--raw", "-z", "--patch", "--no-color",
+            "--no-abbrev", "--full-index"]
+    if command == "show":
+        args.append("--format=")
+    args += ["--", *paths]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    with process:
+        records, pending = _read_raw_section(process.stdout)
+        yield from _iter_patch_files(_iter_patch_lines(pending, process.stdout), iter(records))
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+
+
+def parse_diff(diff_text, revisions=()):
+    """Parse unified diff text (e.g. from the GitHub API) into a Diff."""
+    return Diff(tuple(revisions), list(_iter_patch_files(diff_text.splitlines(True))))
+
+
+# Parsed diffs for this run, keyed by (command, revisions)
+_LOADED_DIFFS = {}
+
+
+def load_diff(revisions=("--cached",), command="diff"):
+    """
+    Return the parsed Diff for revisions, running git only the first time in this process.
+    Every stage (commit message, PR description, impact report) shares the same object.
+    """
+    key = (command, tuple(revisions))
+    if key not in _LOADED_DIFFS:
+        with telemetry.span("git_diff", revisions=" ".join(revisions)):
+            _LOADED_DIFFS[key] = Diff(tuple(revisions), list(iter_file_diffs(revisions, command=command)))
+        telemetry.count("diff_bytes", _LOADED_DIFFS[key].size)
+    return _LOADED_DIFFS[key]
+
+
+def clear_loaded_diffs():
+    """Forget parsed diffs, e.g. after a commit moves HEAD."""
+    _LOADED_DIFFS.clear()
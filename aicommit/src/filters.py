@@ -0,0 +1,183 @@
+import math
+import os
+import subprocess
+from collections import Counter
+from fnmatch import fnmatch
+from . import telemetry
+from .chunking import estimate_tokens
+from .diffs import GENERATED_PATTERNS, Diff, FileDiff
+from .paths import get_git_dir
+
+# --- CONFIG ---
+# Set AICOMMIT_NO_FILTER=1 to send every file to the model unchanged
+FILTER_ENABLED = os.getenv("AICOMMIT_NO_FILTER", "").lower() not in ("1", "true", "yes")
+# Per-file diffs larger than this are replaced by a stub
+MAX_FILE_DIFF_BYTES = int(os.getenv("AICOMMIT_MAX_FILE_BYTES", str(200 * 1024)))
+# Added content above this Shannon entropy (bits per character) looks minified or encoded
+MAX_ENTROPY = float(os.getenv("AICOMMIT_MAX_ENTROPY", "5.5"))
+# Entropy is only meaningful for a reasonable amount of text
+ENTROPY_MIN_BYTES = 2048
+# Average added line length above which content is treated as minified
+MAX_AVERAGE_LINE_LENGTH = 400
+
+# Vendored and build output directories (and any other lockfiles) never worth describing
+VENDORED_PATTERNS = (
+    "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "third_party/*",
+    "dist/*", "build/*", "*.lock",
+)
+# Extra glob rules: comma-separated in AICOMMIT_SKIP_GLOBS and one per line in .aicommitignore
+IGNORE_FILE_NAME = ".aicommitignore"
+
+
+class FilterReport:
+    """What the filter stage skipped and how much prompt it saved."""
+
+    __slots__ = ("skipped", "bytes_saved", "tokens_saved")
+
+    def __init__(self):
+        self.skipped = []
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def __str__(self):
+        if not self.skipped:
+            return "No files filtered from the prompt."
+        return (f"Skipped {len(self.skipped)} file(s) from the prompt, saving "
+                f"{self.bytes_saved / 1024:.1f} KB (~{self.tokens_saved} tokens)")
+
+
+def load_skip_globs():
+    """Return the user-configured glob rules from the environment and .aicommitignore."""
+    globs = [g.strip() for g in os.getenv("AICOMMIT_SKIP_GLOBS", "").split(",") if g.strip()]
+    git_dir = get_git_dir()
+    if git_dir:
+        ignore_path = os.path.join(os.path.dirname(git_dir), IGNORE_FILE_NAME)
+        if os.path.exists(ignore_path):
+            with open(ignore_path, "r", encoding="utf-8") as f:
+                globs += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return globs
+
+
+def read_linguist_attributes(paths):
+    """
+    Return {path: True/False} for paths with linguist-generated or linguist-vendored set or unset
+    in .gitattributes, using a single `git check-attr` call. Unspecified paths are left out.
+    """
+    if not paths:
+        return {}
+    try:
+        output = subprocess.run(
+            ["git", "check-attr", "-z", "--stdin", "linguist-generated", "linguist-vendored"],
+            input="\0".join(paths).encode("utf-8") + b"\0",
+            capture_output=True, check=True
+        ).stdout.decode("utf-8", errors="replace")
+    except (subprocess.CalledProcessError, OSError):
+        return {}
+
+    attributes = {}
+    fields = output.split("\0")
+    for path, _, value in zip(fields[0::3], fields[1::3], fields[2::3]):
+        if value in ("set", "true"):
+            attributes[path] = True
+        elif value in ("unset", "false") and path not in attributes:
+            attributes[path] = False
+    return attributes
+
+
+def shannon_entropy(text):
+    """Bits of entropy per character of text."""
+    if not text:
+        return 0.0
+    total = len(text)
+    return -sum(count / total * math.log2(count / total) for count in Counter(text).values())
+
+
+def _matches(path, patterns):
+    name = os.path.basename(path)
+    return any(fnmatch(path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def _added_content(file_diff):
+    return [line[1:] for hunk in file_diff.hunks for line in hunk.text.split("\n")[1:]
+            if line.startswith("+")]
+
+
+def skip_reason(file_diff, attributes, skip_globs):
+    """Return why file_diff should not be sent to the model, or None to keep it."""
+    if file_diff.binary:
+        return "binary file"
+    attribute = attributes.get(file_diff.path)
+    if attribute:
+        return "generated or vendored (.gitattributes)"
+    if attribute is None:
+        # An explicit `-linguist-generated` in .gitattributes overrides the built-in patterns
+        if _matches(file_diff.path, skip_globs):
+            return "matches skip rule"
+        if file_diff.generated or _matches(file_diff.path, GENERATED_PATTERNS):
+            return "generated file"
+        if _matches(file_diff.path, VENDORED_PATTERNS):
+            return "vendored or build output"
+    if file_diff.size > MAX_FILE_DIFF_BYTES:
+        return f"diff larger than {MAX_FILE_DIFF_BYTES // 1024} KB"
+
+    added = _added_content(file_diff)
+    added_bytes = sum(len(line) for line in added)
+    if added and added_bytes / len(added) > MAX_AVERAGE_LINE_LENGTH:
+        return "minified content"
+    if added_bytes >= ENTROPY_MIN_BYTES and shannon_entropy("".join(added)[:16384]) > MAX_ENTROPY:
+        return "high-entropy content (encoded or minified)"
+    return None
+
+
+def _stub(file_diff, reason):
+    """Replace a file's diff with a one-line note that keeps its path, status and size."""
+    stub = FileDiff(file_diff.path, file_diff.old_path, file_diff.status, file_diff.similarity,
+                    file_diff.old_blob, file_diff.new_blob)
+    stub.header = (f"diff --git a/{file_diff.old_path} b/{file_diff.path}\n"
+                   f"[{file_diff.name_status}: {reason}, +{file_diff.added} -{file_diff.removed} lines, "
+                   f"{file_diff.size} bytes omitted]\n")
+    stub.size = len(stub.header)
+    stub.added, stub.removed = file_diff.added, file_diff.removed
+    stub.binary, stub.generated = file_diff.binary, True
+    return stub
+
+
+def filter_diff(diff):
+    """
+    Drop lockfiles, generated, vendored, oversized and binary content from a Diff before prompting.
+    Skipped files are replaced by one-line stubs so the model still knows they changed.
+    The result is computed once per Diff and reused by every stage.
+    Returns:
+        tuple: (filtered Diff, FilterReport)
+    """
+    if "filtered" in diff.derived:
+        return diff.derived["filtered"]
+
+    report = FilterReport()
+    if not FILTER_ENABLED or not diff:
+        result = (diff, report)
+    else:
+        with telemetry.span("filter_diff", files=len(diff)):
+            attributes = read_linguist_attributes([file_diff.path for file_diff in diff])
+            skip_globs = load_skip_globs()
+            files = []
+            for file_diff in diff:
+                reason = skip_reason(file_diff, attributes, skip_globs)
+                if reason is None:
+                    files.append(file_diff)
+                    continue
+                stub = _stub(file_diff, reason)
+                files.append(stub)
+                report.skipped.append((file_diff.path, reason))
+                report.bytes_saved += file_diff.size - stub.size
+                report.tokens_saved += estimate_tokens(file_diff.text) - estimate_tokens(stub.text)
+            filtered = Diff(diff.revisions, files)
+            # Static analysis (see impact) reads the full diff: a stub hides a file's hunks and
+            # marks it generated even when it is real source skipped for its size
+            filtered.derived["unfiltered"] = diff
+            result = (filtered, report)
+            if report.skipped:
+                print(f"🧹 {report}")
+
+    diff.derived["filtered"] = result
+    return result
@@ -0,0 +1,15 @@
+import subprocess
+
+
+def stream_git_output(args):
+    """
+    Run a git command and yield its stdout line by line without buffering the whole output.
+    Raises:
+        subprocess.CalledProcessError: If git exits with a non-zero status.
+    """
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    with process:
+        for raw_line in process.stdout:
+            yield raw_line.decode("utf-8", errors="replace")
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
@@ -0,0 +1,293 @@
+import json
+import os
+import posixpath
+import re
+import subprocess
+import tempfile
+import threading
+from collections import deque
+from fnmatch import fnmatch
+from .paths import get_state_dir
+
+# --- CONFIG ---
+# Source files that count as backend code; JS/TS files also need to be outside FRONTEND_PATTERNS
+BACKEND_EXTENSIONS = (".py", ".java", ".kt", ".go", ".rb", ".rs", ".cs", ".php", ".scala",
+                      ".js", ".mjs", ".cjs", ".ts")
+FRONTEND_PATTERNS = ("*.jsx", "*.tsx", "*.vue", "*.svelte", "*/components/*", "*/pages/*",
+                     "*/public/*", "*/static/*", "frontend/*", "*/frontend/*", "client/*", "web/*")
+# Files whose imports are indexed for the dependency graph
+PYTHON_EXTENSIONS = (".py",)
+JS_EXTENSIONS = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx")
+# Transitive dependents are followed this many import levels deep, and at most this many are kept
+MAX_DEPENDENT_DEPTH = 3
+MAX_DEPENDENTS = 50
+# Bump when the import parsing changes so cached graphs are rebuilt
+IMPORT_GRAPH_VERSION = "1"
+IMPORT_GRAPH_FILE = "import_graph.json"
+
+# Definitions on changed lines and in hunk headers ("@@ ... @@ def enclosing():")
+_DEFINITION = re.compile(
+    r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?"
+    r"(?:def|class|function\*?|interface|type|enum)\s+([A-Za-z_$][\w$]*)"
+    r"|^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function|\([^)]*\)\s*=>|[\w$]+\s*=>)"
+)
+_PY_IMPORT = re.compile(r"^\s*import\s+(.+)$")
+_PY_FROM_IMPORT = re.compile(r"^\s*from\s+(\.*)([\w.]*)\s+import\s+\(?([^)#]*)")
+_JS_IMPORT = re.compile(
+    r"""(?:\bimport\s[^'"]*?\bfrom\s*|\bimport\s*\(?\s*|\bexport\s[^'"]*?\bfrom\s*|\brequire\s*\(\s*)['"]([^'"]+)['"]"""
+)
+
+
+class ImpactAnalysis:
+    """Changed files and symbols of a Diff, plus the repository modules that depend on them."""
+
+    __slots__ = ("changed_modules", "symbols", "dependents")
+
+    def __init__(self, changed_modules, symbols, dependents):
+        self.changed_modules = changed_modules
+        self.symbols = symbols
+        self.dependents = dependents
+
+    def to_dict(self):
+        """Plain representation stored next to the report row (see report_store)."""
+        return {"changed_modules": self.changed_modules, "symbols": self.symbols, "dependents": self.dependents}
+
+    def prompt_text(self):
+        """Compact description of the impact set for the narrative report prompt."""
+        lines = ["Changed backend modules and symbols:"]
+        for module in self.changed_modules:
+            symbols = self.symbols.get(module)
+            lines.append(f"- {module}" + (f": {', '.join(symbols)}" if symbols else ""))
+        if not self.changed_modules:
+            lines.append("- (none)")
+        lines.append("Modules that import the changed code (directly or transitively):")
+        lines += [f"- {module}" for module in self.dependents] or ["- (none)"]
+        return "\n".join(lines)
+
+
+def is_backend_path(path):
+    if not path.endswith(BACKEND_EXTENSIONS):
+        return False
+    return not any(fnmatch(path, pattern) for pattern in FRONTEND_PATTERNS)
+
+
+def changed_symbols(file_diff):
+    """
+    Names of the functions and classes a file change touches: the enclosing definitions from
+    the hunk headers plus definitions on added or removed lines.
+    """
+    names = set()
+    for hunk in file_diff.hunks:
+        match = _DEFINITION.match(hunk.section)
+        if match:
+            names.add(match.group(1) or match.group(2))
+        for line in hunk.text.split("\n")[1:]:
+            if line[:1] in ("+", "-"):
+                match = _DEFINITION.match(line[1:])
+                if match:
+                    names.add(match.group(1) or match.group(2))
+    return sorted(names)
+
+
+def _python_module_names(path):
+    """Dotted names a Python file can be imported as, from the most to the least qualified."""
+    parts = path[:-len(".py")].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts))] if parts else []
+
+
+def _python_imports(path, source):
+    """Dotted module names imported by a Python file (relative imports resolved)."""
+    package = path.split("/")[:-1]
+    imports = []
+    for line in source.splitlines():
+        match = _PY_IMPORT.match(line)
+        if match:
+            imports += [name.split(" as ")[0].strip() for name in match.group(1).split(",")]
+            continue
+        match = _PY_FROM_IMPORT.match(line)
+        if not match:
+            continue
+        dots, module, names = match.groups()
+        if dots:
+            base = package[:len(package) - (len(dots) - 1)] if len(dots) - 1 <= len(package) else []
+            module = ".".join(base + ([module] if module else []))
+        imports.append(module)
+        # "from package import module" imports a submodule
+        imports += [f"{module}.{name.split(' as ')[0].strip()}" for name in names.split(",") if name.strip()]
+    return [name for name in imports if name]
+
+
+def _js_imports(path, source):
+    """Relative import specifiers of a JS/TS file, resolved to repository paths (without extension)."""
+    directory = posixpath.dirname(path)
+    return [posixpath.normpath(posixpath.join(directory, specifier))
+            for specifier in _JS_IMPORT.findall(source) if specifier.startswith(".")]
+
+
+def _list_indexed_files():
+    """Return {path: blob sha} for the source files in the index, from one `git ls-files -s` call."""
+    output = subprocess.check_output(["git", "ls-files", "-s", "-z"], stderr=subprocess.DEVNULL)
+    files = {}
+    for record in output.decode("utf-8", errors="replace").split("\0"):
+        if "\t" not in record:
+            continue
+        meta, path = record.split("\t", 1)
+        if path.endswith(PYTHON_EXTENSIONS + JS_EXTENSIONS):
+            files[path] = meta.split(" ")[1]
+    return files
+
+
+def _read_blobs(shas):
+    """Return {sha: text} for blob SHAs, read through a single `git cat-file --batch` process."""
+    if not shas:
+        return {}
+    result = subprocess.run(["git", "cat-file", "--batch"], input="\n".join(shas).encode() + b"\n",
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    output, position, blobs = result.stdout, 0, {}
+    for sha in shas:
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].split(b" ")
+        position = header_end + 1
+        if len(header) < 3:
+            # "<sha> missing"
+            continue
+        size = int(header[2])
+        blobs[sha] = output[position:position + size].decode("utf-8", errors="replace")
+        position += size + 1
+    return blobs
+
+
+def _graph_path():
+    state_dir = get_state_dir()
+    return os.path.join(state_dir, IMPORT_GRAPH_FILE) if state_dir else None
+
+
+def _load_cached_graph(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") == IMPORT_GRAPH_VERSION:
+            return cached["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def _save_cached_graph(path, files):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"version": IMPORT_GRAPH_VERSION, "files": files}, f)
+    os.replace(tmp_path, path)
+
+
+_GRAPH_LOCK = threading.Lock()
+_GRAPH = None
+
+
+def load_import_graph():
+    """
+    Return {path: [imported repository paths]} for the Python and JS/TS files in the index.
+    Each file's imports are cached under .git/aicommit/ by blob SHA, so only files that changed
+    since the last run are read and parsed again.
+    """
+    global _GRAPH
+    with _GRAPH_LOCK:
+        if _GRAPH is not None:
+            return _GRAPH
+        indexed = _list_indexed_files()
+        cache_path = _graph_path()
+        cached = _load_cached_graph(cache_path) if cache_path else {}
+
+        stale = {path: sha for path, sha in indexed.items() if cached.get(path, [None])[0] != sha}
+        sources = _read_blobs(sorted(set(stale.values())))
+        entries = {path: cached[path] for path in indexed if path not in stale}
+        for path, sha in stale.items():
+            source = sources.get(sha, "")
+            raw = _python_imports(path, source) if path.endswith(PYTHON_EXTENSIONS) else _js_imports(path, source)
+            entries[path] = [sha, raw]
+        if cache_path and (stale or len(entries) != len(cached)):
+            _save_cached_graph(cache_path, entries)
+
+        _GRAPH = _resolve_graph({path: raw for path, (_, raw) in entries.items()})
+        return _GRAPH
+
+
+def _resolve_graph(raw_imports):
+    """Map raw import names to repository paths."""
+    python_modules = {}
+    for path in raw_imports:
+        if path.endswith(PYTHON_EXTENSIONS):
+            for name in _python_module_names(path):
+                # Ambiguous short names (e.g. two "utils" modules) are not resolved
+                python_modules[name] = path if name not in python_modules else None
+    js_modules = {}
+    for path in raw_imports:
+        if path.endswith(JS_EXTENSIONS):
+            stem = path.rsplit(".", 1)[0]
+            js_modules.setdefault(stem, path)
+            if stem.endswith("/index"):
+                js_modules.setdefault(stem[:-len("/index")], path)
+
+    graph = {}
+    for path, imports in raw_imports.items():
+        lookup = python_modules if path.endswith(PYTHON_EXTENSIONS) else js_modules
+        targets = {lookup.get(name) for name in imports}
+        targets.discard(None)
+        targets.discard(path)
+        graph[path] = sorted(targets)
+    return graph
+
+
+def find_dependents(graph, paths, max_depth=MAX_DEPENDENT_DEPTH, limit=MAX_DEPENDENTS):
+    """Breadth-first search of the files importing paths, nearest first."""
+    importers = {}
+    for path, targets in graph.items():
+        for target in targets:
+            importers.setdefault(target, []).append(path)
+
+    seen, found = set(paths), []
+    queue = deque((path, 0) for path in paths)
+    while queue and len(found) < limit:
+        path, depth = queue.popleft()
+        if depth >= max_depth:
+            continue
+        for importer in sorted(importers.get(path, ())):
+            if importer not in seen:
+                seen.add(importer)
+                found.append(importer)
+                queue.append((importer, depth + 1))
+    return found[:limit]
+
+
+def changed_backend_modules(diff):
+    """
+    Paths of the backend source files a Diff changes, in diff order. A filtered Diff is read
+    through its unfiltered source, so files skipped from the prompt for size or content still count.
+    """
+    diff = diff.derived.get("unfiltered", diff)
+    return [file_diff.path for file_diff in diff if is_backend_path(file_diff.path) and not file_diff.generated]
+
+
+def analyze_impact(diff):
+    """
+    Compute the impact set of a Diff without calling the model: the changed backend modules,
+    the symbols changed in each, and the modules that import them. Computed once per Diff.
+    """
+    diff = diff.derived.get("unfiltered", diff)
+    if "impact" in diff.derived:
+        return diff.derived["impact"]
+
+    changed = set(changed_backend_modules(diff))
+    symbols = {file_diff.path: changed_symbols(file_diff) for file_diff in diff if file_diff.path in changed}
+    try:
+        graph = load_import_graph()
+    except (subprocess.CalledProcessError, OSError) as e:
+        print("⚠️ Could not build the import graph:", e)
+        graph = {}
+    dependents = find_dependents(graph, list(symbols))
+
+    analysis = ImpactAnalysis(list(symbols), symbols, dependents)
+    diff.derived["impact"] = analysis
+    return analysis
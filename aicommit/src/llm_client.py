@@ -0,0 +1,366 @@
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from . import ratelimit, telemetry
+from .config import get_api_key
+from .streaming import collect_stream, iter_sse_deltas
+
+# --- CONFIG ---
+# Endpoint and deployment can be overridden, e.g. to point at a local stub server
+AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "https://shrutiaiinstance.openai.azure.com").rstrip("/")
+AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o-mini")
+AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
+
+# Retries with jittered exponential backoff for throttling, server errors and dropped connections
+MAX_RETRIES = int(os.getenv("AICOMMIT_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+# (connect, read) timeouts in seconds for a single attempt
+CONNECT_TIMEOUT = float(os.getenv("AICOMMIT_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("AICOMMIT_READ_TIMEOUT", "60"))
+
+# After this many consecutive failures, calls fail fast until the cool-down has passed
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30.0
+
+# Connections kept alive per host; enough for the concurrent post-commit stage
+POOL_SIZE = 16
+
+
+class LLMError(Exception):
+    """A chat-completion request failed (after retries, where retrying made sense)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(LLMError):
+    """The endpoint failed repeatedly and is not being called until the cool-down passes."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker shared by every call to one endpoint."""
+
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: let a trial request through once the cool-down has passed
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class _Transport:
+    """
+    Pooled keep-alive HTTP client. Uses httpx with HTTP/2 when httpx and h2 are installed,
+    otherwise a requests Session with a connection pool.
+    """
+
+    def __init__(self):
+        try:
+            import h2  # noqa: F401 -- only checks that HTTP/2 support is available
+            import httpx
+            self.httpx = httpx
+            self.client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            )
+        except ImportError:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self.httpx = None
+            self.client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            self.client.mount("https://", adapter)
+            self.client.mount("http://", adapter)
+        self.connection_errors = self._connection_errors()
+
+    def _connection_errors(self):
+        if self.httpx:
+            return (self.httpx.TransportError,)
+        import requests
+        # ChunkedEncodingError: the connection dropped while the body (e.g. a stream) was read
+        return (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+    def post(self, url, headers, body, timeout, stream):
+        connect_timeout, read_timeout = timeout
+        if self.httpx:
+            request = self.client.build_request(
+                "POST", url, headers=headers, content=body,
+                timeout=self.httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+            return self.client.send(request, stream=stream)
+        return self.client.post(url, headers=headers, data=body, timeout=timeout, stream=stream)
+
+    def text(self, response):
+        if self.httpx and not response.is_closed:
+            response.read()
+        return response.text
+
+    def iter_lines(self, response):
+        return response.iter_lines()
+
+
+_TRANSPORT = None
+_TRANSPORT_LOCK = threading.Lock()
+_BREAKERS = {}
+
+
+def get_transport():
+    """Return the process-wide pooled transport, creating it on first use."""
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = _Transport()
+        return _TRANSPORT
+
+
+def _breaker_for(url):
+    base = url.split("?", 1)[0]
+    with _TRANSPORT_LOCK:
+        return _BREAKERS.setdefault(base, CircuitBreaker())
+
+
+def endpoint_available(url):
+    """False while the circuit breaker for url is open."""
+    return _breaker_for(url).allow()
+
+
+def chat_completions_url(deployment=None, endpoint=None):
+    return (f"{endpoint or AZURE_OPENAI_ENDPOINT}/openai/deployments/{deployment or AZURE_OPENAI_DEPLOYMENT}"
+            f"/chat/completions?api-version={AZURE_OPENAI_API_VERSION}")
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def retry_after_delay(headers):
+    """Return the server-requested delay in seconds from Retry-After headers, or None."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value) if value else None
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+class TokenUsage:
+    """Tokens used by the requests made inside a track_usage() block."""
+
+    __slots__ = ("requests", "prompt_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.requests = self.prompt_tokens = self.completion_tokens = 0
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+_USAGE = threading.local()
+
+
+@contextmanager
+def track_usage():
+    """Count the tokens of every request this thread makes inside the block."""
+    usage = TokenUsage()
+    previous = getattr(_USAGE, "current", None)
+    _USAGE.current = usage
+    try:
+        yield usage
+    finally:
+        _USAGE.current = previous
+
+
+def _estimate_tokens(text):
+    # Same rough estimate as chunking.estimate_tokens (4 characters per token)
+    return len(text) // 4 + 1
+
+
+def _record_prompt(body):
+    usage = getattr(_USAGE, "current", None)
+    if usage is not None:
+        # Counted when the request is sent: an abandoned request is still billed for its prompt
+        usage.requests += 1
+        usage.prompt_tokens += _estimate_tokens(body)
+
+
+def _record_completion(body, choices, reported=None):
+    completion_tokens = (reported or {}).get("completion_tokens") or sum(_estimate_tokens(choice) for choice in choices)
+    telemetry.record_tokens((reported or {}).get("prompt_tokens") or _estimate_tokens(body), completion_tokens)
+    usage = getattr(_USAGE, "current", None)
+    if usage is None:
+        return
+    if reported:
+        # Exact counts when the service reports them (non-streamed responses)
+        usage.prompt_tokens += reported.get("prompt_tokens", 0) - _estimate_tokens(body)
+        usage.completion_tokens += reported.get("completion_tokens", 0)
+    else:
+        usage.completion_tokens += sum(_estimate_tokens(choice) for choice in choices)
+
+
+def chat_completion(messages, n=1, stream=False, on_delta=None, output_path=None, deployment=None,
+                    api_key=None, timeout=None, url=None, model=None, headers=None, on_reset=None, **params):
+    """
+    Send a chat-completion request through the shared pooled client.
+    Retries throttled (429), server-error and connection failures with jittered exponential
+    backoff, honouring Retry-After; a per-endpoint circuit breaker fails fast after repeated
+    failures.
+    Args:
+        messages (list): Chat messages.
+        n (int): Number of choices to request.
+        stream (bool): Stream tokens via SSE; on_delta(index, text) is called for each delta.
+        output_path (str): With stream=True and n=1, the text is written there as it arrives.
+        deployment (str): Deployment name (defaults to AZURE_OPENAI_DEPLOYMENT).
+        timeout (tuple): (connect, read) timeout in seconds for each attempt.
+        url (str): Full chat-completions URL, overriding endpoint and deployment.
+        model (str): Model name sent in the body, for OpenAI-compatible servers.
+        headers (dict): Authentication headers replacing Azure's api-key header.
+        on_reset (callable): Called before a streamed request is retried, so the partial text
+            already passed to on_delta can be discarded.
+        **params: Sampling parameters such as temperature and max_tokens.
+    Returns:
+        list: The content of each choice, in choice order.
+    Raises:
+        LLMError: If the request failed after retries, was rejected, or returned a malformed body.
+    """
+    url = url or chat_completions_url(deployment)
+    headers = {"Content-Type": "application/json",
+               **(headers if headers is not None else {"api-key": api_key or get_api_key() or ""})}
+    payload = {"messages": messages, **params}
+    if model:
+        payload["model"] = model
+    if n != 1:
+        payload["n"] = n
+    if stream:
+        payload["stream"] = True
+    body = json.dumps(payload)
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    transport = get_transport()
+    breaker = _breaker_for(url)
+    _record_prompt(body)
+    # Requests to the same deployment share one budget across processes (see ratelimit)
+    budget_key = url.split("?", 1)[0]
+    cost = ratelimit.estimate_cost(body, n, params.get("max_tokens"))
+    with telemetry.span("llm_request", deployment=model or deployment or AZURE_OPENAI_DEPLOYMENT, n=n, stream=stream):
+        last_error = None
+        for attempt in range(MAX_RETRIES + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"circuit open for {url.split('?', 1)[0]} after repeated failures")
+            ratelimit.acquire(budget_key, cost)
+            telemetry.count("llm_requests")
+            if attempt:
+                telemetry.count("llm_retries")
+            if attempt and stream and on_reset:
+                on_reset()
+            try:
+                response = transport.post(url, headers, body, timeout, stream)
+                if response.status_code == 200:
+                    # Reading the body is covered too: a stream can drop halfway through
+                    try:
+                        choices = _read_choices(transport, response, body, n, stream, on_delta, output_path)
+                    finally:
+                        response.close()
+                    breaker.record_success()
+                    return choices
+            except transport.connection_errors as e:
+                telemetry.count("llm_errors", status="connection")
+                breaker.record_failure()
+                last_error = LLMError(f"connection error: {e}")
+                delay = backoff_delay(attempt)
+            else:
+                telemetry.count("llm_errors", status=response.status_code)
+                error = LLMError(f"{response.status_code} {transport.text(response)}", response.status_code)
+                response.close()
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise error
+                # Throttling is not an outage; only server errors count towards the breaker
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                last_error = error
+                delay = retry_after_delay(response.headers)
+                delay = backoff_delay(attempt) if delay is None else min(delay, BACKOFF_MAX_SECONDS * 3)
+                if response.status_code == 429:
+                    # Other processes hold back too instead of getting throttled in turn
+                    ratelimit.block(budget_key, delay)
+
+            if attempt < MAX_RETRIES:
+                time.sleep(delay)
+
+        raise last_error
+
+
+def _read_choices(transport, response, body, n, stream, on_delta, output_path):
+    """Read the choices from a 200 response, streamed or not."""
+    if stream:
+        choices = _collect_streamed_choices(transport.iter_lines(response), n, on_delta, output_path)
+        _record_completion(body, choices)
+        return choices
+    try:
+        data = response.json()
+        choices = [choice["message"]["content"].strip()
+                   for choice in sorted(data["choices"], key=lambda c: c.get("index", 0))]
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+        # A 200 with a body that is not a chat completion (proxy page, truncated JSON)
+        telemetry.count("llm_errors", status="malformed")
+        raise LLMError(f"malformed response body: {e!r}", response.status_code) from e
+    _record_completion(body, choices, data.get("usage"))
+    return choices
+
+
+def _collect_streamed_choices(lines, n, on_delta, output_path):
+    texts = [[] for _ in range(n)]
+
+    def deltas():
+        for index, content in iter_sse_deltas(lines):
+            if index >= len(texts):
+                texts.extend([] for _ in range(index + 1 - len(texts)))
+            texts[index].append(content)
+            if on_delta:
+                on_delta(index, content)
+            yield index, content
+
+    # collect_stream writes the (single) choice to output_path while it streams
+    collect_stream(deltas(), output_path)
+    return ["".join(parts).strip() for parts in texts]
+
+
+def complete(messages, **kwargs):
+    """Convenience wrapper returning the first choice's content."""
+    choices = chat_completion(messages, **kwargs)
+    return choices[0] if choices else ""
@@ -0,0 +1,42 @@
+import os
+import subprocess
+
+_GIT_DIR = None
+
+
+def get_git_dir():
+    """Return the absolute path of the current repository's .git directory, or None."""
+    global _GIT_DIR
+    if _GIT_DIR is None:
+        try:
+            _GIT_DIR = subprocess.check_output(
+                ["git", "rev-parse", "--absolute-git-dir"],
+                stderr=subprocess.DEVNULL
+            ).decode("utf-8").strip()
+        except (subprocess.CalledProcessError, OSError):
+            # Not inside a git repository (or git is not installed)
+            _GIT_DIR = ""
+    return _GIT_DIR or None
+
+
+def get_state_dir(*parts):
+    """
+    Return a directory under `.git/aicommit/` for local tool state, creating it if needed.
+    Returns None when not running inside a git repository.
+    """
+    git_dir = get_git_dir()
+    if not git_dir:
+        return None
+    path = os.path.join(git_dir, "aicommit", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enter_repo(path):
+    """
+    Change the working directory to another repository and forget the cached .git directory,
+    so state and per-repository settings are read from the new one.
+    """
+    global _GIT_DIR
+    os.chdir(path)
+    _GIT_DIR = None
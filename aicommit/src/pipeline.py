@@ -0,0 +1,45 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import ratelimit, telemetry
+
+# Upper bound on how many LLM requests are allowed in flight at the same time
+MAX_CONCURRENT_REQUESTS = int(os.getenv("AICOMMIT_MAX_CONCURRENCY", "3"))
+
+
+def _timed(name, func):
+    """Run func and return its result together with the elapsed wall-clock time."""
+    start = time.perf_counter()
+    try:
+        with telemetry.span(name):
+            return func(), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def run_concurrently(tasks, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Run independent tasks in a thread pool and report the latency of each one.
+    Args:
+        tasks (dict): Mapping of task name to a zero-argument callable.
+        max_workers (int): Maximum number of tasks running at the same time.
+    Returns:
+        dict: Mapping of task name to its result (None if the task failed).
+    """
+    results = {}
+    if not tasks:
+        return results
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as executor:
+        futures = {name: executor.submit(_timed, name, ratelimit.inherit_priority(func)) for name, func in tasks.items()}
+        for name, future in futures.items():
+            result, error, elapsed = future.result()
+            if error is not None:
+                print(f"❌ {name} failed after {elapsed:.2f}s: {error}")
+            else:
+                print(f"⏱️ {name} finished in {elapsed:.2f}s")
+            results[name] = result
+
+    print(f"⏱️ All {len(tasks)} requests finished in {time.perf_counter() - start:.2f}s")
+    return results
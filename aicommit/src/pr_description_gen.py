@@ -1,42 +1,47 @@
 import os
 import subprocess
-import requests
-import json
-from dotenv import load_dotenv
-
-# Load environment variables from .env file (e.g., API keys)
-load_dotenv()
+from .cache import cached_call
+from .config import get_api_key
+from .diffs import Diff, load_diff
+from .llm_client import LLMError
+from .router import cache_label, complete
+from .streaming import STREAMING_ENABLED
+from .summaries import lookup_summaries
 
 # --- CONFIG ---
-# Retrieve OpenAI API key from environment variables
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# The OpenAI API key is read from the environment or .env file on first use (see config)
+
+# The Azure OpenAI endpoint and deployment are configured in llm_client
 
-# Azure OpenAI API endpoint for the GPT-4o-mini chat completion deployment
-AZURE_API_ENDPOINT = (
-    "https://shrutiaiinstance.openai.azure.com/openai/deployments/gpt-4o-mini/chat/completions?api-version=2025-01-01-preview"
-)
+# Bump when the PR description prompt changes so cached responses are not reused
+PR_DESCRIPTION_PROMPT_VERSION = "1"
 
-# Headers for the API request including content type and API key for authentication
-HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": OPENAI_API_KEY
-}
+# File the generated PR description is written to
+PR_DESCRIPTION_PATH = ".github/PR_description.md"
 
 def get_branch_diff_against_master():
-    """Compare current branch against master and return the diff."""
+    """Compare current branch against master and return the parsed diff."""
     try:
-        # Run git diff to get the list of file changes compared to origin/master
-        diff = subprocess.check_output(
-            ["git", "diff", "origin/master...HEAD", "--name-status", "--no-color"]
-        ).decode("utf-8")
-        return diff.strip()
+        # Parse the diff once; the PR description only needs its name-status listing
+        return load_diff(("origin/master...HEAD",))
     except subprocess.CalledProcessError as e:
         # Log error if git diff command fails
         print("Error fetching branch diff against master:", e)
-        return ""
-
-def generate_pr_description(diff_text):
-    """Generate structured PR description using Azure OpenAI."""
+        return Diff(("origin/master...HEAD",), [])
+
+def generate_pr_description(diff, output_path=None):
+    """
+    Generate structured PR description from a parsed Diff using Azure OpenAI.
+    When output_path is given, the description is written there as tokens stream in.
+    """
+    # The prompt lists changed files in `git diff --name-status` form
+    diff_text = diff.name_status()
+    # Per-file summaries already produced by earlier stages (e.g. the commit message) are
+    # added for free; no new model calls are made for them here
+    summaries = lookup_summaries(diff)
+    if summaries:
+        diff_text += "\n\nPer-file summaries:\n" + "\n".join(
+            f"- {path}: {summary}" for path, summary in sorted(summaries.items()))
     # Create a prompt with instructions for the AI to generate a PR description
     prompt = f"""
 You are an expert AI assistant that writes professional and structured GitHub Pull Request descriptions.
@@ -72,37 +77,34 @@ Git Diff to Analyze:
 Now write the PR description following the structure above.
 """
 
-    # Build the payload for the API call including the messaging structure required by the service
-    payload = {
-        "messages": [
-            {"role": "system", "content": "You are a helpful assistant that writes GitHub PR descriptions."},
-            {"role": "user", "content": prompt}
-        ],
+    # Sampling parameters for the request (also part of the response cache key)
+    params = {
         "temperature": 0.7,
         "top_p": 1,
         "frequency_penalty": 0,
         "presence_penalty": 0,
         "max_tokens": 500
     }
-
-    # Send the payload to the Azure OpenAI endpoint to generate the PR description
-    response = requests.post(
-        AZURE_API_ENDPOINT,
-        headers=HEADERS,
-        data=json.dumps(payload)
-    )
-
-    if response.status_code == 200:
-        # Return the generated PR description if the request is successful
-        return response.json()["choices"][0]["message"]["content"].strip()
-    else:
-        # Log any errors returned by the API
-        print("Error from Azure OpenAI API:", response.status_code, response.text)
-        return ""
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant that writes GitHub PR descriptions."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def request_description():
+        # Send the request through the shared pooled client (retries, backoff, circuit breaker)
+        try:
+            return complete("pr_description", messages, stream=STREAMING_ENABLED, output_path=output_path, **params)
+        except LLMError as e:
+            # Log any errors returned by the API
+            print("Error from Azure OpenAI API:", e)
+            return ""
+
+    # Reuse the previous response when the same diff was already described
+    return cached_call(request_description, diff_text, PR_DESCRIPTION_PROMPT_VERSION, cache_label("pr_description"), params)
 
 def generate_description():
     # Ensure that the API key is available in the environment
-    if not OPENAI_API_KEY:
+    if not get_api_key():
         print("❌ AZURE_API_KEY not found in environment or .env file.")
         exit(1)
 
@@ -117,16 +119,20 @@ def generate_description():
 
     print("🤖 Generating PR description using GPT-4o-mini...")
     # Generate a PR description from the diff
-    description = generate_pr_description(diff)
+    # Stream the description into the markdown file while it is generated
+    description = generate_pr_description(diff, PR_DESCRIPTION_PATH)
     # Uncomment the following lines to print the generated description on the console:
     # print("\n--- 📝 Generated PR Description ---\n")
     # print(description)
+    save_pr_description(description)
 
+def save_pr_description(description):
+    """Write the generated PR description to `.github/PR_description.md`."""
     # Ensure the .github directory exists or create it if necessary
     os.makedirs(".github", exist_ok=True)
     
     # Save the generated PR description to a markdown file
-    with open(".github/PR_description.md", "w", encoding="utf-8") as f:
+    with open(PR_DESCRIPTION_PATH, "w", encoding="utf-8") as f:
         f.write(description)
 
     print("\n💾 PR description saved to `.github/PR_DESCRIPTION.md`")
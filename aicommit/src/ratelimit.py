@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from . import telemetry
+
+# --- CONFIG ---
+# Set AICOMMIT_RATE_LIMIT=0 to send requests without consulting the shared budget
+RATE_LIMIT_ENABLED = os.getenv("AICOMMIT_RATE_LIMIT", "1").lower() not in ("0", "false", "no")
+# The deployment's quota; Azure grants 6 requests per minute for every 1,000 tokens per minute
+TOKENS_PER_MINUTE = float(os.getenv("AICOMMIT_TPM", "200000"))
+REQUESTS_PER_MINUTE = float(os.getenv("AICOMMIT_RPM", str(TOKENS_PER_MINUTE * 6 / 1000)))
+# Azure enforces the quota over short windows, so at most this many seconds' worth goes out in a burst
+BURST_SECONDS = 10
+# Share of the burst that background requests leave untouched for interactive ones
+INTERACTIVE_RESERVE = 0.25
+# Azure counts max_tokens against the quota up front; this is assumed when a request sets none
+DEFAULT_COMPLETION_TOKENS = 1000
+# A request that has waited this long is sent anyway and the client's retries take over
+MAX_WAIT_SECONDS = float(os.getenv("AICOMMIT_RATE_LIMIT_MAX_WAIT", "120"))
+POLL_SECONDS = 0.25
+# Waits longer than this are announced, so a queued run does not look hung
+ANNOUNCE_AFTER_SECONDS = 1.0
+# Shared by every aicommit process of this user on the host: CLI runs, CI scripts, batch, daemon
+RATE_LIMIT_DB_PATH = os.getenv(
+    "AICOMMIT_RATE_LIMIT_DB", os.path.join(os.path.expanduser("~"), ".cache", "aicommit", "ratelimit.sqlite"))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# Priority of requests made outside priority(); CI scripts and batch runs set BACKGROUND
+DEFAULT_PRIORITY = os.getenv("AICOMMIT_PRIORITY", INTERACTIVE).lower()
+
+_PRIORITY = threading.local()
+_CONNECTION = [None]
+_DB_LOCK = threading.Lock()
+
+
+def set_default_priority(level):
+    """Use level for every request of this process that does not set its own."""
+    global DEFAULT_PRIORITY
+    if level not in (INTERACTIVE, BACKGROUND):
+        raise ValueError(f"unknown priority {level!r} (choose from {INTERACTIVE}, {BACKGROUND})")
+    DEFAULT_PRIORITY = level
+
+
+def current_priority():
+    return getattr(_PRIORITY, "level", None) or DEFAULT_PRIORITY
+
+
+@contextmanager
+def priority(level):
+    """Send the requests made by this thread inside the block with the given priority."""
+    previous = getattr(_PRIORITY, "level", None)
+    _PRIORITY.level = level
+    try:
+        yield
+    finally:
+        _PRIORITY.level = previous
+
+
+def inherit_priority(func):
+    """Wrap func so it runs with the calling thread's priority (for work handed to a thread pool)."""
+    level = current_priority()
+
+    def run(*args, **kwargs):
+        with priority(level):
+            return func(*args, **kwargs)
+    return run
+
+
+def estimate_cost(body, n=1, max_tokens=None):
+    """Tokens Azure charges a request against the quota: the prompt plus every choice's max_tokens."""
+    # Same rough estimate as chunking.estimate_tokens (4 characters per token)
+    return len(body) // 4 + 1 + n * (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def _connect():
+    if _CONNECTION[0] is None:
+        os.makedirs(os.path.dirname(RATE_LIMIT_DB_PATH), exist_ok=True)
+        # Transactions are explicit (BEGIN IMMEDIATE), so the budget is read and updated atomically
+        connection = sqlite3.connect(RATE_LIMIT_DB_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY, tokens REAL, requests REAL, updated REAL, blocked_until REAL
+            )""")
+        # Interactive requests waiting for budget; background requests hold back while any are listed.
+        # Entries expire, so a process that died while waiting does not block anyone.
+        connection.execute("CREATE TABLE IF NOT EXISTS waiters (id TEXT PRIMARY KEY, key TEXT, expires REAL)")
+        _CONNECTION[0] = connection
+    return _CONNECTION[0]
+
+
+@contextmanager
+def _transaction():
+    with _DB_LOCK:
+        connection = _connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+def _capacity():
+    return TOKENS_PER_MINUTE / 60 * BURST_SECONDS, max(1.0, REQUESTS_PER_MINUTE / 60 * BURST_SECONDS)
+
+
+def _refilled(connection, key, now):
+    """The bucket for key as (tokens, requests, blocked_until), refilled up to now."""
+    token_capacity, request_capacity = _capacity()
+    row = connection.execute("SELECT tokens, requests, updated, blocked_until FROM buckets WHERE key = ?",
+                             (key,)).fetchone()
+    if row is None:
+        return token_capacity, request_capacity, 0.0
+    tokens, requests, updated, blocked_until = row
+    elapsed = max(0.0, now - updated)
+    return (min(token_capacity, tokens + elapsed * TOKENS_PER_MINUTE / 60),
+            min(request_capacity, requests + elapsed * REQUESTS_PER_MINUTE / 60), blocked_until)
+
+
+def _save(connection, key, tokens, requests, now, blocked_until):
+    connection.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                       (key, tokens, requests, now, blocked_until))
+
+
+def _try_take(key, cost, level, waiter):
+    """
+    Take cost tokens and one request from the bucket if the budget allows it.
+    Returns:
+        float: 0 when taken, otherwise roughly how long to wait before trying again.
+    """
+    token_capacity, _ = _capacity()
+    reserve = token_capacity * INTERACTIVE_RESERVE if level == BACKGROUND else 0.0
+    # A request larger than the whole burst goes out once the bucket is full
+    cost = min(cost, token_capacity - reserve)
+    now = time.time()
+    with _transaction() as connection:
+        tokens, requests, blocked_until = _refilled(connection, key, now)
+        connection.execute("DELETE FROM waiters WHERE expires < ?", (now,))
+        if blocked_until > now:
+            wait = blocked_until - now
+        elif level == BACKGROUND and connection.execute(
+                "SELECT 1 FROM waiters WHERE key = ? LIMIT 1", (key,)).fetchone():
+            wait = POLL_SECONDS
+        else:
+            wait = max(0.0, (cost + reserve - tokens) / (TOKENS_PER_MINUTE / 60),
+                       (1 - requests) / (REQUESTS_PER_MINUTE / 60))
+        if wait <= 0:
+            tokens, requests = tokens - cost, requests - 1
+            connection.execute("DELETE FROM waiters WHERE id = ?", (waiter,))
+        elif level == INTERACTIVE:
+            connection.execute("INSERT OR REPLACE INTO waiters VALUES (?, ?, ?)",
+                               (waiter, key, now + min(wait, 1.0) + 4 * POLL_SECONDS))
+        _save(connection, key, tokens, requests, now, blocked_until)
+    return wait
+
+
+def acquire(key, cost, level=None):
+    """
+    Wait until the budget shared by all processes on this host allows a request of about
+    cost tokens to key (an endpoint + deployment URL). Interactive requests go first:
+    background ones leave INTERACTIVE_RESERVE of the burst free and wait while an
+    interactive request is queued. Never raises; if the budget cannot be read the request
+    goes out unthrottled.
+    Returns:
+        float: Seconds spent waiting.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    level = level or current_priority()
+    waiter = f"{os.getpid()}:{threading.get_ident()}:{time.monotonic_ns()}"
+    start = time.monotonic()
+    announced = False
+    while True:
+        try:
+            wait = _try_take(key, cost, level, waiter)
+        except (sqlite3.Error, OSError):
+            break
+        waited = time.monotonic() - start
+        if wait <= 0:
+            break
+        if waited + wait > MAX_WAIT_SECONDS:
+            print(f"⚠️ Still over the shared rate limit after {waited:.0f}s; sending anyway.")
+            break
+        if not announced and waited + wait > ANNOUNCE_AFTER_SECONDS:
+            print(f"⏳ Queued behind the shared rate limit (~{wait:.1f}s, {level})...")
+            announced = True
+        time.sleep(min(wait, 1.0))
+
+    waited = time.monotonic() - start
+    if level == INTERACTIVE and waited > 0:
+        try:
+            with _transaction() as connection:
+                connection.execute("DELETE FROM waiters WHERE id = ?", (waiter,))
+        except (sqlite3.Error, OSError):
+            pass
+    if announced or waited >= POLL_SECONDS:
+        telemetry.count("ratelimit_wait_seconds", waited, priority=level)
+    return waited
+
+
+def block(key, seconds):
+    """
+    The service throttled a request to key (429): hold every process's requests to it for
+    seconds and empty the bucket, so the retry queues behind the limit instead of failing again.
+    """
+    if not RATE_LIMIT_ENABLED or seconds <= 0:
+        return
+    now = time.time()
+    try:
+        with _transaction() as connection:
+            _, requests, blocked_until = _refilled(connection, key, now)
+            _save(connection, key, 0.0, requests, now, max(blocked_until, now + seconds))
+    except (sqlite3.Error, OSError):
+        pass
+    telemetry.count("ratelimit_throttled")
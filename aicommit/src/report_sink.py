@@ -0,0 +1,222 @@
+import contextlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from .llm_client import backoff_delay
+from .paths import get_state_dir
+
+# --- CONFIG ---
+# Where impact-report rows end up: "google" (Google Sheets), "file" (local JSONL, for testing)
+# or "none" (rows stay in the local queue)
+REPORT_SINK = os.getenv("AICOMMIT_REPORT_SINK", "google").lower()
+# Target file of the "file" sink
+REPORT_SINK_PATH = os.getenv("AICOMMIT_REPORT_SINK_PATH", ".github/impact_rows.jsonl")
+# Google Sheet the rows are appended to, and the service account key used to open it
+GOOGLE_SHEET_KEY = "1D4pbXFL6Uh6Zu1W7ZPfHFuHzy96Fx5Ok7_pKFfEVwGY"
+GOOGLE_CREDENTIALS_PATH = os.path.join(os.path.dirname(__file__), "google_credentials.json")
+GOOGLE_SCOPES = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive"
+]
+# Rows sent per append_rows call
+FLUSH_BATCH_SIZE = 500
+# Attempts per batch before the rows are left queued for the next flush
+SINK_MAX_RETRIES = 4
+# A flush lock older than this is assumed to belong to a crashed flusher
+STALE_LOCK_SECONDS = 600
+# Rows that could not be sent are dropped from the queue beyond this count or age; every row is
+# also in the local report store (see report_store), so nothing is lost locally
+QUEUE_MAX_ROWS = int(os.getenv("AICOMMIT_REPORT_QUEUE_MAX_ROWS", "5000"))
+QUEUE_MAX_AGE_SECONDS = float(os.getenv("AICOMMIT_REPORT_QUEUE_MAX_DAYS", "30")) * 24 * 60 * 60
+
+QUEUE_DB_NAME = "report_queue.sqlite"
+FLUSH_LOCK_NAME = "report_flush.lock"
+FLUSH_LOG_NAME = "report_flush.log"
+
+
+class FileSink:
+    """Appends rows as JSON lines to a local file; used for testing and offline setups."""
+
+    def __init__(self, path=REPORT_SINK_PATH):
+        self.path = path
+
+    def append_rows(self, rows):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+class GoogleSheetSink:
+    """
+    Appends rows to the report Google Sheet. The authorized client and the worksheet are
+    created once and reused for every batch.
+    """
+
+    def __init__(self, sheet_key=GOOGLE_SHEET_KEY, credentials_path=GOOGLE_CREDENTIALS_PATH):
+        self.sheet_key = sheet_key
+        self.credentials_path = credentials_path
+        self._worksheet = None
+
+    def worksheet(self):
+        if self._worksheet is None:
+            import gspread
+            from oauth2client.service_account import ServiceAccountCredentials
+            creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_path, GOOGLE_SCOPES)
+            self._worksheet = gspread.authorize(creds).open_by_key(self.sheet_key).sheet1
+        return self._worksheet
+
+    def append_rows(self, rows):
+        try:
+            self.worksheet().append_rows(rows, value_input_option="RAW")
+        except Exception:
+            # Re-authorize on the next attempt in case the token or connection went stale
+            self._worksheet = None
+            raise
+
+
+def get_sink(name=None):
+    """Return the configured sink, or None when rows should only be queued."""
+    name = name or REPORT_SINK
+    if name == "google":
+        # Without a service account key every flush would fail after its retries
+        return GoogleSheetSink() if os.path.exists(GOOGLE_CREDENTIALS_PATH) else None
+    if name == "file":
+        return FileSink()
+    return None
+
+
+def _connect():
+    state_dir = get_state_dir()
+    if not state_dir:
+        return None
+    connection = sqlite3.connect(os.path.join(state_dir, QUEUE_DB_NAME), timeout=10)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS rows (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, queued_at REAL NOT NULL)"
+    )
+    return connection
+
+
+def enqueue_row(row):
+    """
+    Durably queue one report row. This is a single local SQLite insert, so committing never
+    waits for the spreadsheet API.
+    Returns:
+        bool: True if the row was queued.
+    """
+    connection = _connect()
+    if connection is None:
+        return False
+    now = time.time()
+    with connection:
+        connection.execute("INSERT INTO rows (row, queued_at) VALUES (?, ?)", (json.dumps(row), now))
+        dropped = connection.execute("DELETE FROM rows WHERE queued_at < ?", (now - QUEUE_MAX_AGE_SECONDS,)).rowcount
+        dropped += connection.execute(
+            "DELETE FROM rows WHERE id <= (SELECT MAX(id) FROM rows) - ?", (QUEUE_MAX_ROWS,)
+        ).rowcount
+    connection.close()
+    if dropped:
+        print(f"⚠️ Dropped {dropped} unsent report row(s) from the queue (they stay in the local report store)")
+    return True
+
+
+def queued_count():
+    connection = _connect()
+    if connection is None:
+        return 0
+    count = connection.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+    connection.close()
+    return count
+
+
+def _acquire_flush_lock(lock_path):
+    """Create the flush lock file; returns False if another flusher holds it."""
+    try:
+        if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+            os.remove(lock_path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def _send_with_retries(sink, rows):
+    for attempt in range(SINK_MAX_RETRIES + 1):
+        try:
+            sink.append_rows(rows)
+            return True
+        except Exception as e:
+            print(f"⚠️ Report sink attempt {attempt + 1} failed: {e}")
+            if attempt < SINK_MAX_RETRIES:
+                time.sleep(backoff_delay(attempt + 1))
+    return False
+
+
+def flush_queue(sink=None, batch_size=FLUSH_BATCH_SIZE):
+    """
+    Send queued rows to the sink in batches with append_rows, oldest first.
+    Rows are removed from the queue only after their batch was accepted; a batch that still
+    fails after retries stays queued for the next flush. Only one flusher runs at a time.
+    Returns:
+        int: Number of rows sent.
+    """
+    sink = sink or get_sink()
+    state_dir = get_state_dir()
+    if sink is None or not state_dir:
+        return 0
+    lock_path = os.path.join(state_dir, FLUSH_LOCK_NAME)
+    if not _acquire_flush_lock(lock_path):
+        return 0
+
+    sent = 0
+    connection = _connect()
+    try:
+        while True:
+            batch = connection.execute("SELECT id, row FROM rows ORDER BY id LIMIT ?", (batch_size,)).fetchall()
+            if not batch:
+                break
+            if not _send_with_retries(sink, [json.loads(row) for _, row in batch]):
+                break
+            with connection:
+                connection.execute("DELETE FROM rows WHERE id <= ?", (batch[-1][0],))
+            sent += len(batch)
+    finally:
+        connection.close()
+        # Another flusher may have removed it as stale; that must not replace the real error
+        with contextlib.suppress(OSError):
+            os.remove(lock_path)
+    if sent:
+        print(f"✅ {sent} summary row(s) added to the report sheet.")
+    return sent
+
+
+def start_background_flush():
+    """
+    Flush the queue in a detached process so the caller returns immediately.
+    Output goes to .git/aicommit/report_flush.log.
+    Returns:
+        bool: True if a flush was started (False without a usable sink).
+    """
+    state_dir = get_state_dir()
+    if not state_dir or get_sink() is None:
+        return False
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.getenv("PYTHONPATH")])))
+    with open(os.path.join(state_dir, FLUSH_LOG_NAME), "a", encoding="utf-8") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "src.report_sink"],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env,
+            # Detach so the flush survives the aicommit process exiting
+            start_new_session=True,
+        )
+    return True
+
+
+if __name__ == "__main__":
+    flush_queue()
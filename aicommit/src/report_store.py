@@ -0,0 +1,323 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from .paths import get_git_dir, get_state_dir
+
+# --- CONFIG ---
+# Append-only SQLite store of impact-report rows under .git/aicommit/ (the system of record)
+REPORT_DB_NAME = "reports.sqlite"
+# Default target of the on-demand XLSX export, and the workbook rows used to be appended to;
+# its existing rows are imported into the store once so an export never loses them
+REPORT_XLSX_PATH = ".github/PR_Report.xlsx"
+REPORT_COLUMNS = ["Date", "GitHub Username", "Commit Message", "Impacted Backend Modules"]
+# Separators between module names in extract_backend_modules output
+MODULE_SEPARATORS = re.compile(r"[,;\n]")
+# Leading list markers and surrounding quotes/backticks the model sometimes adds
+MODULE_DECORATION = re.compile(r"^(?:[-*•]|\d+[.)])\s+|^[`'\"]+|[`'\"]+$")
+# Model answers that mean "no modules" (compared case-insensitively)
+EMPTY_MODULE_NAMES = {"", "none", "n/a", "na", "-"}
+# Bump when normalize_module_name changes; stores indexed with older rules are reindexed on open
+MODULE_RULES_VERSION = "2"
+# Buckets for time-window aggregations, as SQLite expressions over the "YYYY-MM-DD HH:MM" date
+PERIOD_EXPRESSIONS = {
+    "day": "substr(r.date, 1, 10)",
+    "week": "strftime('%Y-W%W', substr(r.date, 1, 10))",
+    "month": "substr(r.date, 1, 7)",
+    "year": "substr(r.date, 1, 4)",
+}
+
+
+def connect_report_store():
+    """Open the report store, creating it if needed; returns None outside a git repository."""
+    state_dir = get_state_dir()
+    if not state_dir:
+        return None
+    connection = sqlite3.connect(os.path.join(state_dir, REPORT_DB_NAME), timeout=10)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            username TEXT NOT NULL,
+            commit_message TEXT NOT NULL,
+            modules TEXT NOT NULL,
+            recorded_at REAL NOT NULL,
+            analysis TEXT
+        )
+    """)
+    # Stores created before the static analysis was kept have no analysis column
+    if "analysis" not in {column[1] for column in connection.execute("PRAGMA table_info(reports)")}:
+        connection.execute("ALTER TABLE reports ADD COLUMN analysis TEXT")
+    # Deduplicated module vocabulary and the commit <-> module links used by `aicommit stats`
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS modules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS report_modules (
+            module_id INTEGER NOT NULL,
+            report_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (module_id, report_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS report_modules_report ON report_modules (report_id);
+        CREATE INDEX IF NOT EXISTS report_modules_date ON report_modules (date, module_id);
+        CREATE INDEX IF NOT EXISTS reports_date ON reports (date);
+        CREATE INDEX IF NOT EXISTS reports_username ON reports (username, date);
+        CREATE TABLE IF NOT EXISTS store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    import_legacy_workbook(connection)
+    rules = connection.execute("SELECT value FROM store_meta WHERE key = 'module_rules'").fetchone()
+    if not rules or rules[0] != MODULE_RULES_VERSION:
+        reindex_modules(connection)
+    return connection
+
+
+def _read_workbook_rows(path):
+    """Return the data rows of an impact-report workbook as [date, username, commit message, modules]."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    rows = []
+    for values in workbook.active.iter_rows(values_only=True):
+        values = list(values[:len(REPORT_COLUMNS)]) + [None] * (len(REPORT_COLUMNS) - len(values))
+        if values == REPORT_COLUMNS or not any(values):
+            continue
+        # Excel may have turned the "YYYY-MM-DD HH:MM" strings into dates
+        if isinstance(values[0], datetime):
+            values[0] = values[0].strftime("%Y-%m-%d %H:%M")
+        rows.append(["" if value is None else str(value) for value in values])
+    workbook.close()
+    return rows
+
+
+def import_legacy_workbook(connection):
+    """
+    Import the rows of the repository's existing .github/PR_Report.xlsx into the store, once.
+    Rows already in the store (e.g. from an earlier export) are not added again.
+    Returns:
+        int: Number of rows imported.
+    """
+    if connection.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_xlsx_imported'").fetchone():
+        return 0
+    git_dir = get_git_dir()
+    path = os.path.join(os.path.dirname(git_dir), REPORT_XLSX_PATH) if git_dir else None
+    rows = []
+    if path and os.path.exists(path):
+        try:
+            rows = _read_workbook_rows(path)
+        except ImportError:
+            # Without openpyxl the import is retried on a later run instead of being skipped for good
+            return 0
+        except Exception as e:
+            print(f"⚠️ Could not import `{REPORT_XLSX_PATH}` into the report store: {e}")
+            return 0
+
+    imported = 0
+    # IMMEDIATE so two processes opening a new store do not both import the workbook
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if not connection.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_xlsx_imported'").fetchone():
+            for date, username, commit_message, modules in rows:
+                if connection.execute(
+                    "SELECT 1 FROM reports WHERE date = ? AND username = ? AND commit_message = ? AND modules = ?",
+                    (date, username, commit_message, modules),
+                ).fetchone():
+                    continue
+                cursor = connection.execute(
+                    "INSERT INTO reports (date, username, commit_message, modules, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                    (date, username, commit_message, modules, time.time()),
+                )
+                _link_modules(connection, cursor.lastrowid, date, modules)
+                imported += 1
+            connection.execute("INSERT INTO store_meta (key, value) VALUES ('legacy_xlsx_imported', ?)",
+                               (str(imported),))
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    if imported:
+        print(f"📥 Imported {imported} row(s) from `{REPORT_XLSX_PATH}` into the report store")
+    return imported
+
+
+def normalize_module_name(name):
+    """
+    Canonical form of one module name from the model, so "`UserService`", "- UserService"
+    and "UserService()" count as the same module. Case is kept: only decoration, separators
+    and whitespace are normalized.
+    """
+    name = " ".join(name.split())
+    previous = None
+    while previous != name:
+        previous, name = name, MODULE_DECORATION.sub("", name).strip()
+    name = name.replace("\\", "/").rstrip(".")
+    if name.endswith("()"):
+        name = name[:-2]
+    return name
+
+
+def parse_module_names(module_summary):
+    """Split extract_backend_modules output into sorted, deduplicated normalized module names."""
+    names = {normalize_module_name(part) for part in MODULE_SEPARATORS.split(module_summary or "")}
+    return sorted(name for name in names if name.lower() not in EMPTY_MODULE_NAMES)
+
+
+def _link_modules(connection, report_id, date, module_summary):
+    for name in parse_module_names(module_summary):
+        connection.execute("INSERT OR IGNORE INTO modules (name) VALUES (?)", (name,))
+        # The date is copied onto the link so module aggregations over a time window are
+        # answered from the link table's indexes without touching the reports table
+        connection.execute(
+            "INSERT OR IGNORE INTO report_modules (module_id, report_id, date) "
+            "SELECT id, ?, ? FROM modules WHERE name = ?",
+            (report_id, date, name),
+        )
+
+
+def append_report_row(date, username, commit_message, module_summary, analysis=None):
+    """
+    Append one impact-report row. A single insert, so the cost does not grow with history.
+    analysis (dict, optional) is the static impact analysis (changed symbols and dependent
+    modules), stored as JSON alongside the row; it is not part of the XLSX or Sheets columns.
+    Returns:
+        bool: True if the row was stored.
+    """
+    connection = connect_report_store()
+    if connection is None:
+        return False
+    with connection:
+        cursor = connection.execute(
+            "INSERT INTO reports (date, username, commit_message, modules, recorded_at, analysis) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (date, username, commit_message, module_summary or "", time.time(),
+             json.dumps(analysis) if analysis is not None else None),
+        )
+        _link_modules(connection, cursor.lastrowid, date, module_summary)
+    connection.close()
+    return True
+
+
+def reindex_modules(connection):
+    """Rebuild the module vocabulary and links from the stored rows (e.g. after a rule change)."""
+    with connection:
+        connection.execute("DELETE FROM report_modules")
+        connection.execute("DELETE FROM modules")
+        for report_id, date, module_summary in connection.execute("SELECT id, date, modules FROM reports").fetchall():
+            _link_modules(connection, report_id, date, module_summary)
+        connection.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('module_rules', ?)",
+                           (MODULE_RULES_VERSION,))
+
+
+def _window(since=None, until=None, column="r.date"):
+    """SQL condition and parameters restricting column to [since, until]."""
+    conditions, params = [], []
+    if since:
+        conditions.append(f"{column} >= ?")
+        params.append(since)
+    if until:
+        # Dates are "YYYY-MM-DD HH:MM"; a bare day includes the whole day
+        conditions.append(f"{column} <= ?")
+        params.append(until if len(until) > 10 else until + " 99:99")
+    return (" AND ".join(conditions) or "1"), params
+
+
+def top_modules(connection, since=None, until=None, limit=10):
+    """Return [(module, commit count, last date)] for the modules changed most often."""
+    where, params = _window(since, until, column="date")
+    return connection.execute(f"""
+        SELECT m.name, counts.commits, counts.last_date
+        FROM (
+            SELECT module_id, COUNT(*) AS commits, MAX(date) AS last_date
+            FROM report_modules WHERE {where} GROUP BY module_id
+        ) counts
+        JOIN modules m ON m.id = counts.module_id
+        ORDER BY counts.commits DESC, m.name LIMIT ?
+    """, (*params, limit)).fetchall()
+
+
+def commits_for_module(connection, module, since=None, until=None, limit=50):
+    """Return [(date, username, commit message)] for commits that touched module, newest first."""
+    where, params = _window(since, until)
+    return connection.execute(f"""
+        SELECT r.date, r.username, r.commit_message
+        FROM modules m
+        JOIN report_modules rm ON rm.module_id = m.id
+        JOIN reports r ON r.id = rm.report_id
+        WHERE m.name = ? AND {where}
+        ORDER BY r.date DESC LIMIT ?
+    """, (normalize_module_name(module), *params, limit)).fetchall()
+
+
+def modules_for_author(connection, username, since=None, until=None, limit=50):
+    """Return [(module, commit count)] for the modules an author changed, most frequent first."""
+    where, params = _window(since, until)
+    return connection.execute(f"""
+        SELECT m.name, COUNT(*) AS commits
+        FROM reports r
+        JOIN report_modules rm ON rm.report_id = r.id
+        JOIN modules m ON m.id = rm.module_id
+        WHERE r.username = ? AND {where}
+        GROUP BY rm.module_id ORDER BY commits DESC, m.name LIMIT ?
+    """, (username, *params, limit)).fetchall()
+
+
+def commits_per_period(connection, period="month", since=None, until=None, module=None):
+    """Return [(period, commit count)] in time order, optionally only for one module."""
+    where, params = _window(since, until)
+    bucket = PERIOD_EXPRESSIONS[period]
+    if module:
+        return connection.execute(f"""
+            SELECT {bucket} AS period, COUNT(*)
+            FROM modules m
+            JOIN report_modules rm ON rm.module_id = m.id
+            JOIN reports r ON r.id = rm.report_id
+            WHERE m.name = ? AND {where}
+            GROUP BY period ORDER BY period
+        """, (normalize_module_name(module), *params)).fetchall()
+    return connection.execute(f"""
+        SELECT {bucket} AS period, COUNT(*) FROM reports r WHERE {where} GROUP BY period ORDER BY period
+    """, params).fetchall()
+
+
+def iter_report_rows(connection):
+    """Yield stored rows in date order as [date, username, commit message, modules]."""
+    # By date first: rows imported from an existing workbook can be stored after newer ones
+    for row in connection.execute("SELECT date, username, commit_message, modules FROM reports ORDER BY date, id"):
+        yield list(row)
+
+
+def export_report_xlsx(path=REPORT_XLSX_PATH):
+    """
+    Write every stored row to an XLSX file in one pass.
+    Uses openpyxl's write-only mode, which streams rows to disk instead of building the whole
+    workbook in memory.
+    Returns:
+        int: Number of rows exported.
+    """
+    from openpyxl import Workbook
+
+    connection = connect_report_store()
+    if connection is None:
+        return 0
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(REPORT_COLUMNS)
+    count = 0
+    for row in iter_report_rows(connection):
+        sheet.append(row)
+        count += 1
+    connection.close()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Save next to the target first so an interrupted export never leaves a broken file
+    tmp_path = path + ".tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    return count
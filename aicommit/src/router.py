@@ -0,0 +1,301 @@
+import json
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import ratelimit, telemetry
+from .cache import record_answer
+from .llm_client import AZURE_OPENAI_DEPLOYMENT, LLMError, chat_completion as send_chat_completion
+from .llm_client import chat_completions_url, endpoint_available
+
+# --- CONFIG ---
+# A smaller Azure deployment for quick tasks, e.g. gpt-4.1-nano (AICOMMIT_DRAFT_DEPLOYMENT also works)
+SMALL_DEPLOYMENT = os.getenv("AICOMMIT_SMALL_DEPLOYMENT") or os.getenv("AICOMMIT_DRAFT_DEPLOYMENT") or None
+# Any OpenAI-compatible server (Ollama, llama.cpp, vLLM, LM Studio), e.g. http://127.0.0.1:11434/v1
+LOCAL_ENDPOINT = os.getenv("AICOMMIT_LOCAL_ENDPOINT", "").rstrip("/")
+LOCAL_MODEL = os.getenv("AICOMMIT_LOCAL_MODEL", "qwen2.5-coder:7b")
+LOCAL_API_KEY = os.getenv("AICOMMIT_LOCAL_API_KEY", "")
+# Prompts above this go to a larger model; small local models have short context windows
+LOCAL_MAX_PROMPT_TOKENS = int(os.getenv("AICOMMIT_LOCAL_MAX_PROMPT_TOKENS", "6000"))
+# Most local servers ignore `n`, so that many choices are requested one by one (in parallel)
+LOCAL_MAX_CHOICES = int(os.getenv("AICOMMIT_LOCAL_MAX_CHOICES", "1"))
+
+# Backends to try per task, best first; unconfigured ones are skipped. Override one task with
+# e.g. AICOMMIT_ROUTE_COMMIT_MESSAGE=azure,local
+ROUTES = {
+    # Short outputs from small prompts: a small model is good enough and much faster
+    "commit_message": ("local", "azure-small", "azure"),
+    "commit_draft": ("local", "azure-small", "azure"),
+    "chunk_summary": ("local", "azure-small", "azure"),
+    "file_summary": ("local", "azure-small", "azure"),
+    # Long narratives read by reviewers: the large model, a local one only as a fallback
+    "pr_description": ("azure", "local"),
+    "impact_report": ("azure", "local"),
+}
+DEFAULT_ROUTE = ("azure", "local")
+
+# Set AICOMMIT_HEDGE=0 to only fail over after an error, never race a slow backend
+HEDGING_ENABLED = os.getenv("AICOMMIT_HEDGE", "1").lower() not in ("0", "false", "no")
+# Without enough latency history, the next backend is started after this many seconds
+HEDGE_AFTER_SECONDS = float(os.getenv("AICOMMIT_HEDGE_AFTER", "20"))
+MIN_HEDGE_SECONDS = 2.0
+# A backend whose p95 is this many times the next one's is tried after it
+SLOW_FACTOR = 2.0
+# Rolling latency window per backend and task, shared by every process of this user
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 5
+LATENCY_PATH = os.getenv("AICOMMIT_LATENCY_PATH",
+                         os.path.join(os.path.expanduser("~"), ".cache", "aicommit", "latency.json"))
+
+
+class Backend:
+    """One chat-completions endpoint: Azure OpenAI (deployment in the URL) or OpenAI-compatible (model in the body)."""
+
+    def __init__(self, name, url, model=None, api_key=None, max_prompt_tokens=None, max_choices=128, label=None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_choices = max_choices
+        # Identifies the model, e.g. in cache keys: responses of different models are not interchangeable
+        self.label = label or (f"{name}:{model}" if model else name)
+
+    def request(self, messages, n, api_key, **kwargs):
+        """Send one request; asks for at most max_choices choices per call and merges the results."""
+        if self.model:
+            # OpenAI-compatible: bearer token (if any) instead of Azure's api-key header
+            kwargs.update(model=self.model, headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else {},
+                          api_key=None)
+        else:
+            kwargs["api_key"] = api_key
+        if n <= self.max_choices:
+            return send_chat_completion(messages, n=n, url=self.url, **kwargs)
+
+        on_delta = kwargs.pop("on_delta", None)
+        batches = [(start, min(self.max_choices, n - start)) for start in range(0, n, self.max_choices)]
+
+        def batch(start, size):
+            # Keep choice indices unique across the batches for live rendering
+            offset = (lambda index, text: on_delta(start + index, text)) if on_delta else None
+            return send_chat_completion(messages, n=size, url=self.url, on_delta=offset, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            futures = [executor.submit(ratelimit.inherit_priority(batch), start, size) for start, size in batches]
+            return [choice for future in futures for choice in future.result()]
+
+
+_BACKENDS = None
+_LATENCY = None
+_LATENCY_LOCK = threading.Lock()
+
+
+def get_backends():
+    """Configured backends by name."""
+    global _BACKENDS
+    if _BACKENDS is None:
+        backends = {"azure": Backend("azure", chat_completions_url(), label=AZURE_OPENAI_DEPLOYMENT)}
+        if SMALL_DEPLOYMENT:
+            backends["azure-small"] = Backend("azure-small", chat_completions_url(SMALL_DEPLOYMENT),
+                                              label=SMALL_DEPLOYMENT)
+        if LOCAL_ENDPOINT:
+            backends["local"] = Backend("local", f"{LOCAL_ENDPOINT}/chat/completions", LOCAL_MODEL, LOCAL_API_KEY,
+                                        LOCAL_MAX_PROMPT_TOKENS, LOCAL_MAX_CHOICES)
+        _BACKENDS = backends
+    return _BACKENDS
+
+
+def route_names(task):
+    override = os.getenv(f"AICOMMIT_ROUTE_{task.upper()}")
+    if override:
+        return tuple(name.strip() for name in override.split(",") if name.strip())
+    return ROUTES.get(task, DEFAULT_ROUTE)
+
+
+def cache_label(task):
+    """What cached responses for task are keyed by: the backend the task prefers."""
+    backends = get_backends()
+    for name in route_names(task):
+        if name in backends:
+            return backends[name].label
+    return AZURE_OPENAI_DEPLOYMENT
+
+
+# --- latency history ---
+
+def _load_latency():
+    try:
+        with open(LATENCY_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _latency_samples(key):
+    global _LATENCY
+    with _LATENCY_LOCK:
+        if _LATENCY is None:
+            _LATENCY = _load_latency()
+        return list(_LATENCY.get(key, ()))
+
+
+def record_latency(backend, task, seconds):
+    """Add a successful request's duration to the shared rolling window."""
+    global _LATENCY
+    key = f"{backend.label}/{task}"
+    with _LATENCY_LOCK:
+        # Merge with what other processes recorded since this one loaded the file
+        latest = _load_latency()
+        latest[key] = (latest.get(key, []) + [round(seconds, 3)])[-LATENCY_WINDOW:]
+        _LATENCY = latest
+        try:
+            os.makedirs(os.path.dirname(LATENCY_PATH), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(LATENCY_PATH), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(latest, f)
+            os.replace(temp_path, LATENCY_PATH)
+        except OSError:
+            pass
+
+
+def p95_latency(backend, task):
+    """Rolling p95 latency of backend for task in seconds, or None without enough history."""
+    samples = sorted(_latency_samples(f"{backend.label}/{task}"))
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    return samples[math.ceil(0.95 * len(samples)) - 1]
+
+
+# --- routing ---
+
+def route(task, prompt_tokens=0):
+    """
+    Backends to try for task, in order: the task's route without unconfigured backends,
+    backends whose context is too small for the prompt and endpoints with an open circuit;
+    a backend is moved behind the next one when its p95 latency is SLOW_FACTOR times worse.
+    """
+    backends = get_backends()
+    candidates = [backends[name] for name in route_names(task) if name in backends]
+    usable = [backend for backend in candidates
+              if (backend.max_prompt_tokens is None or prompt_tokens <= backend.max_prompt_tokens)
+              and endpoint_available(backend.url)]
+    # Rather try a failing endpoint than none at all
+    usable = usable or candidates[-1:] or [backends["azure"]]
+    for index in range(len(usable) - 1):
+        slow, fast = p95_latency(usable[index], task), p95_latency(usable[index + 1], task)
+        if slow is not None and fast is not None and slow > SLOW_FACTOR * fast:
+            usable[index], usable[index + 1] = usable[index + 1], usable[index]
+    return usable
+
+
+def _hedge_delay(backend, task):
+    p95 = p95_latency(backend, task)
+    return max(MIN_HEDGE_SECONDS, p95) if p95 is not None else HEDGE_AFTER_SECONDS
+
+
+def chat_completion(task, messages, n=1, stream=False, on_delta=None, output_path=None, api_key=None,
+                    on_reset=None, **params):
+    """
+    llm_client.chat_completion for a task, sent to the backends route(task) picks.
+    When a backend fails, the next one is tried (failover). When it has not answered within
+    its p95 latency for the task, the next one is started too and the first answer wins
+    (hedging; not for streamed requests, whose output is already on screen).
+    Before a streamed failover, on_reset is called and output_path is emptied, so the partial
+    answer of the failed backend is not mixed with the new one. The backend that answered is
+    reported to the response cache (see cache.cached_call).
+    Returns:
+        list: The content of each choice.
+    Raises:
+        LLMError: If every backend failed.
+    """
+    prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+    backends = route(task, prompt_tokens)
+    # on_reset also reaches llm_client, which calls it before retrying a dropped stream
+    kwargs = dict(stream=stream, on_delta=on_delta, output_path=output_path, on_reset=on_reset, **params)
+
+    def attempt(backend, first):
+        def call():
+            if not first and (stream or output_path):
+                if on_reset:
+                    on_reset()
+                if output_path and os.path.exists(output_path):
+                    open(output_path, "w").close()
+            start = time.perf_counter()
+            with telemetry.span("backend_request", backend=backend.label, task=task):
+                choices = backend.request(messages, n, api_key, **kwargs)
+            record_latency(backend, task, time.perf_counter() - start)
+            return choices
+        return call
+
+    if len(backends) == 1:
+        backend = backends[0]
+        try:
+            choices = attempt(backend, True)()
+        except LLMError:
+            raise
+        except Exception as e:
+            # Same contract as with several backends (see _first_answer): callers handle LLMError
+            raise LLMError(f"{backend.name} failed: {e}") from e
+    else:
+        hedge = HEDGING_ENABLED and not (stream or output_path)
+        attempts = [(backend, attempt(backend, index == 0)) for index, backend in enumerate(backends)]
+        backend, choices = _first_answer(task, attempts, hedge)
+    if choices:
+        record_answer(cache_label(task), backend.label)
+    return choices
+
+
+def _first_answer(task, attempts, hedge):
+    """
+    Run attempts (backend, call) one after another on failure, or overlapping when hedging.
+    Returns:
+        tuple: (backend that answered, its choices); (None, []) if none returned anything.
+    """
+    answers = queue.Queue()
+
+    def start(index):
+        backend, call = attempts[index]
+        call = ratelimit.inherit_priority(call)
+
+        def run():
+            try:
+                answers.put((index, call(), None))
+            except Exception as e:
+                answers.put((index, None, e))
+        # Daemon thread: the losing request of a hedge never keeps the process alive
+        threading.Thread(target=run, name=f"{backend.name} {task}", daemon=True).start()
+
+    start(0)
+    started, pending, last_error = 1, 1, None
+    while pending:
+        timeout = _hedge_delay(attempts[started - 1][0], task) if hedge and started < len(attempts) else None
+        try:
+            index, choices, error = answers.get(timeout=timeout)
+        except queue.Empty:
+            print(f"🐢 {attempts[started - 1][0].name} is slow for {task}; also asking {attempts[started][0].name}...")
+            telemetry.count("router_hedges", task=task)
+            start(started)
+            started, pending = started + 1, pending + 1
+            continue
+        pending -= 1
+        if error is None and choices:
+            return attempts[index][0], choices
+        last_error = error or last_error
+        if started < len(attempts) and not pending:
+            reason = f"failed ({error})" if error else "returned nothing"
+            print(f"⚠️ {attempts[index][0].name} {reason}; trying {attempts[started][0].name}...")
+            telemetry.count("router_failovers", task=task)
+            start(started)
+            started, pending = started + 1, pending + 1
+    if last_error:
+        raise last_error if isinstance(last_error, LLMError) else LLMError(str(last_error))
+    return None, []
+
+
+def complete(task, messages, **kwargs):
+    """Like llm_client.complete: the first choice's content, from the backends picked for task."""
+    choices = chat_completion(task, messages, **kwargs)
+    return choices[0] if choices else ""
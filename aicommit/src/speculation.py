@@ -0,0 +1,172 @@
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from . import ratelimit
+from .diffs import load_diff
+from .filters import filter_diff
+from .llm_client import track_usage
+from .paths import get_state_dir
+
+# --- CONFIG ---
+# Set AICOMMIT_SPECULATE=0 to only start the PR description and impact report after the commit
+SPECULATION_ENABLED = os.getenv("AICOMMIT_SPECULATE", "1").lower() not in ("0", "false", "no")
+# Running totals of speculative tokens used and wasted, under .git/aicommit/
+SPECULATION_STATS_FILE = "speculation.json"
+
+
+class SpeculativeTask:
+    """
+    A report generated in the background from the staged diff, before the commit exists.
+    Runs in a daemon thread so an abandoned request never keeps the process alive.
+    """
+
+    def __init__(self, name, diff, func):
+        self.name = name
+        self.diff = diff
+        self.result = None
+        self.error = None
+        self.usage = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(func,), name=f"speculative {name}", daemon=True).start()
+
+    def _run(self, func):
+        try:
+            # Speculative reports must never hold up an interactive request for the shared budget
+            with track_usage() as usage, ratelimit.priority(ratelimit.BACKGROUND):
+                self.usage = usage
+                self.result = func()
+        except Exception as e:
+            # Kept for later: printing here would break into the message prompt
+            self.error = e
+        finally:
+            self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        return self.result
+
+    @property
+    def tokens(self):
+        return self.usage.total_tokens if self.usage else 0
+
+
+class Speculation:
+    """The speculative tasks of one run; each is either adopted after the commit or wasted."""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.adopted = set()
+        self.finished = False
+
+    def adopt(self, name, diff, fallback):
+        """
+        Return a callable waiting for the speculative result of name, or None when there is
+        no such task or it was started from a different diff (e.g. a hook changed the commit).
+        If the speculative request failed or returned nothing, the callable runs fallback (the
+        normal post-commit request) instead.
+        """
+        task = self.tasks.get(name)
+        if task is None or task.diff.text != diff.text:
+            return None
+        self.adopted.add(name)
+
+        def result():
+            if task.wait():
+                return task.result
+            # Its tokens were spent for nothing
+            self.adopted.discard(name)
+            reason = f"failed: {task.error}" if task.error else "returned nothing"
+            print(f"⚠️ Speculative {name} {reason}; requesting it again...")
+            return fallback()
+        return result
+
+    def finish(self):
+        """Record the tokens of adopted tasks as used and of every other task as wasted."""
+        if self.finished or not self.tasks:
+            return
+        self.finished = True
+        # Adopted results were waited for; abandoned ones count what they spent so far
+        used = sum(task.tokens for name, task in self.tasks.items() if name in self.adopted)
+        wasted = sum(task.tokens for name, task in self.tasks.items() if name not in self.adopted)
+        totals = record_speculation(used, wasted)
+        if totals and totals["used"] + totals["wasted"]:
+            rate = totals["wasted"] / (totals["used"] + totals["wasted"])
+            print(f"🔮 Speculative requests: {used} tokens used, {wasted} wasted "
+                  f"({rate:.0%} wasted over {totals['runs']} runs)")
+
+
+def _stats_path():
+    state_dir = get_state_dir()
+    return os.path.join(state_dir, SPECULATION_STATS_FILE) if state_dir else None
+
+
+def load_speculation_stats():
+    """Return the running totals {"runs", "used", "wasted"} (zeros when nothing was recorded)."""
+    path = _stats_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (TypeError, OSError, ValueError):
+        return {"runs": 0, "used": 0, "wasted": 0}
+
+
+def record_speculation(used, wasted):
+    """Add one run's speculative tokens to the running totals and return them."""
+    path = _stats_path()
+    if not path:
+        return None
+    totals = load_speculation_stats()
+    totals = {"runs": totals.get("runs", 0) + 1, "used": totals.get("used", 0) + used,
+              "wasted": totals.get("wasted", 0) + wasted}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(totals, f)
+    os.replace(tmp_path, path)
+    return totals
+
+
+def staged_branch_diff():
+    """
+    The index against the merge base with origin/master: what `origin/master...HEAD` will be
+    once the staged changes are committed. Returns None when there is no merge base.
+    """
+    try:
+        merge_base = subprocess.check_output(
+            ["git", "merge-base", "origin/master", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode("utf-8").strip()
+    except subprocess.CalledProcessError:
+        return None
+    return load_diff(("--cached", merge_base))
+
+
+def staged_commit_diff():
+    """The index against master: what `master..HEAD` will be once the staged changes are committed."""
+    try:
+        diff, _ = filter_diff(load_diff(("--cached", "master")))
+    except subprocess.CalledProcessError:
+        return None
+    return diff
+
+
+def start_speculation():
+    """
+    Start the PR description and impact report requests from the staged diff, so they run
+    while the user is still choosing a message. Returns a Speculation, or None when disabled.
+    """
+    if not SPECULATION_ENABLED:
+        return None
+    from .commit_impact_report import generate_full_impact_report
+    from .pr_description_gen import generate_pr_description
+
+    tasks = {}
+    branch_diff = staged_branch_diff()
+    if branch_diff:
+        tasks["PR description"] = SpeculativeTask("PR description", branch_diff,
+                                                  lambda: generate_pr_description(branch_diff))
+    commit_diff = staged_commit_diff()
+    if commit_diff:
+        tasks["Impact report"] = SpeculativeTask("Impact report", commit_diff,
+                                                 lambda: generate_full_impact_report(commit_diff))
+    return Speculation(tasks)
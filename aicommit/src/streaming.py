@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import sys
+import time
+
+# --- CONFIG ---
+# Set AICOMMIT_NO_STREAM=1 to wait for complete responses instead of streaming tokens
+STREAMING_ENABLED = os.getenv("AICOMMIT_NO_STREAM", "").lower() not in ("1", "true", "yes")
+# Minimum time between terminal redraws while candidates stream in
+REDRAW_INTERVAL = 0.05
+
+
+def iter_sse_deltas(lines):
+    """
+    Parse a chat-completions Server-Sent Events stream.
+    Args:
+        lines (iterable): Raw lines of the HTTP response body (bytes or str).
+    Yields:
+        tuple: (choice index, content delta) for every non-empty token delta.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        # Azure sends an initial event with prompt filter results and no choices
+        for choice in event.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield choice.get("index", 0), content
+
+
+def collect_stream(deltas, output_path=None):
+    """
+    Join streamed deltas into the full response text, optionally writing them to output_path
+    as they arrive so the file fills in progressively.
+    """
+    parts = []
+    output = None
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        output = open(output_path, "w", encoding="utf-8")
+    try:
+        for _, content in deltas:
+            parts.append(content)
+            if output:
+                output.write(content)
+                output.flush()
+    finally:
+        if output:
+            output.close()
+    return "".join(parts).strip()
+
+
+class CandidateRenderer:
+    """
+    Render several completions live in the terminal as their tokens arrive.
+    Each candidate gets one line, truncated to the terminal width; the block is cleared on
+    close so the caller can print the final, cleaned-up list. Does nothing when stdout is
+    not a terminal.
+    """
+
+    def __init__(self, count, stream=None):
+        self.stream = stream or sys.stdout
+        self.enabled = STREAMING_ENABLED and self.stream.isatty()
+        self.texts = [""] * count
+        self.last_draw = 0.0
+        self.drawn_lines = 0
+
+    def update(self, index, content):
+        if index >= len(self.texts):
+            self.texts.extend([""] * (index + 1 - len(self.texts)))
+        self.texts[index] += content
+        if self.enabled and time.monotonic() - self.last_draw >= REDRAW_INTERVAL:
+            self._draw()
+
+    def reset(self):
+        """Forget the text so far, e.g. before a failed stream is retried on another backend."""
+        self.texts = [""] * len(self.texts)
+        if self.enabled:
+            self._draw()
+
+    def _draw(self):
+        width = shutil.get_terminal_size((80, 20)).columns - 1
+        if self.drawn_lines:
+            # Move back to the first candidate line
+            self.stream.write(f"\x1b[{self.drawn_lines}F")
+        for number, text in enumerate(self.texts, 1):
+            line = f"{number}. {' '.join(text.split())}"
+            self.stream.write("\x1b[2K" + line[:width] + "\n")
+        self.stream.flush()
+        self.drawn_lines = len(self.texts)
+        self.last_draw = time.monotonic()
+
+    def close(self):
+        if self.drawn_lines:
+            # Erase the live block
+            self.stream.write(f"\x1b[{self.drawn_lines}F\x1b[J")
+            self.stream.flush()
+        self.drawn_lines = 0
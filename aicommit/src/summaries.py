@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+from . import cache
+from .chunking import fit_diff_to_budget, map_reduce
+from .llm_client import LLMError
+from .paths import get_state_dir
+from .pipeline import MAX_CONCURRENT_REQUESTS
+from .router import complete
+
+# --- CONFIG ---
+# Bump when the per-file summary prompt changes so stored summaries are not reused
+FILE_SUMMARY_PROMPT_VERSION = "1"
+# Token budget for one file's diff in the summary prompt; larger files are chunk-summarized first
+FILE_SUMMARY_TOKENS = 3000
+# SQLite index of per-file summaries, under .git/aicommit/
+SUMMARY_DB_NAME = "summaries.sqlite"
+
+_DB_LOCK = threading.Lock()
+_CONNECTION = None
+
+
+def _connect():
+    """Open (once per process) the summary index, or return None outside a git repository."""
+    global _CONNECTION
+    if _CONNECTION is None:
+        state_dir = get_state_dir()
+        if not state_dir:
+            return None
+        _CONNECTION = sqlite3.connect(os.path.join(state_dir, SUMMARY_DB_NAME), timeout=10,
+                                      check_same_thread=False)
+        # WAL lets the post-commit stages and a concurrent run read while another one writes
+        _CONNECTION.execute("PRAGMA journal_mode=WAL")
+        _CONNECTION.execute("""
+            CREATE TABLE IF NOT EXISTS file_summaries (
+                old_blob TEXT NOT NULL,
+                new_blob TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                path TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (old_blob, new_blob, prompt_version)
+            )
+        """)
+        _CONNECTION.commit()
+    return _CONNECTION
+
+
+def summary_key(file_diff):
+    """Return the (old blob, new blob) pair identifying a file change, or None if unknown."""
+    if not file_diff.old_blob or not file_diff.new_blob:
+        return None
+    return file_diff.old_blob, file_diff.new_blob
+
+
+def get_summary(file_diff, prompt_version=FILE_SUMMARY_PROMPT_VERSION):
+    """Return the stored summary of this exact file change, or None."""
+    key = summary_key(file_diff)
+    if key is None or not cache.CACHE_ENABLED:
+        return None
+    with _DB_LOCK:
+        connection = _connect()
+        if connection is None:
+            return None
+        row = connection.execute(
+            "SELECT summary FROM file_summaries WHERE old_blob = ? AND new_blob = ? AND prompt_version = ?",
+            (*key, prompt_version),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def store_summary(file_diff, summary, prompt_version=FILE_SUMMARY_PROMPT_VERSION):
+    """Remember the summary of a file change for later stages and runs."""
+    key = summary_key(file_diff)
+    if key is None or not summary or not cache.CACHE_ENABLED:
+        return
+    with _DB_LOCK:
+        connection = _connect()
+        if connection is None:
+            return
+        connection.execute(
+            "INSERT OR REPLACE INTO file_summaries VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, prompt_version, file_diff.path, summary, time.time()),
+        )
+        connection.commit()
+
+
+def summarize_file(file_diff):
+    """
+    Summarize one file change in one or two sentences.
+    The summary is keyed by the file's old and new blob SHAs, so the commit message, PR
+    description and impact report stages (and later commits on the branch) only call the
+    model for changes that have not been summarized before.
+    """
+    summary = get_summary(file_diff)
+    if summary is not None:
+        return summary
+
+    file_text = fit_diff_to_budget(file_diff.text, max_tokens=FILE_SUMMARY_TOKENS)
+    prompt = f"""
+Summarize the change to `{file_diff.path}` below in one or two sentences for a reviewer. Mention
+the functions, classes or settings that changed. Reply with the summary only.
+
+Git Diff:
+{file_text}
+"""
+    messages = [
+        {"role": "system", "content": "You summarize code diffs precisely and briefly."},
+        {"role": "user", "content": prompt}
+    ]
+    try:
+        summary = complete("file_summary", messages, temperature=0.2, max_tokens=150)
+    except LLMError as e:
+        print("❌ Azure OpenAI API Error (file summary):", e)
+        return ""
+    store_summary(file_diff, summary)
+    return summary
+
+
+def summarize_files(file_diffs, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Summarize several file changes, calling the model concurrently for the unseen ones.
+    Returns:
+        dict: path -> summary, without the files whose summary failed.
+    """
+    summaries = map_reduce(file_diffs, lambda file_diff: (file_diff.path, summarize_file(file_diff)), dict, max_workers)
+    return {path: summary for path, summary in summaries.items() if summary}
+
+
+def lookup_summaries(file_diffs):
+    """Return path -> summary for the file changes already in the index, without calling the model."""
+    summaries = {}
+    for file_diff in file_diffs:
+        summary = get_summary(file_diff)
+        if summary:
+            summaries[file_diff.path] = summary
+    return summaries
@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- CONFIG ---
+# USD per 1,000 tokens for the estimated cost counter (defaults: gpt-4o-mini list prices)
+PROMPT_PRICE_PER_1K = float(os.getenv("AICOMMIT_PROMPT_PRICE_PER_1K", "0.00015"))
+COMPLETION_PRICE_PER_1K = float(os.getenv("AICOMMIT_COMPLETION_PRICE_PER_1K", "0.0006"))
+# Spans are also sent here over OTLP/HTTP (needs opentelemetry-sdk and opentelemetry-exporter-otlp)
+OTLP_ENDPOINT = os.getenv("AICOMMIT_OTLP_ENDPOINT", "")
+METRIC_PREFIX = "aicommit"
+
+# Nothing is recorded until enable() is called, so uninstrumented runs pay one flag check per span
+_ENABLED = False
+_LOCK = threading.Lock()
+_SPANS = []
+_COUNTERS = {}
+_STACK = threading.local()
+# Spans opened on the main thread; a worker thread's first span nests under the innermost one
+_MAIN_STACK = []
+_NEXT_ID = [0]
+# perf_counter() is used for durations; the wall clock only anchors the trace in time
+_ORIGIN = time.perf_counter()
+_ORIGIN_WALL = time.time()
+
+
+class Span:
+    """One timed stage: name, start/end in seconds since process start, parent and attributes."""
+
+    __slots__ = ("id", "parent", "name", "start", "end", "thread", "attributes")
+
+    def __init__(self, span_id, parent, name, attributes):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.start = time.perf_counter() - _ORIGIN
+        self.end = None
+        self.thread = threading.get_ident()
+        self.attributes = attributes
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter() - _ORIGIN) - self.start
+
+
+def enable():
+    """Start recording spans and counters for the rest of this process."""
+    global _ENABLED
+    _ENABLED = True
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a stage. Spans opened inside it become its children, and so do
+    spans opened by worker threads while it is the innermost span of the main thread.
+    """
+    if not _ENABLED:
+        yield None
+        return
+    if threading.current_thread() is threading.main_thread():
+        stack = _MAIN_STACK
+    else:
+        stack = _STACK.__dict__.setdefault("spans", [])
+    with _LOCK:
+        _NEXT_ID[0] += 1
+        parent = stack[-1] if stack else (_MAIN_STACK[-1] if _MAIN_STACK else None)
+        current = Span(_NEXT_ID[0], parent.id if parent else None, name, attributes)
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter() - _ORIGIN
+        stack.pop()
+        with _LOCK:
+            _SPANS.append(current)
+
+
+def count(name, value=1, **labels):
+    """Add value to a counter (e.g. count("cache_hits"), count("llm_errors", status=429))."""
+    if not _ENABLED:
+        return
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def record_tokens(prompt_tokens, completion_tokens):
+    """Count the tokens of one model response and their estimated cost."""
+    count("llm_prompt_tokens", prompt_tokens)
+    count("llm_completion_tokens", completion_tokens)
+    count("llm_cost_usd", prompt_tokens / 1000 * PROMPT_PRICE_PER_1K + completion_tokens / 1000 * COMPLETION_PRICE_PER_1K)
+
+
+def _snapshot():
+    with _LOCK:
+        return sorted(_SPANS, key=lambda s: s.start), dict(_COUNTERS)
+
+
+def write_trace(path):
+    """Write the spans in Chrome trace event format (open in chrome://tracing or Perfetto)."""
+    import json
+
+    spans, counters = _snapshot()
+    events = [{
+        "name": s.name, "ph": "X", "pid": os.getpid(), "tid": s.thread,
+        "ts": round(s.start * 1e6), "dur": round(s.duration * 1e6),
+        "args": {"id": s.id, "parent": s.parent, **s.attributes},
+    } for s in spans]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "started": _ORIGIN_WALL,
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(counters.items())],
+            },
+        }, f, indent=1, default=str)
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def openmetrics_text():
+    """Counters and per-stage latency summaries in the OpenMetrics text format."""
+    spans, counters = _snapshot()
+    lines = []
+    by_name = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, samples in by_name.items():
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# TYPE {metric} counter")
+        lines += [f"{metric}_total{_labels(labels)} {value:g}" for labels, value in samples]
+
+    stages = {}
+    for s in spans:
+        total, calls = stages.get(s.name, (0.0, 0))
+        stages[s.name] = (total + s.duration, calls + 1)
+    if stages:
+        metric = f"{METRIC_PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        lines.append(f"# UNIT {metric} seconds")
+        for name, (total, calls) in stages.items():
+            lines.append(f"{metric}_sum{_labels([('stage', name)])} {total:.6f}")
+            lines.append(f"{metric}_count{_labels([('stage', name)])} {calls}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_openmetrics(path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(openmetrics_text())
+
+
+def export_otlp(endpoint=OTLP_ENDPOINT):
+    """Replay the recorded spans to an OTLP/HTTP collector. Returns False if OpenTelemetry is missing."""
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        print("⚠️ AICOMMIT_OTLP_ENDPOINT is set but opentelemetry-sdk / opentelemetry-exporter-otlp are not installed.")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "aicommit"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint.rstrip("/") + "/v1/traces")))
+    tracer = provider.get_tracer("aicommit")
+    spans, _ = _snapshot()
+    origin_ns = int(_ORIGIN_WALL * 1e9)
+    exported = {}
+    # Parents end after their children, so start them in start order and end them at their own end time
+    for s in spans:
+        parent = exported.get(s.parent)
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = tracer.start_span(s.name, context=context, start_time=origin_ns + int(s.start * 1e9),
+                                      attributes={k: str(v) for k, v in s.attributes.items()})
+        exported[s.id] = otel_span
+    for s in spans:
+        exported[s.id].end(end_time=origin_ns + int((s.start + s.duration) * 1e9))
+    provider.shutdown()
+    return True
+
+
+def print_profile():
+    """Print a per-stage latency breakdown as a tree of span names."""
+    spans, counters = _snapshot()
+    if not spans:
+        return
+    by_id = {s.id: s for s in spans}
+
+    def path(s):
+        names = []
+        while s is not None:
+            names.append(s.name)
+            s = by_id.get(s.parent)
+        return tuple(reversed(names))
+
+    stages = {}
+    for s in spans:
+        key = path(s)
+        first, total, calls = stages.get(key, (s.start, 0.0, 0))
+        stages[key] = (min(first, s.start), total + s.duration, calls + 1)
+    wall = max(s.start + s.duration for s in spans) - min(s.start for s in spans)
+
+    def tree_order(key):
+        # Children right below their parent, siblings in the order they first started
+        return tuple(stages[key[:depth]][0] for depth in range(1, len(key) + 1))
+
+    print("\n⏱️ Stage breakdown:")
+    print(f"  {'stage':<44}{'calls':>6}{'total ms':>11}{'share':>7}")
+    for key, (_, total, calls) in sorted(stages.items(), key=lambda item: tree_order(item[0])):
+        label = "  " * (len(key) - 1) + key[-1]
+        print(f"  {label:<44}{calls:>6}{total * 1000:>11.1f}{total / wall:>7.0%}" if wall else f"  {label}")
+    totals = {name: value for (name, labels), value in counters.items() if not labels}
+    if totals:
+        print("  " + ", ".join(f"{name}={value:g}" for name, value in sorted(totals.items())))
+
+
+def finish(trace_path=None, metrics_path=None, profile=False):
+    """Write the requested outputs once the run is over."""
+    if not _ENABLED:
+        return
+    if trace_path:
+        write_trace(trace_path)
+        print(f"🧭 Trace written to `{trace_path}`")
+    if metrics_path:
+        write_openmetrics(metrics_path)
+        print(f"📈 Metrics written to `{metrics_path}`")
+    if OTLP_ENDPOINT:
+        export_otlp()
+    if profile:
+        print_profile()
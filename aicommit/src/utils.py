@@ -1,36 +1,34 @@
 import subprocess
-import openai
-from openai import AzureOpenAI
+from . import compaction, telemetry
+from .cache import cached_call
+from .candidates import CANDIDATE_STRATEGY, generate_candidates
+from .chunking import fit_diff
+from .diffs import Diff, iter_file_diffs
+from .router import cache_label
+
+# Bump when the commit message prompt changes so cached responses are not reused
+COMMIT_MESSAGE_PROMPT_VERSION = "2"
 
 def generate_commit_messages(
-    api_key: str, prompt: str, language: str = "english", num_messages: int = 5
+    api_key: str, diff: Diff, language: str = "english", num_messages: int = 5, live: bool = True,
+    strategy: str = None
 ) -> list:
-    try:
-        # Initialize the Azure OpenAI client
-        client = AzureOpenAI(
-            api_key=api_key,
-            api_version="2025-01-01-preview",
-            azure_endpoint="https://shrutiaiinstance.openai.azure.com"
-        )
-        
-        # Format prompt
-        prompt = f"What follows '-------' is a git diff for a potential commit. Reply with an appropriate git commit message (a Git commit message should be concise but also try to describe the important changes in the commit) and don't include any other text but the message in your response. ------- {prompt}, language={language}"
-
-        # Make the API call using the appropriate Azure OpenAI endpoint
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # This is your deployment name
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates git commit messages."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=200,
-            n=num_messages,
-            temperature=0.7,
+    strategy = strategy or CANDIDATE_STRATEGY
+    params = {"max_tokens": 200, "n": num_messages, "temperature": 0.7, "language": language, "strategy": strategy,
+              "compaction": compaction.COMPACTION_MODE}
+    with telemetry.span("commit_messages", strategy=strategy, n=num_messages):
+        return cached_call(
+            # Huge diffs are summarized chunk by chunk so the final prompt fits the context window
+            lambda: _request_commit_messages(api_key, fit_diff(diff), language, num_messages, live, strategy),
+            diff.text, COMMIT_MESSAGE_PROMPT_VERSION, cache_label("commit_message"), params
         )
 
-        # Extract and return the commit messages from the response
-        messages = [choice.message.content.strip().replace("\n", "") for choice in response.choices]
-        return messages
+def _request_commit_messages(api_key: str, prompt: str, language: str, num_messages: int, live: bool = True,
+                             strategy: str = None) -> list:
+    try:
+        # The strategy (n-sampling, one JSON-list call, draft + refinement) is chosen in candidates;
+        # near-duplicate candidates are dropped there
+        return generate_candidates(api_key, prompt, language, num_messages, live, strategy)
     except Exception as e:
         error_message = f"Azure OpenAI API Error: {e}"
         print(error_message)
@@ -38,25 +36,12 @@ def generate_commit_messages(
 
 def get_diff(diff_per_file: bool) -> str:
     if diff_per_file:
-        diff = subprocess.check_output(
-            "git diff --cached --name-only",
-            shell=True,
-            stderr=subprocess.STDOUT,
-        ).decode("utf-8")
-
-        files_changed = diff.split("\n")[:-1]
-        diff_string = ""
-        for file in files_changed:
-            diff_string += subprocess.check_output(
-                f"git diff --cached -- {file}",
-                shell=True,
-                stderr=subprocess.STDOUT,
-            ).decode("utf-8")
+        # One git process for all files; records are parsed as the output streams in
+        diff_string = "".join(file_diff.text for file_diff in iter_file_diffs(("--cached",)))
     else:
         diff_string = subprocess.check_output(
-            "git diff --cached .",
-            shell=True,
+            ["git", "diff", "--cached", "."],
             stderr=subprocess.STDOUT,
         ).decode("utf-8")
 
-    return diff_string
\ No newline at end of file
+    return diff_string
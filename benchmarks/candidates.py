@@ -0,0 +1,135 @@
+"""
+Benchmark of the commit message candidate strategies (sample, json, draft).
+
+Runs every strategy against an in-process chat-completions stub that replays recorded
+responses from benchmarks/recordings/commit_candidates.json, with simulated latency per
+generated token, and reports per strategy:
+  - model calls, prompt tokens and completion tokens (estimated, 4 characters per token)
+  - median wall-clock latency
+  - number of distinct candidates after near-duplicate removal and their diversity
+    (mean pairwise shingle distance, 1.0 = nothing in common)
+
+Usage:
+    python benchmarks/candidates.py [--runs N] [--count K] [--base-latency S] [--token-latency S]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import combinations
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RECORDING_PATH = os.path.join(BENCHMARK_DIR, "recordings", "commit_candidates.json")
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "aicommit"))
+
+
+def recording_kind(payload):
+    """Which recorded response a request gets, derived from the request itself."""
+    prompt = payload["messages"][-1]["content"]
+    if payload.get("n", 1) > 1:
+        return "sample"
+    if "draft git commit message" in prompt:
+        return "refine"
+    if "JSON array" in prompt:
+        return "json"
+    return "draft"
+
+
+class RecordedStub:
+    """Chat-completions server replaying recorded responses and counting tokens per request."""
+
+    def __init__(self, recording, base_latency, token_latency):
+        self.recording = recording
+        self.base_latency = base_latency
+        self.token_latency = token_latency
+        self.lock = threading.Lock()
+        self.reset()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                body = json.dumps(stub.respond(payload)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset(self):
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def respond(self, payload):
+        from src.chunking import estimate_tokens
+        kind = recording_kind(payload)
+        recorded = self.recording["responses"][kind]
+        choices = recorded[:payload.get("n", 1)] if isinstance(recorded, list) else [recorded]
+        completion_tokens = [estimate_tokens(choice) for choice in choices]
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += sum(estimate_tokens(m["content"]) for m in payload["messages"])
+            self.completion_tokens += sum(completion_tokens)
+        # Choices of one request are generated in parallel, so latency follows the longest one
+        time.sleep(self.base_latency + self.token_latency * max(completion_tokens))
+        return {"choices": [{"index": i, "message": {"content": text}} for i, text in enumerate(choices)]}
+
+
+def diversity(candidates):
+    from src.candidates import similarity
+    pairs = list(combinations(candidates, 2))
+    if not pairs:
+        return 0.0
+    return statistics.mean(1 - similarity(a, b) for a, b in pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare commit message candidate strategies")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per strategy")
+    parser.add_argument("--count", type=int, default=5, help="Candidates requested per run")
+    parser.add_argument("--base-latency", type=float, default=0.3, help="Simulated seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Simulated seconds per output token")
+    args = parser.parse_args()
+
+    with open(RECORDING_PATH, "r", encoding="utf-8") as f:
+        recording = json.load(f)
+    stub = RecordedStub(recording, args.base_latency, args.token_latency)
+    # Point the shared client at the stub before it is imported
+    os.environ["AZURE_OPENAI_ENDPOINT"] = stub.endpoint
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    from src.candidates import CANDIDATE_STRATEGIES, generate_candidates
+
+    print(f"{'strategy':<10}{'calls':>7}{'prompt tok':>12}{'output tok':>12}{'p50 s':>8}{'unique':>8}{'diversity':>11}")
+    for strategy in CANDIDATE_STRATEGIES:
+        stub.reset()
+        latencies, unique, spread = [], [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            candidates = generate_candidates("benchmark", recording["diff"], "en", args.count, live=False,
+                                             strategy=strategy)
+            latencies.append(time.perf_counter() - start)
+            unique.append(len(candidates))
+            spread.append(diversity(candidates))
+        print(f"{strategy:<10}{stub.calls / args.runs:>7.1f}{stub.prompt_tokens / args.runs:>12.0f}"
+              f"{stub.completion_tokens / args.runs:>12.0f}{statistics.median(latencies):>8.2f}"
+              f"{statistics.mean(unique):>8.1f}{statistics.mean(spread):>11.2f}")
+    stub.server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
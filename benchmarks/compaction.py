@@ -0,0 +1,91 @@
+"""
+Evaluation of the prompt compaction modes (off, balanced, minimal) on a fixed set of diffs.
+
+Every case in benchmarks/recordings/compaction_eval.json is a real `git diff` plus the facts
+a good commit message needs from it (paths, identifiers, strings). For each mode this reports:
+  - prompt tokens and the compression ratio against the raw diff
+  - fact retention: the share of those facts still present in the compacted prompt
+With --model, a commit message is also generated per case and mode through the configured
+endpoint (AZURE_OPENAI_ENDPOINT, e.g. benchmarks/mock_server.py or the real service), and the
+report adds latency, how many facts the messages mention and how close they are to the
+messages generated from the raw diff (shingle similarity, 1.0 = identical).
+
+Usage:
+    python benchmarks/compaction.py [--model] [--case NAME ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EVAL_PATH = os.path.join(BENCHMARK_DIR, "recordings", "compaction_eval.json")
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "aicommit"))
+
+
+def retention(text, facts):
+    text = text.lower()
+    return sum(fact.lower() in text for fact in facts) / len(facts) if facts else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate prompt compaction modes on a fixed diff set")
+    parser.add_argument("--model", action="store_true", help="Also generate messages and compare them")
+    parser.add_argument("--case", action="append", help="Only evaluate these cases")
+    args = parser.parse_args()
+
+    import contextlib
+    import io
+    from src.cache import disable_cache
+    from src.candidates import similarity
+    from src.chunking import estimate_tokens
+    from src.compaction import COMPACTION_MODES, compact_diff, set_compaction_mode
+    from src.config import get_api_key
+    from src.diffs import parse_diff
+    from src.utils import generate_commit_messages
+
+    disable_cache()
+    with open(EVAL_PATH, "r", encoding="utf-8") as f:
+        cases = [case for case in json.load(f)["cases"] if not args.case or case["name"] in args.case]
+
+    rows = {mode: {"tokens": [], "retention": [], "seconds": [], "recall": [], "parity": []} for mode in COMPACTION_MODES}
+    for case in cases:
+        raw_messages = None
+        for mode in COMPACTION_MODES:
+            diff = parse_diff(case["diff"])
+            with contextlib.redirect_stdout(io.StringIO()):
+                files, _ = compact_diff(diff, mode)
+            text = "".join(prompt for _, prompt in files)
+            rows[mode]["tokens"].append(estimate_tokens(text))
+            rows[mode]["retention"].append(retention(text, case["expected"]))
+            if not args.model:
+                continue
+            set_compaction_mode(mode)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                messages = generate_commit_messages(get_api_key(), diff, "en", num_messages=1, live=False)
+            rows[mode]["seconds"].append(time.perf_counter() - start)
+            message = messages[0] if messages else ""
+            rows[mode]["recall"].append(retention(message, case["expected"]))
+            raw_messages = raw_messages if mode != "off" else message
+            rows[mode]["parity"].append(similarity(message, raw_messages or ""))
+
+    raw_tokens = sum(rows["off"]["tokens"])
+    print(f"{len(cases)} cases from {os.path.relpath(EVAL_PATH)}")
+    header = f"{'mode':<10}{'tokens':>8}{'ratio':>7}{'retention':>11}"
+    if args.model:
+        header += f"{'p50 s':>8}{'msg recall':>12}{'parity':>8}"
+    print(header)
+    for mode, row in rows.items():
+        tokens = sum(row["tokens"])
+        line = f"{mode:<10}{tokens:>8}{raw_tokens / tokens:>6.1f}x{statistics.mean(row['retention']):>11.0%}"
+        if args.model:
+            line += (f"{statistics.median(row['seconds']):>8.2f}{statistics.mean(row['recall']):>12.0%}"
+                     f"{statistics.mean(row['parity']):>8.2f}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Local mock of the Azure OpenAI chat-completions API for benchmarks and offline runs.
+
+Answers every POST to .../chat/completions with synthetic text, with:
+  - a fixed latency before the first token (--latency)
+  - a generation rate, so longer answers take longer (--tokens-per-second)
+  - injected failures: a fraction of requests get --error-status (e.g. 429 with Retry-After)
+Both plain and streamed (SSE) responses are supported, and plain responses report `usage`.
+
+GET /stats returns the request, error and token counters as JSON; DELETE /stats resets them.
+
+Usage:
+    python benchmarks/mock_server.py [--port 8765] [--latency S] [--tokens-per-second N] [--error-rate F]
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765 OPENAI_API_KEY=mock aicommit
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Same rough estimate as chunking.estimate_tokens
+CHARS_PER_TOKEN = 4
+WORDS = ("update", "refactor", "module", "handler", "parser", "cache", "request", "config", "report", "diff")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def synthetic_text(tokens, seed):
+    """Deterministic filler text of roughly `tokens` tokens."""
+    rng = random.Random(seed)
+    words, length = [], 0
+    while length < tokens * CHARS_PER_TOKEN:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).capitalize()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients exiting with idle keep-alive connections are expected, not errors
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockServer:
+    """Threaded mock chat-completions server; starts serving on construction."""
+
+    def __init__(self, port=0, latency=0.2, tokens_per_second=200.0, completion_tokens=40,
+                 error_rate=0.0, error_status=429, retry_after=0.1, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+        self.server = _QuietServer(("127.0.0.1", port), self._handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _should_fail(self):
+        with self.lock:
+            self.stats["requests"] += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+            return failed
+
+    def _choices(self, payload):
+        """Synthetic answers: a JSON array when the prompt asks for one, plain text otherwise."""
+        prompt = payload["messages"][-1]["content"]
+        budget = min(self.completion_tokens, payload.get("max_tokens", self.completion_tokens))
+        choices = []
+        for index in range(payload.get("n", 1)):
+            if "JSON array" in prompt:
+                text = json.dumps([synthetic_text(budget // 5, f"{index}-{item}") for item in range(5)])
+            else:
+                text = synthetic_text(budget, index)
+            choices.append(text)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in payload["messages"])
+        completion_tokens = sum(estimate_tokens(text) for text in choices)
+        with self.lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+        return choices, {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, data, headers=()):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send_json(200, mock.snapshot())
+
+            def do_DELETE(self):
+                mock.reset()
+                self._send_json(200, mock.snapshot())
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if mock._should_fail():
+                    headers = [("Retry-After", str(mock.retry_after))] if mock.error_status == 429 else []
+                    self._send_json(mock.error_status, {"error": {"message": "injected failure"}}, headers)
+                    return
+                choices, usage = mock._choices(payload)
+                time.sleep(mock.latency)
+                if payload.get("stream"):
+                    self._stream(choices)
+                    return
+                # Choices are generated in parallel, so the longest one sets the duration
+                time.sleep(max(estimate_tokens(text) for text in choices) / mock.tokens_per_second)
+                self._send_json(200, {
+                    "choices": [{"index": i, "message": {"role": "assistant", "content": text}}
+                                for i, text in enumerate(choices)],
+                    "usage": usage,
+                })
+
+            def _stream(self, choices):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(data):
+                    chunk = f"data: {data}\n\n".encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+
+                words = [text.split(" ") for text in choices]
+                for position in range(max(len(parts) for parts in words)):
+                    for index, parts in enumerate(words):
+                        if position < len(parts):
+                            content = parts[position] if position == 0 else " " + parts[position]
+                            event(json.dumps({"choices": [{"index": index, "delta": {"content": content}}]}))
+                    self.wfile.flush()
+                    time.sleep(estimate_tokens(" ".join(part[position] for part in words
+                                                        if position < len(part))) / mock.tokens_per_second)
+                event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI chat-completions server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Generation rate")
+    parser.add_argument("--completion-tokens", type=int, default=40, help="Tokens per answer (capped by max_tokens)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="Status code of injected failures")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.latency, args.tokens_per_second, args.completion_tokens,
+                        args.error_rate, args.error_status)
+    print(f"Mock chat-completions server on {server.endpoint} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Startup benchmark for the aicommit CLI.
+
+Creates a throwaway git repository with nothing staged, then:
+  1. reports the slowest imports of `src.aicommit` using `python -X importtime`
+  2. times the "No staged changes found" path of `python -m src` over several runs
+
+Usage:
+    python benchmarks/startup.py [--runs N] [--top N] [--budget-ms MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aicommit")
+
+
+def make_empty_repo(path):
+    subprocess.run(["git", "init", "-q", path], check=True)
+    with open(os.path.join(path, "README.md"), "w") as f:
+        f.write("startup benchmark\n")
+    subprocess.run(["git", "-C", path, "add", "README.md"], check=True)
+    subprocess.run(["git", "-C", path, "-c", "user.name=bench", "-c", "user.email=bench@example.com",
+                    "commit", "-q", "-m", "init"], check=True)
+
+
+def bench_env():
+    return dict(os.environ, PYTHONPATH=os.path.abspath(PACKAGE_ROOT))
+
+
+def import_times(repo, top):
+    """Return the `top` slowest imports of src.aicommit as (cumulative us, module) tuples."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.aicommit"],
+        cwd=repo, env=bench_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def noop_times(repo, runs):
+    """Wall-clock seconds of `python -m src` with nothing staged, one entry per run."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "src"], cwd=repo, env=bench_env(),
+                       capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure aicommit CLI startup time")
+    parser.add_argument("--runs", type=int, default=10, help="Number of timed no-op runs")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="Fail if the median exceeds this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repo:
+        make_empty_repo(repo)
+
+        print("Slowest imports of src.aicommit (cumulative):")
+        for cumulative, module in import_times(repo, args.top):
+            print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+        # Warm-up run so bytecode compilation is not measured
+        noop_times(repo, 1)
+        times = noop_times(repo, args.runs)
+
+    median_ms = statistics.median(times) * 1000
+    print(f"\nNo-op run (nothing staged), {args.runs} runs:")
+    print(f"  median {median_ms:.1f} ms, min {min(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms")
+    print(f"  budget {args.budget_ms:.0f} ms: {'✅ ok' if median_ms <= args.budget_ms else '❌ over budget'}")
+    return 0 if median_ms <= args.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
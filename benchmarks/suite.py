@@ -0,0 +1,186 @@
+"""
+Benchmark suite for aicommit against a local mock chat-completions server.
+
+Creates a synthetic repository (see synthetic_repo.py), starts the mock server (see
+mock_server.py) and runs each scenario several times, each run in a fresh process:
+  get_diff                  utils.get_diff over the staged changes
+  generate_commit_messages  parse + filter the staged diff and generate candidates
+  impact_report             commit_impact_report.impact_report() over master..HEAD
+  generate_description      pr_description_gen.generate_description() over origin/master...HEAD
+and reports per scenario: p50/p95 latency, subprocesses started, peak RSS, model requests
+and prompt tokens. The response cache is disabled so every run calls the mock server.
+
+For CI, --json writes the results and --baseline compares them with an earlier --json file,
+exiting with status 1 when a metric regressed by more than --max-regression.
+
+Usage:
+    python benchmarks/suite.py [--runs N] [--files N] [--hunks N] [--line-bytes N]
+        [--latency S] [--tokens-per-second N] [--error-rate F] [--scenario NAME ...]
+        [--json OUT] [--baseline FILE] [--max-regression F]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_ROOT = os.path.abspath(os.path.join(BENCHMARK_DIR, "..", "aicommit"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from mock_server import MockServer  # noqa: E402
+from synthetic_repo import create_repo  # noqa: E402
+
+
+def scenario_get_diff():
+    from src.utils import get_diff
+    get_diff(True)
+
+
+def scenario_generate_commit_messages():
+    from src.config import get_api_key
+    from src.diffs import load_diff
+    from src.filters import filter_diff
+    from src.utils import generate_commit_messages
+    diff, _ = filter_diff(load_diff(("--cached",)))
+    generate_commit_messages(get_api_key(), diff, "en", live=False)
+
+
+def scenario_impact_report():
+    from src.commit_impact_report import impact_report
+    impact_report()
+
+
+def scenario_generate_description():
+    from src.pr_description_gen import generate_description
+    generate_description()
+
+
+SCENARIOS = {
+    "get_diff": scenario_get_diff,
+    "generate_commit_messages": scenario_generate_commit_messages,
+    "impact_report": scenario_impact_report,
+    "generate_description": scenario_generate_description,
+}
+# Metrics compared against the baseline (lower is better for all of them)
+TRACKED_METRICS = ("p50_ms", "p95_ms", "subprocesses", "peak_rss_mb", "prompt_tokens")
+
+
+def run_child(name):
+    """Run one scenario in this process and print its measurements as JSON (child side)."""
+    import resource
+
+    sys.path.insert(0, PACKAGE_ROOT)
+    subprocesses = []
+    # Every subprocess.Popen (git, the background report flusher, ...) raises this audit event
+    sys.addaudithook(lambda event, args: subprocesses.append(args[0]) if event == "subprocess.Popen" else None)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            SCENARIOS[name]()
+        except SystemExit:
+            # generate_description exits when done
+            pass
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": elapsed, "subprocesses": len(subprocesses), "peak_rss_mb": peak_rss}))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(name, repo, server, runs):
+    """Run a scenario `runs` times in fresh processes and aggregate the measurements."""
+    env = dict(os.environ, AZURE_OPENAI_ENDPOINT=server.endpoint, OPENAI_API_KEY="benchmark",
+               AICOMMIT_NO_CACHE="1", AICOMMIT_REPORT_SINK="none", PYTHONPATH=PACKAGE_ROOT)
+    server.reset()
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name],
+                                cwd=repo, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{result.stderr}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    stats = server.snapshot()
+    seconds = [sample["seconds"] for sample in samples]
+    return {
+        "p50_ms": round(statistics.median(seconds) * 1000, 1),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 1),
+        "subprocesses": statistics.mean(sample["subprocesses"] for sample in samples),
+        "peak_rss_mb": round(max(sample["peak_rss_mb"] for sample in samples), 1),
+        "requests": stats["requests"] / runs,
+        "errors": stats["errors"] / runs,
+        "prompt_tokens": stats["prompt_tokens"] / runs,
+    }
+
+
+def regressions(results, baseline, max_regression):
+    """Return descriptions of tracked metrics that grew more than max_regression over baseline."""
+    found = []
+    for name, metrics in results.items():
+        for metric in TRACKED_METRICS:
+            before = baseline.get(name, {}).get(metric)
+            if before and metrics[metric] > before * (1 + max_regression):
+                found.append(f"{name} {metric}: {before} -> {metrics[metric]}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aicommit against a mock chat-completions server")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per scenario")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Only run these scenarios")
+    parser.add_argument("--files", type=int, default=20, help="Changed files in the synthetic repository")
+    parser.add_argument("--hunks", type=int, default=3, help="Hunks per changed file")
+    parser.add_argument("--hunk-lines", type=int, default=4, help="Changed lines per hunk")
+    parser.add_argument("--line-bytes", type=int, default=60, help="Approximate bytes per changed line")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Mock generation rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests that fail")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Compare with results written earlier by --json")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed growth over the baseline")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    server = MockServer(latency=args.latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate)
+    results = {}
+    with tempfile.TemporaryDirectory() as repo:
+        sizes = create_repo(repo, args.files, args.hunks, args.hunk_lines, args.line_bytes)
+        print(f"Synthetic repository: {args.files} files x {args.hunks} hunks, "
+              f"staged diff {sizes['staged']} bytes, branch diff {sizes['branch']} bytes")
+        print(f"{'scenario':<26}{'p50 ms':>9}{'p95 ms':>9}{'procs':>7}{'RSS MB':>8}{'requests':>10}{'prompt tok':>12}")
+        for name in args.scenario or SCENARIOS:
+            metrics = results[name] = run_scenario(name, repo, server, args.runs)
+            print(f"{name:<26}{metrics['p50_ms']:>9.1f}{metrics['p95_ms']:>9.1f}{metrics['subprocesses']:>7.1f}"
+                  f"{metrics['peak_rss_mb']:>8.1f}{metrics['requests']:>10.1f}{metrics['prompt_tokens']:>12.0f}")
+    server.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        for line in found:
+            print(f"❌ Regression: {line}")
+        if found:
+            return 1
+        print(f"✅ No metric grew more than {args.max_regression:.0%} over the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
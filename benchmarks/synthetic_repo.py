@@ -0,0 +1,94 @@
+"""
+Synthetic git repositories of a given size for the benchmark suite.
+
+The generated repository has:
+  - a `master` branch with `files` Python modules that import each other, also recorded as
+    `origin/master` (no remote is needed)
+  - a `feature` branch with one commit changing every file (`master..HEAD`)
+  - further staged changes to every file (`git diff --cached`)
+Every changed file gets `hunks` separate hunks of `hunk_lines` changed lines of about
+`line_bytes` bytes each.
+
+Usage:
+    python benchmarks/synthetic_repo.py PATH [--files N] [--hunks N] [--hunk-lines N] [--line-bytes N]
+"""
+import argparse
+import os
+import random
+import subprocess
+
+# Unchanged lines between hunks, so git never merges neighbouring hunks
+HUNK_SPACING = 12
+GIT_IDENTITY = ["-c", "user.name=bench", "-c", "user.email=bench@example.com"]
+
+
+def _git(path, *args):
+    subprocess.run(["git", "-C", path, *GIT_IDENTITY, *args], check=True, capture_output=True)
+
+
+def _line(rng, prefix, line_bytes):
+    filler = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz_") for _ in range(max(8, line_bytes - len(prefix) - 12)))
+    return f"{prefix} = \"{filler}\""
+
+
+def _module_source(index, files, hunks, hunk_lines, line_bytes, version, rng):
+    """Source of module `index`; hunk regions depend on version, everything else is stable."""
+    lines = [f"from app import module_{(index + step) % files}" for step in (1, 2) if files > 1]
+    for hunk in range(hunks):
+        lines.append(f"def function_{hunk}():")
+        lines += [f"    # context {hunk}.{n}" for n in range(HUNK_SPACING)]
+        lines += ["    " + _line(rng, f"value_{hunk}_{n}_v{version}", line_bytes) for n in range(hunk_lines)]
+        lines.append(f"    return value_{hunk}_0_v{version}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def _write_modules(path, files, hunks, hunk_lines, line_bytes, version, seed):
+    for index in range(files):
+        rng = random.Random(f"{seed}-{index}-{version}")
+        with open(os.path.join(path, "app", f"module_{index}.py"), "w", encoding="utf-8") as f:
+            f.write(_module_source(index, files, hunks, hunk_lines, line_bytes, version, rng))
+
+
+def create_repo(path, files=20, hunks=3, hunk_lines=4, line_bytes=60, seed=0):
+    """
+    Create the synthetic repository at path (which must not exist or be empty).
+    Returns:
+        dict: Sizes of the generated diffs in bytes ("branch" for master..HEAD, "staged" for --cached).
+    """
+    os.makedirs(os.path.join(path, "app"), exist_ok=True)
+    subprocess.run(["git", "init", "-q", "-b", "master", path], check=True, capture_output=True)
+    with open(os.path.join(path, "app", "__init__.py"), "w", encoding="utf-8") as f:
+        f.write("")
+    _write_modules(path, files, hunks, hunk_lines, line_bytes, 0, seed)
+    _git(path, "add", "-A")
+    _git(path, "commit", "-q", "-m", "Initial synthetic project")
+    _git(path, "update-ref", "refs/remotes/origin/master", "master")
+
+    _git(path, "checkout", "-q", "-b", "feature")
+    _write_modules(path, files, hunks, hunk_lines, line_bytes, 1, seed)
+    _git(path, "commit", "-q", "-am", "Change every module")
+    _write_modules(path, files, hunks, hunk_lines, line_bytes, 2, seed)
+    _git(path, "add", "-A")
+
+    def diff_bytes(*revisions):
+        return len(subprocess.check_output(["git", "-C", path, "diff", *revisions]))
+
+    return {"branch": diff_bytes("master..HEAD"), "staged": diff_bytes("--cached")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a synthetic git repository for benchmarks")
+    parser.add_argument("path")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--hunks", type=int, default=3, help="Hunks per changed file")
+    parser.add_argument("--hunk-lines", type=int, default=4, help="Changed lines per hunk")
+    parser.add_argument("--line-bytes", type=int, default=60, help="Approximate bytes per changed line")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sizes = create_repo(args.path, args.files, args.hunks, args.hunk_lines, args.line_bytes, args.seed)
+    print(f"Created {args.path}: master..HEAD diff {sizes['branch']} bytes, staged diff {sizes['staged']} bytes")
+
+
+if __name__ == "__main__":
+    main()
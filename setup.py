@@ -20,7 +20,7 @@ setup(
     include_package_data=True,
     install_requires=[
         "inquirer>=3.1.2",
-        "openai>=1.1.0",
+        "requests>=2.28.0",
         "python-dotenv>=0.21.1",
     ],
     classifiers=[